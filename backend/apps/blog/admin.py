@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Category, Post, Heading, PostAnalytics, CategoryAnalytics
+from .models import (Category, Post, Heading, PostAnalytics, CategoryAnalytics, PostAnalyticsRollup,
+                     CategoryAnalyticsRollup)
 from ..media.models import Media
 
 
@@ -18,7 +19,8 @@ class CategoryAdmin(admin.ModelAdmin):
 class CategoryAnalyticsAdmin(admin.ModelAdmin):
     list_display = ('category_name','views','impressions','clicks','click_through_rate','avg_time_on_page',)
     search_fields = ('category__name',)
-    readonly_fields = ('category','views','impressions','clicks','click_through_rate','avg_time_on_page',)
+    readonly_fields = ('category','views','impressions','clicks','click_through_rate','avg_time_on_page',
+                       'time_on_page_samples',)
 
     def category_name(self,obj):
         return obj.category.name
@@ -26,11 +28,16 @@ class CategoryAnalyticsAdmin(admin.ModelAdmin):
     category_name.short_description = 'Category Name'
 
 class HeadingInline(admin.TabularInline):
+    #Los headings se generan desde el contenido del post al guardarlo
     model = Heading
-    extra = 1
+    extra = 0
     fields = ('title','level','order','slug')
-    prepopulated_fields = {'slug':('title',)}
+    readonly_fields = ('title','level','order','slug')
     ordering = ('order',)
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 class MediaInline(admin.TabularInline):
     model = Media
@@ -60,10 +67,29 @@ class PostAdmin(admin.ModelAdmin):
 class PostAnalyticsAdmin(admin.ModelAdmin):
     list_display = ('post_title','views','impressions','clicks','click_through_rate','avg_time_on_page',)
     search_fields = ('post__title',)
-    readonly_fields = ('post','post_title','views','impressions','clicks','click_through_rate','avg_time_on_page',)
+    readonly_fields = ('post','post_title','views','impressions','clicks','click_through_rate','avg_time_on_page',
+                       'time_on_page_samples',)
     ordering = ('-views','-impressions','-clicks','-click_through_rate',)
 
     def post_title(self,obj):
         return obj.post.title
 
     post_title.short_description = 'Post Title'
+
+@admin.register(PostAnalyticsRollup)
+class PostAnalyticsRollupAdmin(admin.ModelAdmin):
+    list_display = ('post','period','bucket','views','impressions','clicks',)
+    search_fields = ('post__title',)
+    list_filter = ('period',)
+    list_select_related = ('post',)
+    readonly_fields = ('post','period','bucket','views','impressions','clicks',)
+    ordering = ('-bucket',)
+
+@admin.register(CategoryAnalyticsRollup)
+class CategoryAnalyticsRollupAdmin(admin.ModelAdmin):
+    list_display = ('category','period','bucket','views','impressions','clicks',)
+    search_fields = ('category__name',)
+    list_filter = ('period',)
+    list_select_related = ('category',)
+    readonly_fields = ('category','period','bucket','views','impressions','clicks',)
+    ordering = ('-bucket',)
@@ -0,0 +1,41 @@
+"""Clientes redis.asyncio de las vistas async (apps/blog/async_views.py). Cada cliente
+tiene su propio pool de conexiones y las conexiones pertenecen al event loop que las
+creo, por eso se comparte un cliente por loop (en produccion hay un loop por proceso)"""
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.redis_pools import pool_settings
+from core.timing import AsyncTimedRedis
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def _client(name, factory):
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    if name not in clients:
+        clients[name] = factory()
+    return clients[name]
+
+
+def _from_pool_settings(name, url=None):
+    pool_url, options = pool_settings(name)
+    return AsyncTimedRedis.from_url(url or pool_url, **options)
+
+
+def get_redis():
+    """El mismo redis (pool "counters") que usa el redis_client de las vistas sincronas"""
+    return _client("counters", lambda: _from_pool_settings("counters"))
+
+
+def get_cache_redis():
+    """Redis del cache de django, None si el cache no es django_redis (por ejemplo
+    LocMemCache en desarrollo), en ese caso se usa la API del cache"""
+    if not hasattr(getattr(cache, "client", None), "encode"):
+        return None
+    location = settings.CACHES["default"]["LOCATION"]
+    if isinstance(location, (list, tuple)):
+        location = location[0]
+    return _client("cache", lambda: _from_pool_settings("cache", location))
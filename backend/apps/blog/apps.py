@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.blog'
+
+    def ready(self):
+        #Registrar las señales que mantienen el indice de busqueda y el arbol de categorias
+        from . import search, category_tree  # noqa: F401
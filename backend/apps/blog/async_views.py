@@ -0,0 +1,120 @@
+"""Versiones async (ASGI) de las vistas de lectura. DRF no tiene vistas async, por eso
+son vistas de django con el mismo formato de respuesta que StandardAPIView.
+
+En un acierto de cache todo el request es async: la entrada se lee con redis.asyncio
+y las impresiones/vistas se registran con un pipeline async, sin pasar por el pool de
+hilos. En un fallo el detalle se consulta con el ORM async (aget) y los listados usan
+la paginacion sincrona de DRF en un hilo"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.renderers import JSONRenderer
+
+from core.db_routers import replica_reads, STICKY_COOKIE
+from core.timing import timed
+
+from . import aio
+from .caching import aget_or_compute, post_tags
+from .impressions import post_impressions, category_impressions
+from .models import Post
+from .rendering import acached_page_response
+from .serializers import PostSerializer
+from .tasks import increment_post_view_task
+from .utils import get_client_ip
+from .view_events import apublish_view
+from .views import PostListView, CategoryListView
+
+
+class AsyncAPIView(View):
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            #Todas son vistas de lectura (use_replica en las vistas sincronas)
+            with replica_reads(primary=STICKY_COOKIE in request.COOKIES):
+                return await super().dispatch(request, *args, **kwargs)
+        except APIException as e:
+            return self.detail(e.detail, e.status_code)
+        except Exception as e:
+            return self.detail(f"An Unexpected Error Ocurred: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @staticmethod
+    def response(data, status=status.HTTP_200_OK):
+        body = JSONRenderer().render({"success": True, "status": status, "results": data})
+        return HttpResponse(body, status=status, content_type="application/json")
+
+    @staticmethod
+    def detail(message, status):
+        #Mismo cuerpo que las excepciones de DRF (NotFound, APIException)
+        return HttpResponse(JSONRenderer().render({"detail": message}), status=status,
+                            content_type="application/json")
+
+
+class AsyncListView(AsyncAPIView):
+    sync_view = None
+    impressions = None
+
+    async def get(self, request):
+        cache_key, args = self.page_args(request.GET)
+        #get_page y la paginacion de DRF reciben el Request de DRF normalizado
+        response, ids = await acached_page_response(
+            request, cache_key, lambda page_request: self.sync_view().get_page(page_request, *args))
+        await self.impressions.arecord(aio.get_redis(), ids)
+        return response
+
+
+class AsyncPostListView(AsyncListView):
+    sync_view = PostListView
+    impressions = post_impressions
+
+    @staticmethod
+    def page_args(params):
+        search = params.get("search", "").strip()
+        sorting, ordering = params.get("sorting", None), params.get("ordering", None)
+        return f"post_list:{search}:{sorting}:{ordering}", (search, sorting, ordering)
+
+
+class AsyncCategoryListView(AsyncListView):
+    sync_view = CategoryListView
+    impressions = category_impressions
+
+    @staticmethod
+    def page_args(params):
+        search = params.get("search", "").strip()
+        return f"category_list:{search}", (search,)
+
+
+async def aget_post(slug):
+    post = await PostSerializer.setup_queryset(Post.postobjects.all()).aget(slug=slug)
+    #Firmar las URLs de las imagenes usa la cache sincrona
+    with timed("serialize"):
+        data = await sync_to_async(lambda: PostSerializer(post).data)()
+    return data, post_tags(post)
+
+
+class AsyncPostDetailView(AsyncAPIView):
+    async def get(self, request):
+        slug = request.GET.get("slug")
+        if not slug:
+            raise NotFound(detail="The request Post does not exist")
+        try:
+            serialized_post = await aget_or_compute(f"post_detail:{slug}", lambda: aget_post(slug))
+        except Post.DoesNotExist:
+            raise NotFound(detail="The request Post does not exist")
+        ip_address = get_client_ip(request)
+        if getattr(settings, "BLOG_VIEW_INGESTION", "stream") == "stream":
+            await apublish_view(aio.get_redis(), serialized_post["id"], ip_address)
+        else:
+            await sync_to_async(increment_post_view_task.delay)(serialized_post["slug"], ip_address)
+        return self.response(serialized_post)
+
+
+class AsyncPostHeadingView(AsyncAPIView):
+    async def get(self, request):
+        slug = request.GET.get("slug")
+        try:
+            serialized_post = await aget_or_compute(f"post_detail:{slug}", lambda: aget_post(slug))
+        except Post.DoesNotExist:
+            return self.response([])
+        return self.response(serialized_post["headings"])
@@ -0,0 +1,91 @@
+"""Benchmarks de rendimiento del blog, se ejecutan con: python manage.py benchmark <nombre>"""
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+import redis
+
+from django.core.management.base import CommandError
+from django.core.signals import request_started, request_finished
+from django.db import transaction, close_old_connections
+
+from ..models import Category, Post, PostAnalytics
+
+BENCHMARKS = [
+    "impression_sync",
+    "unique_views",
+    "view_ingestion",
+    "cache_stampede",
+    "json_cache",
+    "pagination",
+    "search",
+    "media_signing",
+    "queries",
+    "category_tree",
+    "toc",
+    "rankings",
+    "rollups",
+    "dwell_time",
+    "impressions",
+    "asgi",
+]
+
+
+def fake_redis():
+    """Redis local en memoria (fakeredis) para no depender de un servidor.
+    Con la variable BENCHMARK_REDIS_URL se usa un redis real (se vacia con FLUSHDB)"""
+    if os.environ.get("BENCHMARK_REDIS_URL"):
+        return redis.Redis.from_url(os.environ["BENCHMARK_REDIS_URL"])
+    try:
+        import fakeredis
+    except ImportError:
+        raise CommandError("Install fakeredis to run the benchmarks: pip install fakeredis")
+    return fakeredis.FakeStrictRedis()
+
+
+@contextmanager
+def rolled_back():
+    """Revierte todos los datos creados por el benchmark"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@contextmanager
+def keep_connection():
+    """Requests por el WSGIHandler sin cerrar la conexion (y la transaccion) del benchmark"""
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        yield
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+
+def make_posts(count, status="published"):
+    """Crea posts con sus analiticas usando bulk_create (sin señales)"""
+    category = Category.objects.create(name=f"bench-{uuid.uuid4().hex[:8]}",
+                                       slug=f"bench-{uuid.uuid4().hex[:8]}")
+    posts = [
+        Post(title=f"Benchmark post {i}", description="Benchmark", content="<p>Benchmark</p>",
+             keywords="benchmark", slug=f"benchmark-post-{i}-{uuid.uuid4().hex[:6]}",
+             category=category, status=status)
+        for i in range(count)
+    ]
+    Post.objects.bulk_create(posts, batch_size=1000)
+    PostAnalytics.objects.bulk_create([PostAnalytics(post=post) for post in posts], batch_size=1000)
+    return posts
+
+
+def report(command, label, count, seconds, unit="keys"):
+    rate = count / seconds if seconds else float("inf")
+    command.stdout.write(f"{label:<40} {count:>9} {unit} {seconds:>9.3f}s {rate:>12.0f} {unit}/s")
+
+
+@contextmanager
+def timed(results, label):
+    start = time.perf_counter()
+    yield
+    results[label] = time.perf_counter() - start
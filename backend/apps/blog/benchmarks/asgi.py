@@ -0,0 +1,145 @@
+"""Vistas sincronas por WSGI (un hilo por request concurrente, como gunicorn gthread)
+contra las vistas async por ASGI (un solo event loop) con muchos requests concurrentes.
+Los tamaños son los niveles de concurrencia.
+
+Todo pasa por un fakeredis compartido (cache django_redis, impresiones, stream de
+vistas) con LATENCY segundos de ida y vuelta simulados por comando o pipeline, como un
+redis en otra maquina. Las paginas y los posts ya estan en cache: se mide el camino
+caliente, que es el que no toca la base de datos"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest import mock
+
+import fakeredis
+import redis
+import redis.asyncio
+from fakeredis import aioredis
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import override_settings
+from django.urls import path
+
+from ..async_views import AsyncPostListView, AsyncPostDetailView
+from . import rolled_back, make_posts, report, keep_connection
+
+DEFAULT_SIZES = [16, 64, 256]
+REQUESTS = 2000
+LATENCY = 0.001
+
+#URLconf de las vistas async para el ASGIHandler (ROOT_URLCONF)
+urlpatterns = [
+    path("api/blog/posts/", AsyncPostListView.as_view()),
+    path("api/blog/post/", AsyncPostDetailView.as_view()),
+]
+
+
+class SlowConnection(fakeredis.FakeRedisConnection):
+    def send_packed_command(self, *args, **kwargs):
+        time.sleep(LATENCY)
+        super().send_packed_command(*args, **kwargs)
+
+
+class AsyncSlowConnection(aioredis.FakeAsyncRedisConnection):
+    async def send_packed_command(self, *args, **kwargs):
+        await asyncio.sleep(LATENCY)
+        await super().send_packed_command(*args, **kwargs)
+
+
+def wsgi_get(handler, path_info, query):
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path_info, "QUERY_STRING": query,
+        "SERVER_NAME": "localhost", "SERVER_PORT": "80", "REMOTE_ADDR": "127.0.0.1",
+        "wsgi.input": BytesIO(), "wsgi.url_scheme": "http",
+    }
+    statuses = []
+    b"".join(handler(environ, lambda status, headers: statuses.append(status)))
+    return int(statuses[0].split()[0])
+
+
+async def asgi_get(handler, path_info, query):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path_info, "raw_path": path_info.encode(), "query_string": query.encode(),
+        "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 50000), "server": ("localhost", 80),
+    }
+    received = asyncio.Event()
+    statuses = []
+
+    async def receive():
+        if received.is_set():
+            #El cliente nunca se desconecta
+            await asyncio.Future()
+        received.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await handler(scope, receive, send)
+    return statuses[0]
+
+
+async def run_asgi(handler, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path_info, query):
+        async with semaphore:
+            return await asgi_get(handler, path_info, query)
+
+    return await asyncio.gather(*(one(*request) for request in requests))
+
+
+def run(command, sizes):
+    server = fakeredis.FakeServer()
+    #Los pools de redis-py tienen 100 conexiones por defecto, con mas hilos falla con
+    #"Too many connections"
+    max_connections = max(sizes)
+    sync_redis = redis.StrictRedis(connection_pool=redis.ConnectionPool(
+        connection_class=SlowConnection, server=server, max_connections=max_connections))
+    caches = {"default": {
+        "BACKEND": "django_redis.cache.RedisCache", "LOCATION": "redis://localhost:6379/0",
+        "OPTIONS": {"CONNECTION_POOL_KWARGS": {"connection_class": SlowConnection, "server": server,
+                                               "max_connections": max_connections}},
+    }}
+    async_clients = {}
+
+    def async_redis():
+        #Un cliente por event loop, igual que aio.get_redis
+        loop = asyncio.get_running_loop()
+        if loop not in async_clients:
+            pool = redis.asyncio.ConnectionPool(connection_class=AsyncSlowConnection, server=server,
+                                                max_connections=max_connections)
+            async_clients[loop] = redis.asyncio.StrictRedis(connection_pool=pool)
+        return async_clients[loop]
+
+    command.stdout.write(f"Simulated redis round trip: {LATENCY * 1000:.1f}ms, {REQUESTS} requests per run")
+    with rolled_back(), keep_connection(), override_settings(CACHES=caches), \
+            mock.patch("apps.blog.views.redis_client", sync_redis), \
+            mock.patch("apps.blog.aio.get_redis", async_redis), \
+            mock.patch("apps.blog.aio.get_cache_redis", async_redis):
+        posts = make_posts(100)
+        requests = [("/api/blog/posts/", "page_size=20") if i % 2 else
+                    ("/api/blog/post/", f"slug={posts[i % len(posts)].slug}") for i in range(REQUESTS)]
+        wsgi = WSGIHandler()
+        #Llenar la cache en este hilo (la transaccion del benchmark solo se ve en esta conexion)
+        for request in set(requests):
+            wsgi_get(wsgi, *request)
+
+        for concurrency in sizes:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as executor:
+                statuses = list(executor.map(lambda request: wsgi_get(wsgi, *request), requests))
+            report(command, f"WSGI sync, {concurrency} threads", REQUESTS, time.perf_counter() - start,
+                   "requests")
+            assert set(statuses) == {200}, statuses
+
+            with override_settings(ROOT_URLCONF=__name__):
+                asgi = ASGIHandler()
+                start = time.perf_counter()
+                statuses = asyncio.run(run_asgi(asgi, requests, concurrency))
+                report(command, f"ASGI async, {concurrency} concurrent", REQUESTS, time.perf_counter() - start,
+                       "requests")
+            assert set(statuses) == {200}, statuses
@@ -0,0 +1,73 @@
+"""Latencia cuando vence una entrada de cache muy usada: cada request recalcula
+(cache.get + cache.set) contra get_or_compute (un solo recalculo con lock de
+redis y el valor anterior mientras tanto). La base de datos se simula con un
+limite de consultas simultaneas, como el pool de conexiones de Postgres"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+
+from .. import caching
+from . import fake_redis
+
+DEFAULT_SIZES = [50, 200]
+ROUNDS = 5
+#Costo de la consulta + serializacion del listado
+QUERY_SECONDS = 0.05
+DB_CONNECTIONS = 4
+
+
+def run(command, sizes):
+    database = threading.Semaphore(DB_CONNECTIONS)
+    computes = []
+
+    def compute():
+        computes.append(1)
+        with database:
+            time.sleep(QUERY_SECONDS)
+        return ["post"] * 20, ["post_list"]
+
+    def naive(cache):
+        value = cache.get("post_list:::")
+        if value is None:
+            value, _ = compute()
+            cache.set("post_list:::", value)
+        return value
+
+    def protected(cache):
+        return caching.get_or_compute("post_list:::", compute)
+
+    redis_client = fake_redis()
+    for concurrency in sizes:
+        for label, get, expire in (("naive, key expired", naive, "delete"),
+                                   ("single-flight, key expired", protected, "delete"),
+                                   ("single-flight, stale (soft TTL)", protected, "stale")):
+            cache = LocMemCache("benchmark", {})
+            latencies = []
+            computes.clear()
+            with mock.patch.object(caching, "cache", cache), \
+                    mock.patch.object(caching, "get_redis_connection", return_value=redis_client):
+                caching.set_cached("post_list:::", ["post"] * 20, ["post_list"])
+                for _ in range(ROUNDS):
+                    if expire == "delete":
+                        cache.delete("post_list:::")
+                    else:
+                        entry = cache.get("post_list:::")
+                        entry["fresh_until"] = 0
+                        cache.set("post_list:::", entry)
+
+                    def request(_):
+                        start = time.perf_counter()
+                        get(cache)
+                        latencies.append(time.perf_counter() - start)
+
+                    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                        list(executor.map(request, range(concurrency)))
+
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            command.stdout.write(f"{label:<34} concurrency={concurrency:<5} p50={p50:>8.1f}ms "
+                                 f"p99={p99:>8.1f}ms recomputes={len(computes)}")
@@ -0,0 +1,101 @@
+"""Arbol de categorias (3 raices, 3 hijos por categoria, 8 niveles = 9840 categorias):
+recorrer la lista de adyacencia con una consulta por nivel (implementacion anterior)
+contra el rango de path materializado y el arbol en memoria"""
+import random
+import time
+import uuid
+
+from django.db import connection
+
+from ..category_tree import rebuild_paths, get_tree
+from ..models import Category, Post
+from . import rolled_back
+
+DEFAULT_SIZES = [20000]
+ROOTS = 3
+CHILDREN = 3
+LEVELS = 8
+
+
+def make_tree():
+    levels = [[Category(name=f"bench-{i}", slug=f"bench-{uuid.uuid4().hex[:12]}") for i in range(ROOTS)]]
+    for _ in range(LEVELS - 1):
+        levels.append([Category(name=f"{parent.name}-{i}", slug=f"bench-{uuid.uuid4().hex[:12]}", parent=parent)
+                       for parent in levels[-1] for i in range(CHILDREN)])
+    for level in levels:
+        Category.objects.bulk_create(level, batch_size=1000)
+    rebuild_paths()
+    return levels
+
+
+def legacy_descendant_ids(category):
+    ids = [category.id]
+    level = [category.id]
+    while level:
+        level = list(Category.objects.filter(parent_id__in=level).values_list("id", flat=True))
+        ids.extend(level)
+    return ids
+
+
+def legacy_breadcrumb(category):
+    breadcrumb = [category]
+    while breadcrumb[-1].parent_id:
+        breadcrumb.append(Category.objects.get(pk=breadcrumb[-1].parent_id))
+    return breadcrumb[::-1]
+
+
+def legacy_tree():
+    nodes = {}
+    roots = []
+    level = list(Category.objects.filter(parent__isnull=True).values("id", "name", "slug", "parent_id"))
+    while level:
+        for row in level:
+            node = {"id": str(row["id"]), "name": row["name"], "slug": row["slug"], "children": []}
+            nodes[row["id"]] = node
+            (nodes[row["parent_id"]]["children"] if row["parent_id"] else roots).append(node)
+        level = list(Category.objects.filter(parent_id__in=[row["id"] for row in level])
+                     .values("id", "name", "slug", "parent_id"))
+    return roots
+
+
+def run(command, sizes):
+    command.stdout.write(f"Database: {connection.vendor}")
+    rng = random.Random(0)
+    for size in sizes:
+        with rolled_back():
+            start = time.perf_counter()
+            levels = make_tree()
+            categories = [category for level in levels for category in level]
+            command.stdout.write(f"{'create + rebuild_paths':<40} categories={len(categories):<6} "
+                                 f"{(time.perf_counter() - start) * 1000:>9.1f}ms")
+            Post.objects.bulk_create([
+                Post(title=f"Benchmark post {i}", description="Benchmark", keywords="benchmark",
+                     slug=f"benchmark-post-{i}", category=rng.choice(categories), status="published")
+                for i in range(size)
+            ], batch_size=1000)
+            root = Category.objects.get(pk=levels[0][0].pk)
+            leaf = Category.objects.get(pk=levels[-1][0].pk)
+
+            def measure(label, fn, repeat=5):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    result = fn()
+                elapsed = (time.perf_counter() - start) * 1000 / repeat
+                command.stdout.write(f"{label:<40} posts={size:<6} {elapsed:>9.1f}ms")
+                return result
+
+            legacy = measure("legacy: posts under root (per level)", lambda: (
+                Post.postobjects.filter(category_id__in=legacy_descendant_ids(root)).count()))
+            current = measure("path range: posts under root", lambda: (
+                Post.postobjects.filter(Category.subtree_filter(root.path, "category__")).count()))
+            assert legacy == current
+
+            measure("legacy: breadcrumb of a leaf", lambda: legacy_breadcrumb(leaf))
+            measure("legacy: full tree (per level)", legacy_tree)
+            start = time.perf_counter()
+            get_tree()
+            command.stdout.write(f"{'snapshot: load':<40} posts={size:<6} {(time.perf_counter() - start) * 1000:>9.1f}ms")
+            measure("snapshot: breadcrumb of a leaf", lambda: get_tree().ancestors(leaf.id), repeat=100)
+            measure("snapshot: full tree", lambda: get_tree().as_data())
+        #El arbol del proceso tiene las categorias revertidas
+        rebuild_paths()
@@ -0,0 +1,70 @@
+"""Prueba de carga del beacon de tiempo en pagina contra un redis local (fakeredis o
+BENCHMARK_REDIS_URL): un pipeline por beacon contra juntarlos en memoria
+(BLOG_DWELL_BUFFER_SECONDS), solo la escritura en redis y pasando por el WSGIHandler
+con todos los middlewares. Reporta cuantos procesos hacen falta para TARGET_RATE
+beacons/s y luego mide fold_dwell_times"""
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest import mock
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import override_settings
+
+from ..dwell_time import post_dwell
+from . import fake_redis, rolled_back, make_posts, report, keep_connection
+
+DEFAULT_SIZES = [100_000]
+TARGET_RATE = 10_000
+POSTS = 10_000
+THREADS = 4
+
+
+def send(handler, bodies):
+    for body in bodies:
+        environ = {
+            "REQUEST_METHOD": "POST", "PATH_INFO": "/api/blog/post/dwell/", "QUERY_STRING": "",
+            "CONTENT_TYPE": "text/plain;charset=UTF-8", "CONTENT_LENGTH": str(len(body)),
+            "SERVER_NAME": "localhost", "SERVER_PORT": "80", "REMOTE_ADDR": "127.0.0.1",
+            "wsgi.input": BytesIO(body), "wsgi.url_scheme": "http",
+        }
+        handler(environ, lambda status, headers: None)
+
+
+def run(command, sizes):
+    redis_client = fake_redis()
+    handler = WSGIHandler()
+    for size in sizes:
+        redis_client.flushdb()
+        with rolled_back(), keep_connection(), mock.patch("apps.blog.views.redis_client", redis_client):
+            posts = make_posts(POSTS)
+            bodies = [f'{{"id":"{random.choice(posts).pk}","seconds":{random.uniform(1, 600):.1f}}}'.encode()
+                      for _ in range(size)]
+
+            ids = [str(random.choice(posts).pk) for _ in range(size)]
+            for label, window in (("pipeline per beacon", 0), ("buffered 1s in memory", 1.0)):
+                with override_settings(BLOG_DWELL_BUFFER_SECONDS=window):
+                    #Solo la escritura en redis, sin HTTP
+                    start = time.perf_counter()
+                    for object_id in ids:
+                        post_dwell.record(redis_client, object_id, 30.0)
+                    post_dwell.push(redis_client)
+                    report(command, f"record only, {label}", size, time.perf_counter() - start, "beacons")
+
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(THREADS) as executor:
+                        list(executor.map(lambda chunk: send(handler, chunk),
+                                          [bodies[i::THREADS] for i in range(THREADS)]))
+                    post_dwell.push(redis_client)
+                    seconds = time.perf_counter() - start
+                    report(command, f"WSGI, {label}, {THREADS} threads", size, seconds, "beacons")
+                rate = size / seconds
+                command.stdout.write(f"Target {TARGET_RATE} beacons/s: {math.ceil(TARGET_RATE / rate)} "
+                                     f"process(es) at {rate:.0f} beacons/s each")
+
+            pending = redis_client.hlen(post_dwell.count_key)
+            start = time.perf_counter()
+            folded = post_dwell.flush(redis_client)
+            report(command, f"fold ({pending} posts pending)", folded, time.perf_counter() - start, "rows")
@@ -0,0 +1,48 @@
+"""Sincronizacion de impresiones redis -> base de datos: KEYS + una fila por clave
+contra SCAN + GETDEL en pipeline + UPDATE por lotes"""
+from django.db import connection
+
+from ..counters import scan_and_drain, apply_counter_deltas
+from ..models import PostAnalytics, Post
+from . import fake_redis, rolled_back, make_posts, report, timed
+
+DEFAULT_SIZES = [1000, 10000, 50000]
+
+
+def legacy_sync(redis_client):
+    #Implementacion anterior de sync_impressions_to_db, se conserva como referencia
+    for key in redis_client.keys("post:impressions:*"):
+        post_id = key.decode("utf-8").split(":")[-1]
+        post = Post.objects.get(id=post_id)
+        impressions = int(redis_client.get(key))
+        analytics, created = PostAnalytics.objects.get_or_create(post=post)
+        analytics.impressions += impressions
+        analytics.save()
+        analytics.click_through_rate = (analytics.clicks / analytics.impressions) * 100
+        analytics.save()
+        redis_client.delete(key)
+
+
+def batched_sync(redis_client):
+    for deltas in scan_and_drain(redis_client, "post:impressions:*"):
+        apply_counter_deltas(PostAnalytics, "post", deltas, "impressions")
+
+
+def run(command, sizes):
+    command.stdout.write(f"Database: {connection.vendor}")
+    for size in sizes:
+        with rolled_back():
+            posts = make_posts(size)
+            for label, sync in (("legacy (KEYS + per-key rows)", legacy_sync),
+                                ("batched (SCAN + GETDEL + bulk)", batched_sync)):
+                redis_client = fake_redis()
+                redis_client.flushdb()
+                pipe = redis_client.pipeline(transaction=False)
+                for post in posts:
+                    pipe.incrby(f"post:impressions:{post.id}", 3)
+                pipe.execute()
+
+                results = {}
+                with timed(results, label):
+                    sync(redis_client)
+                report(command, label, size, results[label])
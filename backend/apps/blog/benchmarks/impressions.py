@@ -0,0 +1,53 @@
+"""Requests/s del listado de posts (pagina en cache) segun como se cuentan las
+impresiones: un INCR por post de la pagina contra un solo pipeline de HINCRBY.
+Con fakeredis no hay red, cada viaje a redis real (BENCHMARK_REDIS_URL) cuesta
+ademas la latencia de la conexion"""
+import time
+from io import BytesIO
+from unittest import mock
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import override_settings
+
+from ..impressions import post_impressions
+from . import fake_redis, rolled_back, make_posts, report, keep_connection
+
+DEFAULT_SIZES = [20, 100, 1000]
+REQUESTS = 300
+
+
+def incr_per_post(redis_client, post_ids):
+    #Implementacion anterior de PostListView, se conserva como referencia
+    for post_id in post_ids:
+        redis_client.incr(f"post:impressions:{post_id}")
+
+
+def get(handler, page_size):
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": "/api/blog/posts/", "QUERY_STRING": f"page_size={page_size}",
+        "SERVER_NAME": "localhost", "SERVER_PORT": "80", "REMOTE_ADDR": "127.0.0.1",
+        "wsgi.input": BytesIO(), "wsgi.url_scheme": "http",
+    }
+    statuses = []
+    b"".join(handler(environ, lambda status, headers: statuses.append(status)))
+    if not statuses[0].startswith("200"):
+        raise RuntimeError(f"Unexpected response {statuses[0]}")
+
+
+def run(command, sizes):
+    redis_client = fake_redis()
+    handler = WSGIHandler()
+    with rolled_back(), keep_connection(), mock.patch("apps.blog.views.redis_client", redis_client), \
+            override_settings(MAX_PAGE_SIZE=max(sizes)):
+        make_posts(max(sizes))
+        for size in sizes:
+            for label, record in (("INCR per post", incr_per_post),
+                                  ("pipelined HINCRBY", post_impressions.record)):
+                redis_client.flushdb()
+                with mock.patch("apps.blog.views.post_impressions.record", record):
+                    #La primera request llena la cache de la pagina
+                    get(handler, size)
+                    start = time.perf_counter()
+                    for _ in range(REQUESTS):
+                        get(handler, size)
+                    report(command, f"{size} items, {label}", REQUESTS, time.perf_counter() - start, "requests")
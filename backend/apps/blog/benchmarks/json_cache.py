@@ -0,0 +1,47 @@
+"""Acierto de cache de post_list: datos de la pagina (OrderedDict/ReturnList pickled)
+que se renderizan en cada request, contra la pagina ya renderizada como JSON
+(sin comprimir y con zlib). Reporta bytes guardados y CPU por request"""
+import time
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import RequestFactory, override_settings
+
+from .. import caching
+from ..views import PostListView
+from . import fake_redis, rolled_back, make_posts
+
+DEFAULT_SIZES = [100, 1000]
+REQUESTS = 200
+
+
+def run(command, sizes):
+    factory = RequestFactory()
+    redis_client = fake_redis()
+    for size in sizes:
+        with rolled_back():
+            make_posts(size)
+            for label, overrides in (("pickled page (render per hit)", {"BLOG_CACHE_RENDERED_JSON": False}),
+                                     ("rendered JSON", {"BLOG_CACHE_COMPRESSION": "none"}),
+                                     ("rendered JSON + zlib", {"BLOG_CACHE_COMPRESSION": "zlib"})):
+                cache = LocMemCache(f"benchmark-{label}-{size}", {})
+                with override_settings(**overrides), \
+                        mock.patch.object(caching, "cache", cache), \
+                        mock.patch.object(caching, "get_redis_connection", return_value=redis_client), \
+                        mock.patch("apps.blog.views.redis_client", redis_client):
+                    view = PostListView.as_view()
+                    #Primer request: llena el cache
+                    response = view(factory.get("/api/blog/posts/", {"p": 1, "page_size": 20}))
+                    if hasattr(response, "render"):
+                        response.render()
+
+                    #LocMemCache guarda los valores pickled igual que django_redis
+                    page_bytes = sum(len(value) for value in cache._cache.values())
+                    start = time.process_time()
+                    for _ in range(REQUESTS):
+                        response = view(factory.get("/api/blog/posts/", {"p": 1, "page_size": 20}))
+                        if hasattr(response, "render"):
+                            response.render()
+                    cpu = (time.process_time() - start) / REQUESTS * 1000
+                command.stdout.write(f"{label:<34} posts={size:<6} page bytes={page_bytes:>7} "
+                                     f"cpu/request={cpu:>7.3f}ms")
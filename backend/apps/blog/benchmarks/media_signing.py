@@ -0,0 +1,74 @@
+"""URLs firmadas de CloudFront por segundo: implementacion anterior (leer el PEM y una
+firma RSA por cada media) contra el servicio de apps/media/signing.py sin memoria
+(solo la llave cacheada), con la cache compartida (otro proceso) y con el LRU.
+Usa una llave RSA generada localmente"""
+import datetime
+import time
+import uuid
+from unittest import mock
+
+from botocore.signers import CloudFrontSigner
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import override_settings
+from django.utils import timezone
+
+from apps.media.signing import CloudFrontURLSigner
+from utils.s3_utils import load_private_key
+from . import report
+
+DEFAULT_SIZES = [100, 1000]
+#La implementacion anterior es muy lenta, se mide con menos URLs
+LEGACY_LIMIT = 100
+
+
+def legacy_url(pem, key):
+    """MediaSerializer.get_url antes de apps/media/signing.py"""
+    def rsa_signer(message):
+        private_key = serialization.load_pem_private_key(pem, password=None, backend=default_backend())
+        return private_key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+    signer = CloudFrontSigner("KBENCH", rsa_signer)
+    expire_date = timezone.now() + datetime.timedelta(seconds=60)
+    return signer.generate_presigned_url(f"https://cdn.example.com/{key}", date_less_than=expire_date)
+
+
+def run(command, sizes):
+    pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    with override_settings(AWS_CLOUDFRONT_KEY=pem, AWS_CLOUDFRONT_KEY_ID="KBENCH",
+                           AWS_CLOUDFRONT_DOMAIN="cdn.example.com"):
+        load_private_key.cache_clear()
+        for size in sizes:
+            run_size(command, pem, size)
+
+
+def run_size(command, pem, size):
+    keys = [f"media/benchmark-{i}.png" for i in range(size)]
+    signer = CloudFrontURLSigner()
+    #Cache local que simula redis (LocMemCache por defecto guarda solo 300 entradas)
+    shared = LocMemCache(f"media-signing-{uuid.uuid4()}", {"OPTIONS": {"MAX_ENTRIES": size * 2}})
+
+    legacy_keys = keys[:LEGACY_LIMIT]
+    start = time.perf_counter()
+    for key in legacy_keys:
+        legacy_url(pem, key)
+    report(command, "legacy (parse key + sign per URL)", len(legacy_keys), time.perf_counter() - start, "urls")
+
+    with mock.patch("apps.media.signing.cache", shared):
+        start = time.perf_counter()
+        for key in keys:
+            signer.sign(key)
+        report(command, "cached key, one by one (cold)", size, time.perf_counter() - start, "urls")
+
+        #Otro proceso: LRU vacio, las URLs estan en la cache compartida
+        signer.clear()
+        start = time.perf_counter()
+        signer.sign_many(keys)
+        report(command, "batch from shared cache", size, time.perf_counter() - start, "urls")
+
+        start = time.perf_counter()
+        signer.sign_many(keys)
+        report(command, "batch from LRU", size, time.perf_counter() - start, "urls")
@@ -0,0 +1,57 @@
+"""Latencia de la primera pagina y de una pagina profunda de post_list sin cache:
+serializar todo y paginar en Python (implementacion anterior) contra paginar en la
+base de datos por numero de pagina (LIMIT/OFFSET) y por cursor (keyset)"""
+import time
+from base64 import b64encode
+from urllib.parse import urlencode
+
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.request import Request
+from rest_framework_api.views import StandardAPIView
+
+from ..models import Post
+from ..pagination import paginate_queryset
+from ..serializers import PostListSerializer
+from . import rolled_back, make_posts
+
+DEFAULT_SIZES = [10000, 100000]
+PAGE_SIZE = 20
+#La implementacion anterior serializa todo, con muchos posts se mide una sola vez
+LEGACY_LIMIT = 20000
+
+
+def run(command, sizes):
+    factory = RequestFactory()
+    command.stdout.write(f"Database: {connection.vendor}")
+    for size in sizes:
+        with rolled_back():
+            make_posts(size)
+            posts = Post.postobjects.all()
+            order = ("-created_at", "-id")
+
+            def request(params):
+                return Request(factory.get("/api/blog/posts/", params))
+
+            def measure(label, fn):
+                start = time.perf_counter()
+                fn()
+                command.stdout.write(f"{label:<44} posts={size:<7} {(time.perf_counter() - start) * 1000:>10.1f}ms")
+
+            if size <= LEGACY_LIMIT:
+                measure("legacy: serialize all + paginate, page 1", lambda: StandardAPIView().paginate(
+                    request({"page_size": PAGE_SIZE}), PostListSerializer(posts, many=True).data))
+
+            measure("database: p=1", lambda: paginate_queryset(
+                request({"p": 1, "page_size": PAGE_SIZE}), posts, PostListSerializer, order))
+            last_page = size // PAGE_SIZE
+            measure(f"database: p={last_page} (OFFSET)", lambda: paginate_queryset(
+                request({"p": last_page, "page_size": PAGE_SIZE}), posts, PostListSerializer, order))
+
+            measure("cursor: first page", lambda: paginate_queryset(
+                request({"page_size": PAGE_SIZE}), posts, PostListSerializer, order))
+            #Cursor cerca del final, posicionado en el created_at de un post antiguo
+            oldest = posts.order_by("created_at", "id")[PAGE_SIZE]
+            cursor = b64encode(urlencode({"p": str(oldest.created_at)}).encode("ascii")).decode("ascii")
+            measure("cursor: deep page", lambda: paginate_queryset(
+                request({"page_size": PAGE_SIZE, "cursor": cursor}), posts, PostListSerializer, order))
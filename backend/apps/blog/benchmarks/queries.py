@@ -0,0 +1,79 @@
+"""Consultas SQL y tiempo de cada endpoint de apps/blog/urls.py con la cache vacia,
+para detectar consultas N+1 (la cantidad no deberia crecer con los posts)"""
+import time
+import uuid
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.media.models import Media
+from .. import caching
+from ..models import Post, Heading
+from ..urls import urlpatterns
+from . import fake_redis, rolled_back, make_posts
+
+DEFAULT_SIZES = [20, 100]
+HEADINGS_PER_POST = 5
+
+#Metodo y parametros de cada ruta, se calculan con el primer post creado
+REQUESTS = {
+    "posts/": ("get", lambda post, size: {"page_size": size}),
+    "post/": ("get", lambda post, size: {"slug": post.slug}),
+    "post/headings/": ("get", lambda post, size: {"slug": post.slug}),
+    "post/increment_click/": ("post", lambda post, size: {"slug": post.slug}),
+    "categories/": ("get", lambda post, size: {"page_size": size}),
+    "categories/tree/": ("get", lambda post, size: {}),
+    "category/posts/": ("get", lambda post, size: {"slug": post.category.slug, "page_size": size}),
+    "category/increment_click/": ("post", lambda post, size: {"slug": post.category.slug}),
+    #Escriben datos, se miden al final
+    "generate_analytics/": ("get", lambda post, size: {}),
+    "generate_posts/": ("get", lambda post, size: {}),
+}
+
+
+def make_media(posts):
+    media = [Media(name=f"bench-{i}", size="1", type="image/png", key=f"media/bench-{uuid.uuid4().hex}.png",
+                   media_type="image") for i in range(len(posts) + 1)]
+    Media.objects.bulk_create(media)
+    for post, thumbnail in zip(posts, media):
+        post.thumbnail = thumbnail
+    Post.objects.bulk_update(posts, ["thumbnail"], batch_size=1000)
+    category = posts[0].category
+    category.thumbnail = media[-1]
+    category.save()
+    Heading.objects.bulk_create([Heading(post=post, title=f"Heading {order}", slug=f"heading-{order}",
+                                         level=2, order=order)
+                                 for post in posts for order in range(HEADINGS_PER_POST)])
+
+
+def run(command, sizes):
+    redis_client = fake_redis()
+    client = APIClient()
+    command.stdout.write(f"Database: {connection.vendor}")
+    for size in sizes:
+        with rolled_back(), \
+                mock.patch.object(caching, "get_redis_connection", return_value=redis_client), \
+                mock.patch("apps.blog.views.redis_client", redis_client), \
+                mock.patch("apps.media.signing.access_mode", return_value="public"):
+            posts = make_posts(size)
+            make_media(posts)
+            for pattern in sorted(urlpatterns, key=lambda pattern: str(pattern.pattern).startswith("generate")):
+                route = str(pattern.pattern)
+                if route not in REQUESTS:
+                    command.stdout.write(f"{route:<28} posts={size:<5} not measured")
+                    continue
+                method, params = REQUESTS[route]
+                #Cache vacia en cada request
+                with mock.patch.object(caching, "cache", LocMemCache(f"queries-{uuid.uuid4()}", {})), \
+                        CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    if method == "get":
+                        response = client.get(f"/api/blog/{route}", params(posts[0], size))
+                    else:
+                        response = client.post(f"/api/blog/{route}", params(posts[0], size), format="json")
+                    elapsed = (time.perf_counter() - start) * 1000
+                command.stdout.write(f"{route:<28} posts={size:<5} status={response.status_code} "
+                                     f"queries={len(queries):<5} {elapsed:>9.1f}ms")
@@ -0,0 +1,65 @@
+"""Paginas de sorting=most_viewed: ordenar todos los posts publicados por
+PostAnalytics.views en la base de datos contra ZREVRANGE del ranking de redis y una
+consulta por id. Tambien mide la alimentacion (ZINCRBY) y la reconciliacion"""
+import random
+import time
+
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from .. import rankings
+from ..models import Post
+from ..pagination import paginate_queryset, paginate_ranking
+from ..serializers import PostListSerializer
+from . import fake_redis, rolled_back, make_posts, report
+
+DEFAULT_SIZES = [1_000_000]
+PAGE_SIZE = 20
+#Con fakeredis cada comando cuesta mas que en un redis real (BENCHMARK_REDIS_URL)
+EVENTS = 20_000
+#Eventos por pipeline, como un lote del stream de vistas
+EVENT_BATCH = 1000
+
+
+def run(command, sizes):
+    factory = RequestFactory()
+    command.stdout.write(f"Database: {connection.vendor}")
+    for size in sizes:
+        redis_client = fake_redis()
+        redis_client.flushdb()
+        with rolled_back():
+            start = time.perf_counter()
+            posts = make_posts(size)
+            command.stdout.write(f"Created {size} posts in {time.perf_counter() - start:.1f}s")
+
+            start = time.perf_counter()
+            reconciled = rankings.reconcile(redis_client)
+            report(command, "reconcile (rebuild sorted sets)", reconciled, time.perf_counter() - start, "posts")
+
+            ids = [str(post.pk) for post in random.choices(posts, k=EVENTS)]
+            start = time.perf_counter()
+            for offset in range(0, EVENTS, EVENT_BATCH):
+                batch = {}
+                for post_id in ids[offset:offset + EVENT_BATCH]:
+                    batch[post_id] = batch.get(post_id, 0) + 1
+                rankings.record(redis_client, views=batch)
+            report(command, "record views (ZINCRBY pipelined)", EVENTS, time.perf_counter() - start, "events")
+
+            published = Post.postobjects.annotate(popularity=Coalesce(F("post_analytics__views"), 0))
+            last_page = size // PAGE_SIZE
+            for page in (1, last_page):
+                params = {"p": page, "page_size": PAGE_SIZE}
+                start = time.perf_counter()
+                paginate_queryset(Request(factory.get("/api/blog/posts/", params)), published,
+                                  PostListSerializer, ("-popularity", "-id"))
+                database = time.perf_counter() - start
+
+                start = time.perf_counter()
+                ranking = rankings.RankedPosts(redis_client, rankings.VIEWS_KEY, Post.postobjects.all())
+                paginate_ranking(Request(factory.get("/api/blog/posts/", params)), ranking, PostListSerializer)
+                redis_page = time.perf_counter() - start
+                command.stdout.write(f"most_viewed p={page:<7} posts={size:<8} database={database * 1000:>9.1f}ms "
+                                     f"redis={redis_page * 1000:>7.1f}ms")
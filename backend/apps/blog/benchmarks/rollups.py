@@ -0,0 +1,78 @@
+"""Reporte de 30 dias: agregar las filas crudas PostView por dia contra leer los
+rollups diarios. sizes = cantidad de vistas crudas repartidas en POSTS posts y 30 dias"""
+import random
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay
+from django.utils.timezone import now
+
+from ..models import PostView, PostAnalyticsRollup
+from ..rollups import truncate, series
+from . import rolled_back, make_posts
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+POSTS = 1000
+DAYS = 30
+BATCH_SIZE = 5000
+
+
+def make_views(posts, count, today):
+    """Crea `count` vistas crudas y los rollups diarios que habrian generado las tareas"""
+    #timestamp es auto_now_add, se desactiva para repartir las vistas en los 30 dias
+    with mock.patch.object(PostView._meta.get_field("timestamp"), "auto_now_add", False):
+        daily = _create_views(posts, count, today)
+    PostAnalyticsRollup.objects.bulk_create(
+        [PostAnalyticsRollup(id=uuid.uuid4(), post_id=post_id, period="day", bucket=day, views=views)
+         for (post_id, day), views in daily.items()], batch_size=BATCH_SIZE)
+
+
+def _create_views(posts, count, today):
+    daily = {}
+    batch = []
+    for i in range(count):
+        post = posts[i % len(posts)] if i % 4 else posts[0]
+        day = today - timedelta(days=random.randrange(DAYS))
+        batch.append(PostView(post=post, ip_address=f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+                              timestamp=day + timedelta(minutes=random.randrange(60 * 24))))
+        daily[(post.pk, day)] = daily.get((post.pk, day), 0) + 1
+        if len(batch) >= BATCH_SIZE:
+            PostView.objects.bulk_create(batch)
+            batch = []
+    PostView.objects.bulk_create(batch)
+    return daily
+
+
+def run(command, sizes):
+    command.stdout.write(f"Database: {connection.vendor}")
+    today = truncate(now(), "day")
+    since = today - timedelta(days=DAYS - 1)
+    for size in sizes:
+        with rolled_back():
+            posts = make_posts(POSTS)
+            start = time.perf_counter()
+            make_views(posts, size, today)
+            command.stdout.write(f"Created {size} raw views in {time.perf_counter() - start:.1f}s")
+            #posts[0] recibe una cuarta parte de las vistas
+            post = posts[0]
+
+            def measure(label, fn):
+                start = time.perf_counter()
+                rows = fn()
+                command.stdout.write(f"{label:<44} views={size:<8} rows={len(rows):<5} "
+                                     f"{(time.perf_counter() - start) * 1000:>9.1f}ms")
+
+            measure("one post, raw PostView by day", lambda: list(
+                PostView.objects.filter(post=post, timestamp__gte=since)
+                .annotate(day=TruncDay("timestamp")).values("day").annotate(views=Count("id")).order_by("day")))
+            measure("one post, daily rollups", lambda: series(PostAnalyticsRollup, "post", post.pk, "day", DAYS))
+            measure("top 10 posts, raw PostView", lambda: list(
+                PostView.objects.filter(timestamp__gte=since).values("post")
+                .annotate(views=Count("id")).order_by("-views")[:10]))
+            measure("top 10 posts, daily rollups", lambda: list(
+                PostAnalyticsRollup.objects.filter(period="day", bucket__gte=since).values("post")
+                .annotate(views=Sum("views")).order_by("-views")[:10]))
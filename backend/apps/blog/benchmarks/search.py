@@ -0,0 +1,53 @@
+"""Latencia de la busqueda de post_list sin cache: cuatro icontains (implementacion
+anterior) contra el indice de texto completo (search_vector + GIN en PostgreSQL,
+indice invertido en memoria en otras bases de datos)"""
+import random
+import time
+
+from django.db import connection
+from django.db.models import Q
+
+from ..models import Post
+from ..search import post_index
+from . import rolled_back, make_posts
+
+DEFAULT_SIZES = [10000, 100000]
+QUERIES = ["django", "redis cache", "postgres index tuning", "missingword"]
+WORDS = ["django", "redis", "cache", "postgres", "index", "tuning", "python", "celery",
+         "react", "docker", "search", "vector", "query", "latency", "backend", "frontend"]
+REPEAT = 5
+
+
+def run(command, sizes):
+    command.stdout.write(f"Database: {connection.vendor}")
+    rng = random.Random(0)
+    for size in sizes:
+        with rolled_back():
+            posts = make_posts(size)
+            for post in posts:
+                post.title = " ".join(rng.sample(WORDS, 3))
+                post.content = "<p>" + " ".join(rng.choice(WORDS) for _ in range(80)) + "</p>"
+            Post.objects.bulk_update(posts, ["title", "content"], batch_size=1000)
+
+            start = time.perf_counter()
+            post_index.rebuild()
+            command.stdout.write(f"{'build index':<44} posts={size:<7} {(time.perf_counter() - start) * 1000:>10.1f}ms")
+
+            for query in QUERIES:
+                legacy = Post.postobjects.filter(
+                    Q(title__icontains=query) | Q(description__icontains=query) |
+                    Q(content__icontains=query) | Q(keywords__icontains=query))
+                indexed = post_index.search(Post.postobjects.all(), query)
+                for label, queryset, order in (("icontains", legacy, ("-created_at", "-id")),
+                                               ("full-text", indexed, ("-rank", "-id"))):
+                    start = time.perf_counter()
+                    for _ in range(REPEAT):
+                        #Lo que hace la vista: exists, primera pagina y count
+                        queryset.exists()
+                        list(queryset.order_by(*order)[:6])
+                        count = queryset.count()
+                    elapsed = (time.perf_counter() - start) * 1000 / REPEAT
+                    command.stdout.write(f"{label + ': ' + query:<44} posts={size:<7} "
+                                         f"{elapsed:>10.1f}ms matches={count}")
+        #El indice en memoria tiene los posts revertidos
+        post_index.rebuild()
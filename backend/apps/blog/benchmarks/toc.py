@@ -0,0 +1,52 @@
+"""Extraccion de la tabla de contenido de posts grandes (sizes en bytes de HTML):
+HTMLParser sobre todo el contenido contra solo los fragmentos <hN>...</hN>, y el
+guardado del post con el reemplazo de sus Heading (bulk_create)"""
+import time
+
+from ..models import Post, Heading
+from ..toc import HeadingParser, extract_headings
+from . import rolled_back, make_posts, report
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+#Un titulo cada ~3KB de contenido
+SECTION = ("<h2 id='section-{i}'>Section {i} &amp; <em>notes</em></h2>"
+           "<p>" + "Lorem <b>ipsum</b> dolor sit amet, <a href='#'>consectetur</a> adipiscing elit. " * 40 + "</p>"
+           "<h3>Details {i}</h3><ul><li>One</li><li>Two</li></ul>")
+
+
+def make_content(size):
+    sections = []
+    total = 0
+    while total < size:
+        section = SECTION.format(i=len(sections))
+        sections.append(section)
+        total += len(section)
+    return "".join(sections)
+
+
+def run(command, sizes):
+    for size in sizes:
+        content = make_content(size)
+        command.stdout.write(f"Content: {len(content)} bytes")
+
+        start = time.perf_counter()
+        parser = HeadingParser()
+        parser.feed(content)
+        parser.close()
+        report(command, "HTMLParser full document", len(parser.headings), time.perf_counter() - start, "headings")
+
+        start = time.perf_counter()
+        toc = extract_headings(content)
+        report(command, "heading fragments only", len(toc), time.perf_counter() - start, "headings")
+
+        with rolled_back():
+            post = make_posts(1)[0]
+            post.content = content
+            start = time.perf_counter()
+            post.save(update_fields=["content"])
+            report(command, "post save (toc + Heading rows)", Heading.objects.filter(post=post).count(),
+                   time.perf_counter() - start, "headings")
+            #Mismo contenido: los Heading no se vuelven a escribir
+            start = time.perf_counter()
+            Post.objects.get(pk=post.pk).save(update_fields=["content"])
+            report(command, "post save (unchanged headings)", len(toc), time.perf_counter() - start, "headings")
@@ -0,0 +1,51 @@
+"""Visitantes unicos: filas PostView (exacto) contra HyperLogLog de redis
+(aproximado). Reporta eventos/s y el error del conteo de cada motor.
+fakeredis guarda los HyperLogLog como conjuntos exactos, para medir el error y
+la velocidad reales usar BENCHMARK_REDIS_URL"""
+import random
+
+from django.db import connection
+from django.utils.timezone import now
+
+from ..models import PostAnalytics
+from ..unique_views import ExactUniqueViews, HyperLogLogUniqueViews
+from . import fake_redis, rolled_back, make_posts, report, timed
+
+DEFAULT_SIZES = [10000, 100000]
+POSTS = 20
+BATCH_SIZE = 1000
+
+
+def run(command, sizes):
+    command.stdout.write(f"Database: {connection.vendor}")
+    for size in sizes:
+        rng = random.Random(size)
+        with rolled_back():
+            posts = make_posts(POSTS)
+            #Cada IP visita varias veces, asi la mitad de los eventos son repetidos
+            ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(size // 2)]
+            events = [(rng.choice(posts).id, rng.choice(ips), now()) for _ in range(size)]
+            expected = {post.id: len({ip for post_id, ip, _ in events if post_id == post.id}) for post in posts}
+
+            for label, engine in (("exact (PostView ON CONFLICT)", ExactUniqueViews()),
+                                  ("approximate (HyperLogLog)", HyperLogLogUniqueViews(fake_redis()))):
+                PostAnalytics.objects.update(views=0)
+                if isinstance(engine, HyperLogLogUniqueViews):
+                    engine.redis_client.flushdb()
+                results = {}
+                with timed(results, label):
+                    for start in range(0, size, BATCH_SIZE):
+                        engine.record(events[start:start + BATCH_SIZE])
+                    if isinstance(engine, HyperLogLogUniqueViews):
+                        engine.materialize()
+                report(command, label, size, results[label], unit="events")
+
+                counted = dict(PostAnalytics.objects.filter(post__in=posts).values_list("post_id", "views"))
+                #Los posts sin eventos no tienen error relativo, se reporta el absoluto
+                error = max((abs(counted[post_id] - unique) / unique
+                             for post_id, unique in expected.items() if unique), default=0)
+                command.stdout.write(f"{'':<40} max error per post: {error * 100:.2f}%")
+                empty = [counted[post_id] for post_id, unique in expected.items() if not unique]
+                if empty:
+                    command.stdout.write(f"{'':<40} posts without events: {len(empty)}, "
+                                         f"max views counted: {max(empty)}")
@@ -0,0 +1,43 @@
+"""Ingesta de vistas: una tarea increment_post_view_task por request contra el
+stream de redis procesado por lotes. Reporta eventos/s de cada camino (sin
+contar el viaje al broker de celery, que solo empeora el primer camino)"""
+import random
+from unittest import mock
+
+from django.db import connection
+
+from ..models import PostView, PostAnalytics
+from ..tasks import increment_post_view_task
+from ..view_events import publish_view, consume_view_events
+from . import fake_redis, rolled_back, make_posts, report, timed
+
+DEFAULT_SIZES = [10000, 50000]
+POSTS = 100
+
+
+def run(command, sizes):
+    command.stdout.write(f"Database: {connection.vendor}")
+    for size in sizes:
+        rng = random.Random(size)
+        with rolled_back():
+            posts = make_posts(POSTS)
+            events = [(rng.choice(posts), f"10.0.{rng.randrange(256)}.{rng.randrange(256)}")
+                      for _ in range(size)]
+            redis_client = fake_redis()
+            redis_client.flushdb()
+
+            results = {}
+            label = "per-request task"
+            with mock.patch("apps.blog.tasks.redis_client", redis_client), timed(results, label):
+                for post, ip_address in events:
+                    increment_post_view_task(post.slug, ip_address)
+            report(command, label, size, results[label], unit="events")
+
+            PostView.objects.all().delete()
+            PostAnalytics.objects.update(views=0)
+            label = "redis stream + batch consumer"
+            with timed(results, label):
+                for post, ip_address in events:
+                    publish_view(redis_client, post.id, ip_address)
+                consume_view_events(redis_client)
+            report(command, label, size, results[label], unit="events")
@@ -0,0 +1,345 @@
+"""Cache con dependencias: cada entrada registra en sets de redis los tags de lo
+que contiene (post:<id>, category:<id>, media:<id>) y las señales de los modelos
+borran solo las entradas afectadas, asi el cache puede durar horas.
+
+get_or_compute ademas protege contra estampidas: un solo worker recalcula la
+entrada (lock de redis) mientras los demas siguen sirviendo el valor anterior.
+
+Cada invalidacion incrementa una generacion global y la guarda en los tags que
+borro. Un valor calculado desde antes de que se invalidara alguno de sus tags puede
+venir de la fila anterior y no se guarda"""
+import asyncio
+import logging
+import math
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from core.db_routers import mark_primary_write
+from core.timing import cache_lookup
+
+from . import aio
+from ..media.signing import signer, track_expiry, note_expiry
+
+logger = logging.getLogger(__name__)
+
+TAG_PREFIX = "cache:tag:"
+#Contador de invalidaciones y sorted set tag -> generacion de su ultima invalidacion
+GENERATION_KEY = "cache:generation"
+TAG_GENERATIONS_KEY = "cache:tag_generations"
+#Si no hay redis para guardar los tags (cache local en desarrollo) se usa el tiempo anterior
+FALLBACK_TIMEOUT = 60 * 5
+
+#Cualquier cambio en un post puede cambiar el orden o el contenido de los listados
+#(por ejemplo sorting=recently_updated), por eso todos los listados llevan este tag
+POST_LIST_TAG = "post_list"
+CATEGORY_LIST_TAG = "category_list"
+
+
+#Expiracion anticipada probabilistica (XFetch): mientras mas cerca esta la entrada
+#de vencer y mas costosa es de calcular, mas probable es recalcularla antes
+EARLY_EXPIRATION_BETA = 1.0
+#Tiempo maximo que se espera a que otro worker calcule una entrada que no existe
+LOCK_WAIT = 2.0
+LOCK_TIMEOUT = 30
+
+
+def get_or_compute(key, compute):
+    """Retorna el valor guardado en key o lo calcula con compute() -> (valor, tags).
+    - Despues de BLOG_CACHE_SOFT_TIMEOUT la entrada esta vencida pero se sigue
+      sirviendo hasta que el worker con el lock la recalcula (stale-while-revalidate)
+    - Sin entrada (expirada o invalidada) los demas workers esperan al que tiene el lock"""
+    value, _ = get_or_compute_with_tags(key, compute)
+    return value
+
+
+def get_or_compute_with_tags(key, compute):
+    """Igual que get_or_compute pero tambien retorna los tags de la entrada"""
+    entry = cache.get(key)
+    cache_lookup(key, entry is not None)
+    if entry is not None:
+        if not _should_refresh(entry):
+            return _hit(entry)
+        lock = _lock(key)
+        if lock is None or lock.acquire(blocking=False):
+            return _compute(key, compute, lock)
+        #Otro worker ya la esta recalculando, servir el valor anterior
+        return _hit(entry)
+
+    lock = _lock(key)
+    if lock is None or lock.acquire(blocking=False):
+        return _compute(key, compute, lock)
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return _hit(entry)
+    return _compute(key, compute, None)
+
+
+def _hit(entry):
+    #Una entrada usada dentro de otro calculo le pasa la expiracion de sus URLs firmadas
+    note_expiry(entry.get("expires_at"))
+    return entry["value"], entry["tags"]
+
+
+def _should_refresh(entry):
+    now = time.time()
+    #-log(random) es positivo, adelanta la expiracion segun el costo del calculo
+    early = entry["compute_time"] * EARLY_EXPIRATION_BETA * -math.log(1.0 - random.random())
+    return now + early >= entry["fresh_until"]
+
+
+def _lock(key):
+    try:
+        return get_redis_connection("default").lock(f"lock:{key}", timeout=LOCK_TIMEOUT)
+    except Exception:
+        return None
+
+
+def _generation():
+    """Generacion actual de las invalidaciones, se lee antes de calcular una entrada"""
+    try:
+        return int(get_redis_connection("default").get(GENERATION_KEY) or 0)
+    except Exception:
+        return None
+
+
+def _compute(key, compute, lock):
+    try:
+        generation = _generation()
+        start = time.perf_counter()
+        with track_expiry() as signed:
+            value, tags = compute()
+        set_cached(key, value, tags, compute_time=time.perf_counter() - start, generation=generation,
+                   expires_at=signed["expires"])
+        note_expiry(signed["expires"])
+        return value, tags
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except Exception:
+                #El lock expiro mientras se calculaba, otro worker ya puede tenerlo
+                pass
+
+
+async def aget_or_compute(key, compute):
+    """Version async de get_or_compute, compute es una funcion async -> (valor, tags)"""
+    value, _ = await aget_or_compute_with_tags(key, compute)
+    return value
+
+
+async def aget_or_compute_with_tags(key, compute):
+    """Igual que get_or_compute_with_tags sin bloquear el event loop: con django_redis la
+    entrada, los tags y el lock se leen y escriben con redis.asyncio y son los mismos
+    que usan las vistas sincronas"""
+    entry = await _aget_entry(key)
+    cache_lookup(key, entry is not None)
+    if entry is not None:
+        if not _should_refresh(entry):
+            return _hit(entry)
+        lock = _alock(key)
+        if lock is None or await lock.acquire(blocking=False):
+            return await _acompute(key, compute, lock)
+        return _hit(entry)
+
+    lock = _alock(key)
+    if lock is None or await lock.acquire(blocking=False):
+        return await _acompute(key, compute, lock)
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        entry = await _aget_entry(key)
+        if entry is not None:
+            return _hit(entry)
+    return await _acompute(key, compute, None)
+
+
+async def _aget_entry(key):
+    redis_client = aio.get_cache_redis()
+    if redis_client is None:
+        return await cache.aget(key)
+    value = await redis_client.get(cache.make_key(key))
+    return None if value is None else cache.client.decode(value)
+
+
+def _alock(key):
+    redis_client = aio.get_cache_redis()
+    return None if redis_client is None else redis_client.lock(f"lock:{key}", timeout=LOCK_TIMEOUT)
+
+
+async def _ageneration():
+    redis_client = aio.get_cache_redis()
+    if redis_client is None:
+        return await sync_to_async(_generation)()
+    return int(await redis_client.get(GENERATION_KEY) or 0)
+
+
+async def _acompute(key, compute, lock):
+    try:
+        generation = await _ageneration()
+        start = time.perf_counter()
+        with track_expiry() as signed:
+            value, tags = await compute()
+        await aset_cached(key, value, tags, compute_time=time.perf_counter() - start, generation=generation,
+                          expires_at=signed["expires"])
+        note_expiry(signed["expires"])
+        return value, tags
+    finally:
+        if lock is not None:
+            try:
+                await lock.release()
+            except Exception:
+                pass
+
+
+async def aset_cached(key, value, tags, compute_time=0.0, generation=None, expires_at=None):
+    redis_client = aio.get_cache_redis()
+    if redis_client is None:
+        return await sync_to_async(set_cached)(key, value, tags, compute_time, generation, expires_at)
+    timeout, soft_timeout = _timeouts(expires_at)
+    if timeout <= 0:
+        return
+    tags = list(set(tags))
+    entry = _entry(value, tags, compute_time, soft_timeout, expires_at)
+    pipe = redis_client.pipeline(transaction=False)
+    for tag in tags:
+        pipe.sadd(f"{TAG_PREFIX}{tag}", key)
+        pipe.expire(f"{TAG_PREFIX}{tag}", timeout)
+    if generation is not None and tags:
+        pipe.zmscore(TAG_GENERATIONS_KEY, tags)
+    results = await pipe.execute()
+    if generation is not None and tags and _invalidated(results[-1], generation):
+        return
+    await redis_client.set(cache.make_key(key), cache.client.encode(entry), ex=timeout)
+    if generation is not None and tags and \
+            _invalidated(await redis_client.zmscore(TAG_GENERATIONS_KEY, tags), generation):
+        await redis_client.delete(cache.make_key(key))
+
+
+def get_cached(key):
+    entry = cache.get(key)
+    return entry["value"] if entry is not None else None
+
+
+def _timeouts(expires_at=None):
+    """(timeout, soft_timeout) de una entrada. Con URLs firmadas (expires_at) la entrada
+    no dura mas que la vida minima que el firmador garantiza a sus URLs"""
+    timeout = getattr(settings, "BLOG_CACHE_TIMEOUT", 60 * 60 * 2)
+    soft_timeout = getattr(settings, "BLOG_CACHE_SOFT_TIMEOUT", 60 * 10)
+    if expires_at is not None:
+        timeout = min(timeout, int(expires_at - signer.lifetime - time.time()))
+    return timeout, min(soft_timeout, timeout)
+
+
+def _entry(value, tags, compute_time, soft_timeout, expires_at):
+    return {
+        "value": value,
+        "tags": tags,
+        "fresh_until": time.time() + soft_timeout,
+        "compute_time": compute_time,
+        "expires_at": expires_at,
+    }
+
+
+def set_cached(key, value, tags, compute_time=0.0, generation=None, expires_at=None):
+    """Guarda el valor en el cache y lo registra en el set de cada tag. Con generation
+    (_generation() antes de calcular) no se guarda si algun tag se invalido despues.
+    expires_at: expiracion mas temprana de las URLs firmadas del valor"""
+    timeout, soft_timeout = _timeouts(expires_at)
+    if timeout <= 0:
+        return
+    tags = list(set(tags))
+    redis_client = None
+    try:
+        redis_client = get_redis_connection("default")
+        pipe = redis_client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.sadd(f"{TAG_PREFIX}{tag}", key)
+            #Todas las entradas usan el mismo timeout, el set vive lo mismo que la ultima
+            pipe.expire(f"{TAG_PREFIX}{tag}", timeout)
+        if generation is not None and tags:
+            pipe.zmscore(TAG_GENERATIONS_KEY, tags)
+        results = pipe.execute()
+        if generation is not None and tags and _invalidated(results[-1], generation):
+            return
+    except Exception as e:
+        logger.info(f"Cache tags unavailable for {key}: {str(e)}")
+        redis_client = None
+        timeout = soft_timeout = min(FALLBACK_TIMEOUT, timeout)
+    entry = _entry(value, tags, compute_time, soft_timeout, expires_at)
+    cache.set(key, entry, timeout=timeout)
+    #Una invalidacion entre la verificacion y el set ya no encontro la entrada
+    if redis_client is not None and generation is not None and tags:
+        try:
+            if _invalidated(redis_client.zmscore(TAG_GENERATIONS_KEY, tags), generation):
+                cache.delete(key)
+        except Exception as e:
+            logger.info(f"Cache tags unavailable for {key}: {str(e)}")
+            cache.delete(key)
+
+
+def _invalidated(tag_generations, generation):
+    return any(tag_generation is not None and tag_generation > generation for tag_generation in tag_generations)
+
+
+def invalidate_tags(*tags):
+    """Borra del cache todas las entradas registradas en los tags. Se debe llamar
+    despues del commit (transaction.on_commit), si no un fallo concurrente vuelve a
+    guardar la fila anterior"""
+    tag_keys = [f"{TAG_PREFIX}{tag}" for tag in tags]
+    #Las replicas pueden no tener el cambio todavia, las entradas se recalculan con "default"
+    mark_primary_write()
+    try:
+        redis_client = get_redis_connection("default")
+        generation = redis_client.incr(GENERATION_KEY)
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.sunion(tag_keys)
+        pipe.delete(*tag_keys)
+        #GT: una invalidacion anterior que llega tarde no baja la generacion del tag
+        pipe.zadd(TAG_GENERATIONS_KEY, {tag: generation for tag in tags}, gt=True)
+        pipe.expire(TAG_GENERATIONS_KEY, getattr(settings, "BLOG_CACHE_TIMEOUT", 60 * 60 * 2))
+        keys, *_ = pipe.execute()
+    except Exception as e:
+        logger.info(f"Error invalidating cache tags {tags}: {str(e)}")
+        return
+    if keys:
+        cache.delete_many([key.decode("utf-8") for key in keys])
+
+
+def post_tags(post):
+    """Tags de un post serializado: el post, su categoria y las imagenes"""
+    return [f"post:{post.id}"] + _post_related_tags(post)
+
+
+def _post_related_tags(post):
+    tags = [f"category:{post.category_id}"]
+    if post.thumbnail_id:
+        tags.append(f"media:{post.thumbnail_id}")
+    if post.category.thumbnail_id:
+        tags.append(f"media:{post.category.thumbnail_id}")
+    return tags
+
+
+def post_list_tags(posts):
+    """Tags de un listado: las categorias e imagenes de sus posts. No hace falta un
+    tag por post porque cualquier cambio en un post invalida POST_LIST_TAG"""
+    tags = {POST_LIST_TAG}
+    for post in posts:
+        tags.update(_post_related_tags(post))
+    return list(tags)
+
+
+def category_list_tags(categories):
+    tags = [CATEGORY_LIST_TAG]
+    for category in categories:
+        tags.append(f"category:{category.id}")
+        if category.thumbnail_id:
+            tags.append(f"media:{category.thumbnail_id}")
+    return tags
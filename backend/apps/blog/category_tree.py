@@ -0,0 +1,112 @@
+"""Arbol de categorias en memoria. Se carga con una sola consulta y se comparte por
+proceso; cuando cambia una categoria se incrementa una version en la cache para
+que todos los procesos vuelvan a cargarlo"""
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Category
+
+VERSION_KEY = "category_tree:version"
+
+
+class CategoryTree:
+    def __init__(self, rows):
+        #rows: (id, parent_id, name, slug, depth) ordenadas por path
+        self.nodes = {}
+        self.by_slug = {}
+        self.roots = []
+        for category_id, parent_id, name, slug, depth in rows:
+            node = {"id": category_id, "parent_id": parent_id, "name": name, "slug": slug,
+                    "depth": depth, "children": []}
+            self.nodes[category_id] = node
+            self.by_slug.setdefault(slug, node)
+        #Se enlaza por parent_id y no por el orden de path: las categorias anteriores a
+        #la columna tienen path vacio hasta correr rebuild_category_paths
+        for node in self.nodes.values():
+            parent = self.nodes.get(node["parent_id"])
+            if parent is None:
+                self.roots.append(node)
+            else:
+                parent["children"].append(node)
+
+    def ancestors(self, category_id):
+        """Migas de pan desde la raiz hasta la categoria (incluida)"""
+        breadcrumb = []
+        node = self.nodes.get(category_id)
+        while node is not None:
+            breadcrumb.append(node)
+            node = self.nodes.get(node["parent_id"])
+        return breadcrumb[::-1]
+
+    def descendant_ids(self, category_id):
+        stack = [self.nodes[category_id]] if category_id in self.nodes else []
+        ids = []
+        while stack:
+            node = stack.pop()
+            ids.append(node["id"])
+            stack.extend(node["children"])
+        return ids
+
+    def as_data(self, nodes=None):
+        """Arbol anidado listo para serializar"""
+        return [
+            {"id": str(node["id"]), "name": node["name"], "slug": node["slug"],
+             "children": self.as_data(node["children"])}
+            for node in (self.roots if nodes is None else nodes)
+        ]
+
+
+_snapshot = {"version": None, "tree": None}
+_lock = threading.Lock()
+
+
+def get_tree():
+    """Arbol del proceso, se recarga solo si cambio la version en la cache"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(VERSION_KEY, version, None)
+        version = cache.get(VERSION_KEY, version)
+    if _snapshot["version"] != version or _snapshot["tree"] is None:
+        with _lock:
+            if _snapshot["version"] != version or _snapshot["tree"] is None:
+                rows = Category.objects.order_by("path").values_list("id", "parent_id", "name", "slug", "depth")
+                _snapshot["tree"] = CategoryTree(rows)
+                _snapshot["version"] = version
+    return _snapshot["tree"]
+
+
+def invalidate_tree():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def rebuild_paths():
+    """Recalcula path y depth de todas las categorias nivel por nivel (por ejemplo
+    despues de un bulk_create). Una consulta de lectura y un bulk_update por nivel"""
+    categories = list(Category.objects.only("id", "parent_id", "path", "depth"))
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_id, []).append(category)
+
+    level = children.get(None, [])
+    parent_paths = {None: "/"}
+    updated = 0
+    while level:
+        for category in level:
+            category.path = f"{parent_paths[category.parent_id]}{category.id.hex}/"
+            category.depth = category.path.count("/") - 2
+            parent_paths[category.id] = category.path
+        Category.objects.bulk_update(level, ["path", "depth"], batch_size=1000)
+        updated += len(level)
+        level = [child for category in level for child in children.get(category.id, [])]
+    invalidate_tree()
+    return updated
+
+
+@receiver([post_save, post_delete], sender=Category, dispatch_uid="blog_category_tree")
+def invalidate_category_tree(sender, instance, **kwargs):
+    invalidate_tree()
@@ -0,0 +1,86 @@
+"""Clicks acumulados en redis (write-behind): el endpoint solo incrementa un hash
+y una tarea periodica de celery aplica los deltas en la base de datos por lotes"""
+import logging
+
+from . import rankings
+from .counters import drain_hash, restore_hash, apply_counter_deltas
+from .models import Post, PostAnalytics, Category, CategoryAnalytics
+
+logger = logging.getLogger(__name__)
+
+#Tiempo que se guarda la relacion slug -> id en redis
+SLUG_TIMEOUT = 60 * 10
+
+
+class ClickBuffer:
+    def __init__(self, prefix, queryset, analytics_model, related_field, ranked=False):
+        self.prefix = prefix
+        #Los clicks de los posts tambien alimentan los rankings (apps/blog/rankings.py)
+        self.ranked = ranked
+        self.queryset = queryset
+        self.analytics_model = analytics_model
+        self.related_field = related_field
+        #Hash id -> clicks pendientes de guardar en la base de datos
+        self.pending_key = f"{prefix}:clicks"
+        #Hash id -> clicks que tenia la base de datos en la ultima sincronizacion
+        self.total_key = f"{prefix}:clicks:total"
+
+    def record(self, redis_client, slug):
+        """Incrementa los clicks y retorna el total (base de datos + pendientes),
+        o None si el slug no existe"""
+        object_id = redis_client.get(f"{self.prefix}:slug:{slug}")
+        if object_id is None:
+            object_id = self._load(redis_client, slug)
+            if object_id is None:
+                return None
+        else:
+            object_id = object_id.decode("utf-8")
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hincrby(self.pending_key, object_id, 1)
+        pipe.hget(self.total_key, object_id)
+        if self.ranked:
+            rankings.add_events(pipe, clicks={object_id: 1})
+        pending, total, *_ = pipe.execute()
+        if total is None:
+            #La base se perdio (redis reiniciado), se vuelve a leer de la base de datos
+            self._load(redis_client, slug)
+            total = redis_client.hget(self.total_key, object_id)
+        return int(total or 0) + pending
+
+    def _load(self, redis_client, slug):
+        analytics = self.analytics_model._meta.get_field(self.related_field).related_query_name()
+        row = self.queryset().filter(slug=slug).values_list("id", f"{analytics}__clicks").first()
+        if row is None:
+            return None
+        object_id, clicks = str(row[0]), row[1] or 0
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(f"{self.prefix}:slug:{slug}", object_id, ex=SLUG_TIMEOUT)
+        pipe.hsetnx(self.total_key, object_id, clicks)
+        pipe.execute()
+        return object_id
+
+    def flush(self, redis_client):
+        """Aplica los clicks pendientes en la base de datos y actualiza los totales"""
+        deltas = drain_hash(redis_client, self.pending_key)
+        if not deltas:
+            return 0
+        try:
+            updated = apply_counter_deltas(self.analytics_model, self.related_field, deltas, "clicks")
+        except Exception:
+            restore_hash(redis_client, self.pending_key, deltas)
+            raise
+
+        field = self.analytics_model._meta.get_field(self.related_field)
+        totals = (self.analytics_model.objects
+                  .filter(**{f"{field.attname}__in": deltas.keys()})
+                  .values_list(field.attname, "clicks"))
+        pipe = redis_client.pipeline(transaction=False)
+        for object_id, clicks in totals:
+            pipe.hset(self.total_key, str(object_id), clicks)
+        pipe.execute()
+        return updated
+
+
+post_clicks = ClickBuffer("post", lambda: Post.postobjects, PostAnalytics, "post", ranked=True)
+category_clicks = ClickBuffer("category", lambda: Category.objects, CategoryAnalytics, "category")
@@ -0,0 +1,248 @@
+import logging
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from .rollups import record_rollups
+
+logger = logging.getLogger(__name__)
+
+#Cantidad de claves que se piden a redis en cada SCAN y que se vacian por pipeline
+BATCH_SIZE = 1000
+
+
+def scan_and_drain(redis_client, pattern, batch_size=BATCH_SIZE):
+    """Recorre las claves con SCAN (sin bloquear redis como KEYS) y las vacia
+    atomicamente con GETDEL en pipeline. Genera lotes {id: valor}"""
+    keys = []
+    for key in redis_client.scan_iter(match=pattern, count=batch_size):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            yield _drain_keys(redis_client, keys)
+            keys = []
+    if keys:
+        yield _drain_keys(redis_client, keys)
+
+
+def _drain_keys(redis_client, keys):
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.getdel(key)
+    values = pipe.execute()
+
+    deltas = {}
+    for key, value in zip(keys, values):
+        if not value:
+            continue
+        #El ID es la ultima parte de la clave, ejemplo: post:impressions:<id>
+        object_id = key.decode("utf-8").split(":")[-1]
+        try:
+            amount = int(value)
+        except ValueError:
+            logger.info(f"Invalid counter value for {key}: {value}")
+            continue
+        if amount:
+            deltas[object_id] = deltas.get(object_id, 0) + amount
+    return deltas
+
+
+def restore_counters(redis_client, prefix, deltas):
+    """Devuelve a redis los contadores que no se pudieron guardar en la base de datos"""
+    pipe = redis_client.pipeline(transaction=False)
+    for object_id, amount in deltas.items():
+        pipe.incrby(f"{prefix}{object_id}", amount)
+    pipe.execute()
+
+
+def apply_counter_deltas(model, related_field, deltas, counter):
+    """Suma los deltas {id: cantidad} al contador de las analiticas (PostAnalytics,
+    CategoryAnalytics) y recalcula el CTR. Retorna la cantidad de filas actualizadas"""
+    field = model._meta.get_field(related_field)
+    deltas = _clean_deltas(field, deltas)
+    if not deltas:
+        return 0
+
+    #Validar que los objetos existen y crear las analiticas que falten,
+    #como hacia get_or_create pero con una sola consulta por lote
+    existing = set(field.related_model.objects.filter(pk__in=deltas.keys())
+                   .values_list("pk", flat=True))
+    for object_id in deltas.keys() - existing:
+        logger.info(f"{field.related_model.__name__} with ID {object_id} does not exist")
+    deltas = {object_id: amount for object_id, amount in deltas.items() if object_id in existing}
+    if not deltas:
+        return 0
+
+    with_analytics = set(model.objects.filter(**{f"{field.attname}__in": deltas.keys()})
+                         .values_list(field.attname, flat=True))
+    model.objects.bulk_create(
+        [model(**{field.attname: object_id}) for object_id in deltas.keys() - with_analytics],
+        ignore_conflicts=True,
+    )
+
+    items = list(deltas.items())
+    updated = 0
+    #Los totales y los buckets por hora/dia se guardan juntos o no se guarda nada
+    with transaction.atomic():
+        for start in range(0, len(items), BATCH_SIZE):
+            chunk = items[start:start + BATCH_SIZE]
+            if _supports_update_from():
+                updated += _update_from_values(model, field, chunk, counter)
+            else:
+                updated += _bulk_update(model, field, chunk, counter)
+        record_rollups(model, related_field, deltas, counter)
+    return updated
+
+
+def _clean_deltas(field, deltas):
+    cleaned = {}
+    for object_id, amount in deltas.items():
+        try:
+            object_id = field.target_field.to_python(object_id)
+        except ValidationError:
+            logger.info(f"Invalid ID {object_id} for {field.related_model.__name__}")
+            continue
+        cleaned[object_id] = cleaned.get(object_id, 0) + amount
+    return cleaned
+
+
+def _supports_update_from():
+    if connection.vendor == "postgresql":
+        return True
+    return connection.vendor == "sqlite" and connection.Database.sqlite_version_info >= (3, 33)
+
+
+def _update_from_values(model, field, chunk, counter):
+    """Un solo UPDATE ... FROM (VALUES ...) por lote, con el CTR calculado en SQL"""
+    qn = connection.ops.quote_name
+    counter_column = qn(model._meta.get_field(counter).column)
+    clicks = "a.clicks + v.delta" if counter == "clicks" else "a.clicks"
+    impressions = "a.impressions + v.delta" if counter == "impressions" else "a.impressions"
+
+    if connection.vendor == "postgresql":
+        id_type = field.target_field.db_type(connection)
+        values = ", ".join([f"(%s::{id_type}, %s::integer)"] * len(chunk))
+        values = f"(VALUES {values}) AS v(related_id, delta)"
+    else:
+        #SQLite no permite nombrar las columnas de VALUES en el alias
+        values = ", ".join(["(%s, %s)"] * len(chunk))
+        values = f"(SELECT column1 AS related_id, column2 AS delta FROM (VALUES {values})) AS v"
+    sql = (
+        f"UPDATE {qn(model._meta.db_table)} AS a "
+        f"SET {counter_column} = a.{counter_column} + v.delta, "
+        f"click_through_rate = CASE WHEN {impressions} > 0 "
+        f"THEN ({clicks}) * 100.0 / ({impressions}) ELSE 0 END "
+        f"FROM {values} "
+        f"WHERE a.{qn(field.column)} = v.related_id"
+    )
+    params = []
+    for object_id, amount in chunk:
+        params.extend([field.target_field.get_db_prep_value(object_id, connection), amount])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def _bulk_update(model, field, chunk, counter):
+    """Alternativa para bases de datos sin UPDATE ... FROM"""
+    deltas = dict(chunk)
+    with transaction.atomic():
+        rows = list(model.objects.select_for_update()
+                    .filter(**{f"{field.attname}__in": deltas.keys()}))
+        for row in rows:
+            setattr(row, counter, getattr(row, counter) + deltas[getattr(row, field.attname)])
+            row.click_through_rate = (row.clicks / row.impressions) * 100 if row.impressions > 0 else 0
+        model.objects.bulk_update(rows, [counter, "click_through_rate"])
+    return len(rows)
+
+
+def apply_mean_deltas(model, related_field, samples, mean, count):
+    """Agrega lotes {id: (suma, cantidad)} al promedio `mean` de las analiticas con la
+    media incremental: mean += (suma - cantidad * mean) / (count + cantidad). Asi no se
+    guarda una suma que crece sin limite. Retorna la cantidad de filas actualizadas"""
+    field = model._meta.get_field(related_field)
+    cleaned = {}
+    for object_id, (total, amount) in samples.items():
+        try:
+            object_id = field.target_field.to_python(object_id)
+        except ValidationError:
+            logger.info(f"Invalid ID {object_id} for {field.related_model.__name__}")
+            continue
+        if amount > 0:
+            cleaned[object_id] = (float(total), int(amount))
+    items = list(cleaned.items())
+    updated = 0
+    for start in range(0, len(items), BATCH_SIZE):
+        chunk = items[start:start + BATCH_SIZE]
+        if _supports_update_from():
+            updated += _update_mean_from_values(model, field, chunk, mean, count)
+        else:
+            updated += _bulk_update_mean(model, field, chunk, mean, count)
+    return updated
+
+
+def _update_mean_from_values(model, field, chunk, mean, count):
+    """Un solo UPDATE ... FROM (VALUES ...) por lote"""
+    qn = connection.ops.quote_name
+    mean, count = qn(model._meta.get_field(mean).column), qn(model._meta.get_field(count).column)
+    if connection.vendor == "postgresql":
+        id_type = field.target_field.db_type(connection)
+        values = ", ".join([f"(%s::{id_type}, %s::double precision, %s::integer)"] * len(chunk))
+        values = f"(VALUES {values}) AS v(related_id, total, amount)"
+    else:
+        values = ", ".join(["(%s, %s, %s)"] * len(chunk))
+        values = f"(SELECT column1 AS related_id, column2 AS total, column3 AS amount FROM (VALUES {values})) AS v"
+    sql = (
+        f"UPDATE {qn(model._meta.db_table)} AS a "
+        f"SET {mean} = a.{mean} + (v.total - v.amount * a.{mean}) / (a.{count} + v.amount), "
+        f"{count} = a.{count} + v.amount "
+        f"FROM {values} "
+        f"WHERE a.{qn(field.column)} = v.related_id"
+    )
+    params = []
+    for object_id, (total, amount) in chunk:
+        params.extend([field.target_field.get_db_prep_value(object_id, connection), total, amount])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def _bulk_update_mean(model, field, chunk, mean, count):
+    samples = dict(chunk)
+    with transaction.atomic():
+        rows = list(model.objects.select_for_update()
+                    .filter(**{f"{field.attname}__in": samples.keys()}))
+        for row in rows:
+            total, amount = samples[getattr(row, field.attname)]
+            current, seen = getattr(row, mean), getattr(row, count)
+            setattr(row, mean, current + (total - amount * current) / (seen + amount))
+            setattr(row, count, seen + amount)
+        model.objects.bulk_update(rows, [mean, count])
+    return len(rows)
+
+
+def drain_hash(redis_client, key):
+    """Lee y borra un hash de contadores en la misma transaccion (MULTI/EXEC),
+    los incrementos que lleguen despues quedan para la siguiente sincronizacion"""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hgetall(key)
+    pipe.delete(key)
+    values, _ = pipe.execute()
+
+    deltas = {}
+    for object_id, value in values.items():
+        try:
+            amount = int(value)
+        except ValueError:
+            logger.info(f"Invalid counter value for {key}[{object_id}]: {value}")
+            continue
+        if amount:
+            deltas[object_id.decode("utf-8")] = amount
+    return deltas
+
+
+def restore_hash(redis_client, key, deltas):
+    """Devuelve a un hash de redis los contadores que no se pudieron guardar"""
+    pipe = redis_client.pipeline(transaction=False)
+    for object_id, amount in deltas.items():
+        pipe.hincrby(key, str(object_id), amount)
+    pipe.execute()
@@ -0,0 +1,128 @@
+"""Tiempo en pagina: el frontend envia un beacon (navigator.sendBeacon) al salir de
+la pagina y el endpoint solo suma el tiempo y la cantidad en dos hashes de redis.
+fold_dwell_times los agrega a avg_time_on_page con una media incremental.
+
+Con BLOG_DWELL_BUFFER_SECONDS > 0 cada proceso junta los beacons en memoria y los
+envia a redis en un solo pipeline cada ese tiempo (o cada LOCAL_BATCH_SIZE posts),
+a cambio de perder como maximo ese intervalo si el proceso muere"""
+import atexit
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from django.conf import settings
+
+from .counters import apply_mean_deltas
+from .models import PostAnalytics, CategoryAnalytics
+
+logger = logging.getLogger(__name__)
+
+#Un beacon valido ocupa menos de 100 bytes
+MAX_BODY_SIZE = 512
+#Posts distintos que se juntan en memoria antes de enviarlos a redis
+LOCAL_BATCH_SIZE = 500
+
+
+class InvalidBeacon(ValueError):
+    pass
+
+
+def parse_beacon(body):
+    """Lee {"id": ..., "seconds": ...} como JSON (text/plain o application/json) o como
+    formulario (URLSearchParams). Retorna (id, segundos) o lanza InvalidBeacon"""
+    if len(body) > MAX_BODY_SIZE:
+        raise InvalidBeacon("Beacon too large")
+    try:
+        text = body.decode("utf-8").strip()
+        if text.startswith("{"):
+            data = json.loads(text)
+        else:
+            data = {key: values[0] for key, values in parse_qs(text).items()}
+        object_id = uuid.UUID(str(data["id"]))
+        seconds = float(data["seconds"])
+    except (UnicodeDecodeError, ValueError, KeyError, TypeError, AttributeError):
+        raise InvalidBeacon("Invalid beacon, expected id and seconds")
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise InvalidBeacon("Invalid beacon, seconds must be positive")
+    #Una pestaña olvidada abierta no debe inflar el promedio
+    return object_id, min(seconds, getattr(settings, "BLOG_DWELL_MAX_SECONDS", 60 * 30))
+
+
+class DwellTimeBuffer:
+    def __init__(self, prefix, analytics_model, related_field):
+        self.analytics_model = analytics_model
+        self.related_field = related_field
+        #Hashes id -> suma de segundos / cantidad de beacons pendientes
+        self.sum_key = f"{prefix}:dwell:sum"
+        self.count_key = f"{prefix}:dwell:count"
+        #id -> [suma, cantidad] pendientes de enviar a redis (BLOG_DWELL_BUFFER_SECONDS)
+        self._local = {}
+        self._local_since = None
+        self._local_client = None
+        self._lock = threading.Lock()
+        atexit.register(self.push)
+
+    def record(self, redis_client, object_id, seconds):
+        window = getattr(settings, "BLOG_DWELL_BUFFER_SECONDS", 0)
+        if not window:
+            self._send(redis_client, {str(object_id): [seconds, 1]})
+            return
+        now = time.monotonic()
+        with self._lock:
+            sample = self._local.setdefault(str(object_id), [0.0, 0])
+            sample[0] += seconds
+            sample[1] += 1
+            self._local_client = redis_client
+            if self._local_since is None:
+                self._local_since = now
+            if len(self._local) < LOCAL_BATCH_SIZE and now - self._local_since < window:
+                return
+            pending, self._local, self._local_since = self._local, {}, None
+        self._send(redis_client, pending)
+
+    def push(self, redis_client=None):
+        """Envia a redis los beacons que estan en memoria"""
+        with self._lock:
+            pending, self._local, self._local_since = self._local, {}, None
+            redis_client = redis_client or self._local_client
+        if pending and redis_client is not None:
+            self._send(redis_client, pending)
+
+    def _send(self, redis_client, samples):
+        pipe = redis_client.pipeline(transaction=False)
+        for object_id, (total, amount) in samples.items():
+            pipe.hincrbyfloat(self.sum_key, object_id, total)
+            pipe.hincrby(self.count_key, object_id, amount)
+        pipe.execute()
+
+    def flush(self, redis_client):
+        """Agrega los tiempos pendientes a avg_time_on_page, retorna las filas actualizadas"""
+        self.push(redis_client)
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hgetall(self.sum_key)
+        pipe.hgetall(self.count_key)
+        pipe.delete(self.sum_key, self.count_key)
+        totals, counts, _ = pipe.execute()
+        samples = {}
+        for object_id, amount in counts.items():
+            try:
+                samples[object_id.decode("utf-8")] = (float(totals.get(object_id, 0)), int(amount))
+            except ValueError:
+                logger.info(f"Invalid dwell time for {self.count_key}[{object_id}]")
+        if not samples:
+            return 0
+        try:
+            return apply_mean_deltas(self.analytics_model, self.related_field, samples,
+                                     "avg_time_on_page", "time_on_page_samples")
+        except Exception:
+            #Devolver los tiempos a redis para no perderlos
+            self._send(redis_client, samples)
+            raise
+
+
+post_dwell = DwellTimeBuffer("post", PostAnalytics, "post")
+category_dwell = DwellTimeBuffer("category", CategoryAnalytics, "category")
@@ -0,0 +1,68 @@
+"""Impresiones de los listados: se cuentan solo los elementos de la pagina que se
+responde, con un HINCRBY por elemento en un solo pipeline (un viaje a redis por
+request) sobre el hash <prefix>:impressions. sync_impressions_to_db lo vacia y
+aplica los deltas en la base de datos por lotes"""
+import logging
+
+from .counters import drain_hash, restore_hash, scan_and_drain, restore_counters, apply_counter_deltas
+from .models import PostAnalytics, CategoryAnalytics
+
+logger = logging.getLogger(__name__)
+
+
+class ImpressionBuffer:
+    def __init__(self, prefix, analytics_model, related_field):
+        self.analytics_model = analytics_model
+        self.related_field = related_field
+        #Hash id -> impresiones pendientes de guardar en la base de datos
+        self.pending_key = f"{prefix}:impressions"
+        #Claves sueltas <prefix>:impressions:<id> de la version anterior, se siguen
+        #vaciando mientras existan (procesos sin actualizar durante un deploy)
+        self.legacy_prefix = f"{prefix}:impressions:"
+
+    def record(self, redis_client, object_ids):
+        """Suma una impresion a cada id. Un error de redis no debe romper el listado"""
+        if not object_ids:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for object_id in object_ids:
+                pipe.hincrby(self.pending_key, str(object_id), 1)
+            pipe.execute()
+        except Exception as e:
+            logger.info(f"Error recording impressions for {self.pending_key}: {str(e)}")
+
+    async def arecord(self, redis_client, object_ids):
+        """record() con un cliente redis.asyncio"""
+        if not object_ids:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for object_id in object_ids:
+                pipe.hincrby(self.pending_key, str(object_id), 1)
+            await pipe.execute()
+        except Exception as e:
+            logger.info(f"Error recording impressions for {self.pending_key}: {str(e)}")
+
+    def flush(self, redis_client):
+        """Aplica las impresiones pendientes en la base de datos, retorna las filas actualizadas"""
+        deltas = drain_hash(redis_client, self.pending_key)
+        updated = 0
+        if deltas:
+            try:
+                updated += apply_counter_deltas(self.analytics_model, self.related_field, deltas, "impressions")
+            except Exception:
+                #Devolver las impresiones a redis para no perderlas
+                restore_hash(redis_client, self.pending_key, deltas)
+                raise
+        for deltas in scan_and_drain(redis_client, f"{self.legacy_prefix}*"):
+            try:
+                updated += apply_counter_deltas(self.analytics_model, self.related_field, deltas, "impressions")
+            except Exception:
+                restore_counters(redis_client, self.legacy_prefix, deltas)
+                raise
+        return updated
+
+
+post_impressions = ImpressionBuffer("post", PostAnalytics, "post")
+category_impressions = ImpressionBuffer("category", CategoryAnalytics, "category")
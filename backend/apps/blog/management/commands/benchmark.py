@@ -0,0 +1,20 @@
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+
+from apps.blog.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Ejecuta un benchmark de rendimiento del blog, ejemplo: python manage.py benchmark impression_sync"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=BENCHMARKS)
+        parser.add_argument("--size", type=int, nargs="+",
+                            help="Tamaños del conjunto de datos (usa los del benchmark si se omite)")
+
+    def handle(self, *args, **options):
+        benchmark = import_module(f"apps.blog.benchmarks.{options['name']}")
+        sizes = options["size"] or benchmark.DEFAULT_SIZES
+        #Los datos se crean dentro de una transaccion que se revierte al terminar
+        benchmark.run(self, sizes)
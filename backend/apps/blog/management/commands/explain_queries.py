@@ -0,0 +1,83 @@
+import re
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+from apps.blog.models import Post, Heading, Category, PostView, CategoryView, PostAnalytics
+from apps.blog.serializers import PostListSerializer, PostSerializer, CategoryListSerializer
+
+SLUG = "example-slug"
+IP_ADDRESS = "127.0.0.1"
+OBJECT_ID = uuid.UUID(int=0)
+PATH = f"/{OBJECT_ID.hex}/"
+PAGE = 7
+
+
+def view_queries():
+    """(nombre, queryset, debe usar un indice) con las mismas consultas que hacen las vistas"""
+    posts = PostListSerializer.setup_queryset(Post.postobjects.all())
+    return [
+        ("post_list newest", posts.order_by("-created_at", "-id")[:PAGE], True),
+        ("post_list most_viewed", posts.annotate(popularity=Coalesce(F("post_analytics__views"), 0))
+         .order_by("-popularity", "-id")[:PAGE], False),
+        ("post_list ranking page (in_bulk)", posts.filter(pk__in=[OBJECT_ID]), True),
+        ("post_list az", posts.order_by("title", "id")[:PAGE], False),
+        ("post_detail", PostSerializer.setup_queryset(Post.postobjects.filter(slug=SLUG)), True),
+        ("post sync_headings", Heading.objects.filter(post_id=OBJECT_ID), True),
+        ("post increment_click", Post.postobjects.filter(slug=SLUG).values_list("id", "post_analytics__clicks"), True),
+        ("increment_post_view_task", Post.objects.filter(slug=SLUG).values_list("id", flat=True), True),
+        ("post view (post, ip)", PostView.objects.filter(post_id=OBJECT_ID, ip_address=IP_ADDRESS), True),
+        ("post analytics", PostAnalytics.objects.filter(post_id=OBJECT_ID), True),
+        ("category_list", CategoryListSerializer.setup_queryset(Category.objects.order_by("name", "id"))[:PAGE], False),
+        ("category_detail category", Category.objects.filter(slug=SLUG), True),
+        ("category_detail posts", PostListSerializer.setup_queryset(
+            Post.postobjects.filter(Category.subtree_filter(PATH, "category__"))).order_by("-created_at", "-id")[:PAGE],
+         True),
+        ("category increment_click", Category.objects.filter(slug=SLUG).values_list("id", "category_analytics__clicks"),
+         True),
+        ("category view (category, ip)", CategoryView.objects.filter(category_id=OBJECT_ID,
+                                                                     ip_address=IP_ADDRESS), True),
+    ]
+
+
+def full_scans(plan):
+    """Tablas que el plan recorre completas"""
+    if connection.vendor == "postgresql":
+        return re.findall(r"Seq Scan on (\w+)", plan)
+    if connection.vendor == "sqlite":
+        return re.findall(r"SCAN (\w+)(?!\w| USING)", plan)
+    return []
+
+
+class Command(BaseCommand):
+    help = "Muestra el plan (EXPLAIN) de las consultas de las vistas del blog, ejemplo: python manage.py explain_queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--analyze", action="store_true",
+                            help="Ejecuta las consultas (EXPLAIN ANALYZE, solo PostgreSQL)")
+        parser.add_argument("--check", action="store_true",
+                            help="Termina con error si una busqueda por slug/id recorre una tabla completa")
+
+    def handle(self, *args, **options):
+        explain_options = {}
+        if options["analyze"]:
+            if connection.vendor != "postgresql":
+                raise CommandError("--analyze requires PostgreSQL")
+            explain_options["analyze"] = True
+
+        regressions = []
+        for name, queryset, indexed in view_queries():
+            plan = queryset.explain(**explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            scans = full_scans(plan)
+            if indexed and scans:
+                regressions.append(f"{name}: full scan on {', '.join(scans)}")
+
+        for regression in regressions:
+            self.stdout.write(self.style.WARNING(regression))
+        if options["check"] and regressions:
+            raise CommandError(f"{len(regressions)} queries do not use an index")
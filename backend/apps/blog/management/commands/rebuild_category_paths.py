@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.category_tree import rebuild_paths
+
+
+class Command(BaseCommand):
+    help = "Recalcula path y depth de todas las categorias (necesario despues de agregar la columna path o de un bulk_create)"
+
+    def handle(self, *args, **options):
+        updated = rebuild_paths()
+        self.stdout.write(f"{updated} categories updated")
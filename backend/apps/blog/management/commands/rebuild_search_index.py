@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.search import INDEXES
+
+
+class Command(BaseCommand):
+    help = "Recalcula search_vector de posts y categorias (necesario despues de bulk_create o de cambiar BLOG_SEARCH_CONFIG)"
+
+    def handle(self, *args, **options):
+        for label, index in INDEXES.items():
+            updated = index.rebuild()
+            self.stdout.write(f"{label}: {updated} rows indexed")
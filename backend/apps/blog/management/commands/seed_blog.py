@@ -0,0 +1,83 @@
+import multiprocessing
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from apps.blog import seeding
+from apps.blog.caching import invalidate_tags, POST_LIST_TAG, CATEGORY_LIST_TAG
+from apps.blog.category_tree import invalidate_tree
+from apps.blog.models import Post
+from apps.blog.search import INDEXES
+
+
+class Command(BaseCommand):
+    help = ("Genera categorias, media, posts, headings, vistas y analiticas falsas por lotes, "
+            "ejemplo: python manage.py seed_blog --posts 1000000 --workers 8")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1000)
+        parser.add_argument("--categories", type=int, default=50)
+        parser.add_argument("--category-depth", type=int, default=3, help="Niveles del arbol de categorias")
+        parser.add_argument("--media", type=int, help="Imagenes para los thumbnails (por defecto posts / 10)")
+        parser.add_argument("--views-per-post", type=int, default=2,
+                            help="Promedio de vistas crudas (PostView) por post")
+        parser.add_argument("--draft-ratio", type=float, default=0.1)
+        parser.add_argument("--days", type=int, default=365, help="Antiguedad maxima de los posts")
+        parser.add_argument("--end", type=datetime.fromisoformat,
+                            help="Fecha mas reciente de los posts (por defecto hoy a las 00:00 UTC)")
+        parser.add_argument("--seed", type=int, default=0, help="Misma semilla, mismos datos")
+        parser.add_argument("--workers", type=int, default=1, help="Procesos en paralelo")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Filas por lote y transaccion")
+        parser.add_argument("--skip-index", action="store_true", help="No recalcular el indice de busqueda")
+
+    def handle(self, *args, **options):
+        seed, workers = options["seed"], max(options["workers"], 1)
+        if options["categories"] < 1 or options["category_depth"] < 1:
+            raise CommandError("At least one category and one level are required")
+        if Post.objects.filter(pk=seeding.seed_uuid(seed, "post", 0)).exists():
+            raise CommandError(f"Data for --seed {seed} already exists, use another seed")
+        if workers > 1 and connection.vendor == "sqlite":
+            #SQLite bloquea la base de datos completa en cada escritura
+            self.stderr.write("SQLite does not support concurrent writers, using a single process")
+            workers = 1
+
+        end = options["end"] or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        media = options["posts"] // 10 if options["media"] is None else options["media"]
+        chunk_options = {"end": end, "days": options["days"], "media": media, "categories": options["categories"],
+                         "views_per_post": options["views_per_post"], "draft_ratio": options["draft_ratio"]}
+        start = time.perf_counter()
+
+        created = seeding.seed_categories(seed, options["categories"], options["category_depth"])
+        self.stdout.write(f"categories: {created}")
+        #Los posts referencian las imagenes, se crean en una fase anterior
+        for kind, total in (("media", media), ("post", options["posts"])):
+            tasks = [(kind, seed, first, min(options["chunk_size"], total - first), chunk_options)
+                     for first in range(0, total, options["chunk_size"])]
+            totals = {}
+            for counts in self._run(tasks, workers):
+                for name, count in counts.items():
+                    totals[name] = totals.get(name, 0) + count
+            for name, count in totals.items():
+                self.stdout.write(f"{name}: {count} ({time.perf_counter() - start:.1f}s)")
+
+        if not options["skip_index"]:
+            for label, index in INDEXES.items():
+                self.stdout.write(f"search index {label}: {index.rebuild()} rows")
+        invalidate_tree()
+        invalidate_tags(POST_LIST_TAG, CATEGORY_LIST_TAG)
+        self.stdout.write(f"Done in {time.perf_counter() - start:.1f}s. The post rankings are rebuilt by the "
+                          f"reconcile_rankings task")
+
+    @staticmethod
+    def _run(tasks, workers):
+        if workers == 1:
+            yield from map(seeding.run_chunk, tasks)
+            return
+        #Los procesos hijos no deben heredar la conexion abierta del padre
+        connections.close_all()
+        with multiprocessing.Pool(workers, initializer=seeding.init_worker) as pool:
+            yield from pool.imap_unordered(seeding.run_chunk, tasks)
@@ -1,13 +1,21 @@
 import uuid
 
+from django.contrib.postgres.search import SearchVectorField
 from django.core.serializers import serialize
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, connections, transaction
+from django.core.exceptions import ValidationError
+from django.db.models import Case, When, F, Q, Value
+from django.db.models.functions import Cast, Concat, Substr
+from django.db.models.lookups import GreaterThan
+from django.db.models.sql import UpdateQuery
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils.html import format_html
 from django.utils.timezone import now
 from ckeditor.fields import RichTextField
 from .utils import get_client_ip
+from .caching import invalidate_tags, POST_LIST_TAG, CATEGORY_LIST_TAG
+from .toc import extract_headings
 from core.storage_backends import PublicMediaStorage
 from ..media.models import Media
 from ..media.serializers import MediaSerializer
@@ -25,6 +33,70 @@ def category_thumbnail_directory(instance, filename):
     sanitized_name = instance.name.replace(" ", "_")
     return "thumbnails/blog_categories/{0}/{1}".format(sanitized_name, filename)
 
+def click_through_rate(clicks, impressions):
+    """Expresion SQL del CTR: (clicks / impressions) * 100, o 0 si no hay impresiones"""
+    return Case(
+        When(GreaterThan(impressions, 0),
+             then=Cast(clicks, models.FloatField()) * 100.0 / impressions),
+        default=Value(0.0),
+        output_field=models.FloatField(),
+    )
+
+class AnalyticsQuerySet(models.QuerySet):
+    """Contadores atomicos para PostAnalytics y CategoryAnalytics usando expresiones F()"""
+
+    def increment(self, returning=None, **amounts):
+        """UPDATE ... SET clicks = clicks + 1, click_through_rate = ... en una sola
+        sentencia. Con returning=[campos] retorna las filas con los valores nuevos"""
+        updates = {field: F(field) + amount for field, amount in amounts.items()}
+        if "clicks" in amounts or "impressions" in amounts:
+            #Las expresiones del SET se evaluan con los valores anteriores de la fila
+            updates["click_through_rate"] = click_through_rate(
+                updates.get("clicks", F("clicks")), updates.get("impressions", F("impressions"))
+            )
+        if returning is None:
+            return self.update(**updates)
+        return self._update_returning(updates, returning)
+
+    def increment_or_create(self, lookup, returning=None, **amounts):
+        """Igual que increment, pero crea las analiticas si todavia no existen"""
+        rows = self.filter(**lookup).increment(returning, **amounts)
+        if rows:
+            return rows
+        self.get_or_create(**lookup)
+        return self.filter(**lookup).increment(returning, **amounts)
+
+    def set_counters(self, **values):
+        """Asigna los contadores y recalcula el CTR en la misma sentencia"""
+        return self.update(
+            click_through_rate=click_through_rate(
+                Value(values["clicks"]) if "clicks" in values else F("clicks"),
+                Value(values["impressions"]) if "impressions" in values else F("impressions"),
+            ),
+            **values,
+        )
+
+    def _update_returning(self, updates, returning):
+        self._for_write = True
+        connection = connections[self.db]
+        if not connection.features.can_return_columns_from_insert:
+            #Sin soporte para RETURNING: actualizar y leer en la misma transaccion
+            with transaction.atomic(using=self.db):
+                pks = list(self.values_list("pk", flat=True))
+                self.model.objects.filter(pk__in=pks).update(**updates)
+                return list(self.model.objects.filter(pk__in=pks).values_list(*returning))
+
+        query = self.query.chain(UpdateQuery)
+        query.add_update_values(updates)
+        compiler = query.get_compiler(self.db)
+        compiler.pre_sql_setup()
+        update_sql, params = compiler.as_sql()
+        columns = ", ".join(connection.ops.quote_name(self.model._meta.get_field(field).column)
+                            for field in returning)
+        with connection.cursor() as cursor:
+            cursor.execute(f"{update_sql} RETURNING {columns}", params)
+            return cursor.fetchall()
+
 class Category(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     #parent: Se usa "self" para indicar que este campo es una clave foránea a la
@@ -45,7 +117,44 @@ class Category(models.Model):
     thumbnail = models.ForeignKey(Media, on_delete=models.SET_NULL,
                                   related_name='blog_category_thumbnail', blank=True, null=True)
     #thumbnail = models.ImageField(upload_to=category_thumbnail_directory, blank=True, null=True)
-    slug = models.CharField(max_length=128)
+    slug = models.CharField(max_length=128, unique=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    #Ruta materializada con los ids (hex) de los ancestros y el propio: /<raiz>/<hijo>/
+    #Se mantiene al guardar, permite obtener un subarbol con una sola consulta
+    path = models.CharField(max_length=1024, db_index=True, editable=False, default="")
+    depth = models.PositiveIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        old_path, old_depth = self.path, self.depth
+        parent_path = self.parent.path if self.parent_id else "/"
+        if old_path and parent_path.startswith(old_path):
+            raise ValidationError("A category cannot be moved inside itself or its subcategories")
+        if parent_path:
+            self.path = f"{parent_path}{self.id.hex}/"
+            self.depth = self.path.count("/") - 2
+        else:
+            #Padre sin path calculado: queda vacio hasta rebuild_category_paths
+            self.path, self.depth = "", 0
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "path", "depth"}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if old_path and old_path != self.path:
+                #Mover el subarbol completo con un solo UPDATE
+                Category.objects.filter(Category.subtree_filter(old_path)).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr("path", len(old_path) + 1)),
+                    depth=F("depth") + (self.depth - old_depth),
+                )
+
+    @staticmethod
+    def subtree_filter(path, prefix=""):
+        """Q de la categoria con esa ruta y todas sus subcategorias. Se usa un rango
+        (path >= '/a/' AND path < '/a0') en lugar de LIKE para aprovechar el indice"""
+        if not path:
+            #Con "" el rango incluye todas las categorias sin path calculado
+            raise ValueError("Category path is empty, run rebuild_category_paths")
+        return Q(**{f"{prefix}path__gte": path, f"{prefix}path__lt": path[:-1] + "0"})
+
     #se define esta clase en los modelos para que se puedan leer de una manera
     #ordenada/correcta la clase en el admin manager django:
     def __str__(self):
@@ -64,7 +173,13 @@ class CategoryView(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='category_view')
     ip_address = models.GenericIPAddressField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    #Indice para la retencion de las vistas crudas (rollups.prune)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "ip_address"], name="unique_category_view_ip"),
+        ]
 
 class CategoryAnalytics(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -75,30 +190,34 @@ class CategoryAnalytics(models.Model):
     clicks = models.PositiveIntegerField(default=0)
     click_through_rate = models.FloatField(default=0)
     avg_time_on_page = models.FloatField(default=0)
+    #Cantidad de tiempos que forman el promedio (apps/blog/dwell_time.py)
+    time_on_page_samples = models.PositiveIntegerField(default=0)
 
-    def _update_click_through_rate(self):
-        if self.impressions > 0:
-            self.click_through_rate = (self.clicks/self.impressions) * 100
-        else:
-            self.click_through_rate = 0
-        self.save()
+    objects = AnalyticsQuerySet.as_manager()
 
     def increment_click(self):
-        self.clicks += 1
-        self.save()
-        self._update_click_through_rate()
+        self._increment(clicks=1)
 
     def increment_impression(self):
-        self.impressions += 1
-        self.save()
-        self._update_click_through_rate()
+        self._increment(impressions=1)
+
+    def _increment(self, **amounts):
+        #Un solo UPDATE atomico, luego se leen los valores nuevos (RETURNING)
+        fields = list(amounts) + ["click_through_rate"]
+        rows = CategoryAnalytics.objects.filter(pk=self.pk).increment(returning=fields, **amounts)
+        if rows:
+            for field, value in zip(fields, rows[0]):
+                setattr(self, field, value)
 
     def increment_view(self, ip_address):
         #ip_address = get_client_ip(request)
-        if not CategoryView.objects.filter(category=self.category, ip_address=ip_address).exists():
-            CategoryView.objects.create(category=self.category, ip_address=ip_address)
-            self.views +=1
-            self.save()
+        #get_or_create usa el indice unico (category, ip_address) y resuelve la carrera
+        _, created = CategoryView.objects.get_or_create(category=self.category, ip_address=ip_address)
+        if created:
+            #Como las vistas de los posts: el total y los rollups por hora/dia juntos
+            #(counters importa rollups, que importa este modulo)
+            from .counters import apply_counter_deltas
+            apply_counter_deltas(CategoryAnalytics, "category", {self.category_id: 1}, "views")
 
 class Post(models.Model):
 
@@ -121,13 +240,17 @@ class Post(models.Model):
     # se proteje el post, es decir no se borra este post
     category = models.ForeignKey(Category, on_delete=models.PROTECT)
     content = RichTextField(blank=True, null=True)
+    #Tabla de contenido extraida de content al guardar (apps/blog/toc.py)
+    toc = models.JSONField(default=list, blank=True, editable=False)
     #thumbnail = models.ImageField(upload_to=blog_thumbnail_directory, storage=PublicMediaStorage())
     thumbnail = models.ForeignKey(Media, on_delete=models.SET_NULL,
                                   related_name='post_thumbnail', blank=True, null=True)
 
     keywords = models.CharField(max_length=128)
-    slug = models.CharField(max_length=128)
+    slug = models.CharField(max_length=128, unique=True)
     created_at = models.DateTimeField(default=now)
+    #Texto de busqueda desnormalizado, se mantiene al guardar (apps/blog/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=12, choices=status_options, default='draft')
     objects = models.Manager() #default manager
@@ -136,12 +259,37 @@ class Post(models.Model):
     #Para ver nuestro modelo ordenado en el admin manager Django, se definen clases meta:
     class Meta:
         ordering = ("status","-created_at")
+        indexes = [
+            #Filtro de postobjects (status='published') + orden por fecha, el id desempata
+            #como en la paginacion por cursor
+            models.Index(fields=["status", "-created_at", "-id"], name="blog_post_status_created_idx"),
+        ]
 
     #se define esta clase en los modelos para que se puedan leer de una manera
     #ordenada/correcta la clase en el admin manager django:
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "content" in update_fields:
+            self.toc = extract_headings(self.content)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "toc"}
+        super().save(*args, **kwargs)
+
+    def sync_headings(self, created=False):
+        """Reemplaza los Heading del post por los de la tabla de contenido, solo si cambiaron"""
+        if created:
+            Heading.objects.bulk_create([Heading(post=self, **heading) for heading in self.toc])
+            return
+        current = list(Heading.objects.filter(post=self).values_list("title", "slug", "level", "order"))
+        if current == [(h["title"], h["slug"], h["level"], h["order"]) for h in self.toc]:
+            return
+        with transaction.atomic():
+            Heading.objects.filter(post=self).delete()
+            Heading.objects.bulk_create([Heading(post=self, **heading) for heading in self.toc])
+
     def thumbnail_preview(self):
         if self.thumbnail:
             serializer = MediaSerializer(instance=self.thumbnail)
@@ -155,7 +303,14 @@ class PostView(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='post_view')
     ip_address = models.GenericIPAddressField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    #Indice para la retencion de las vistas crudas (rollups.prune)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        #Una sola vista por IP, permite usar INSERT ... ON CONFLICT DO NOTHING
+        constraints = [
+            models.UniqueConstraint(fields=["post", "ip_address"], name="unique_post_view_ip"),
+        ]
 
 class PostAnalytics(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -165,30 +320,74 @@ class PostAnalytics(models.Model):
     clicks = models.PositiveIntegerField(default=0)
     click_through_rate = models.FloatField(default=0)
     avg_time_on_page = models.FloatField(default=0)
+    #Cantidad de tiempos que forman el promedio (apps/blog/dwell_time.py)
+    time_on_page_samples = models.PositiveIntegerField(default=0)
 
-    def increment_click(self):
-        self.clicks += 1
-        self.save()
-        self._update_click_through_rate()
+    objects = AnalyticsQuerySet.as_manager()
 
-    def _update_click_through_rate(self):
-        if self.impressions > 0:
-            self.click_through_rate = (self.clicks/self.impressions) * 100
-        else:
-            self.click_through_rate = 0
-        self.save()
+    def increment_click(self):
+        self._increment(clicks=1)
 
     def increment_impression(self):
-        self.impressions += 1
-        self.save()
-        self._update_click_through_rate()
+        self._increment(impressions=1)
+
+    def _increment(self, **amounts):
+        #Un solo UPDATE atomico, luego se leen los valores nuevos (RETURNING)
+        fields = list(amounts) + ["click_through_rate"]
+        rows = PostAnalytics.objects.filter(pk=self.pk).increment(returning=fields, **amounts)
+        if rows:
+            for field, value in zip(fields, rows[0]):
+                setattr(self, field, value)
 
     def increment_view(self, ip_address):
         #ip_address = get_client_ip(request)
-        if not PostView.objects.filter(post=self.post, ip_address=ip_address).exists():
-            PostView.objects.create(post=self.post, ip_address=ip_address)
-            self.views +=1
-            self.save()
+        _, created = PostView.objects.get_or_create(post=self.post, ip_address=ip_address)
+        if created:
+            #Igual que CategoryAnalytics: el total y los rollups por hora/dia juntos
+            from .counters import apply_counter_deltas
+            apply_counter_deltas(PostAnalytics, "post", {self.post_id: 1}, "views")
+
+class AnalyticsRollup(models.Model):
+    """Contadores por hora y por dia (apps/blog/rollups.py). La clave unica incluye
+    el bucket para poder particionar la tabla por rango de fechas"""
+    period_options = (
+        ('hour','Hour'),
+        ('day','Day'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    period = models.CharField(max_length=4, choices=period_options)
+    #Inicio de la hora o del dia (UTC)
+    bucket = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+    impressions = models.PositiveIntegerField(default=0)
+    clicks = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class PostAnalyticsRollup(AnalyticsRollup):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='analytics_rollups')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["post", "period", "bucket"], name="unique_post_rollup_bucket"),
+        ]
+        indexes = [
+            #Retencion: borrar los buckets por hora antiguos
+            models.Index(fields=["period", "bucket"], name="blog_post_rollup_bucket_idx"),
+        ]
+
+class CategoryAnalyticsRollup(AnalyticsRollup):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='analytics_rollups')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "period", "bucket"], name="unique_category_rollup_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["period", "bucket"], name="blog_cat_rollup_bucket_idx"),
+        ]
 
 class Heading(models.Model):
     """Crear una clase que permita crear un menu html del post"""
@@ -224,7 +423,34 @@ def create_post_analytics(sender, instance, created, **kwargs):
     if created:
         PostAnalytics.objects.create(post=instance)
 
+@receiver(post_save, sender=Post)
+def sync_post_headings(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if not raw and (update_fields is None or "toc" in update_fields):
+        instance.sync_headings(created)
+
 @receiver(post_save, sender=Category)
 def create_category_analytics(sender, instance, created, **kwargs):
     if created:
-        CategoryAnalytics.objects.create(category=instance)
\ No newline at end of file
+        CategoryAnalytics.objects.create(category=instance)
+
+#Borrar del cache solo las entradas que contienen el objeto modificado. Despues del
+#commit: antes, un fallo concurrente recalcularia la entrada con la fila anterior
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_cache(sender, instance, **kwargs):
+    tags = (f"post:{instance.id}", POST_LIST_TAG)
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+@receiver([post_save, post_delete], sender=Heading)
+def invalidate_heading_cache(sender, instance, **kwargs):
+    tag = f"post:{instance.post_id}"
+    transaction.on_commit(lambda: invalidate_tags(tag))
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    tags = (f"category:{instance.id}", CATEGORY_LIST_TAG)
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+@receiver([post_save, post_delete], sender=Media)
+def invalidate_media_cache(sender, instance, **kwargs):
+    tag = f"media:{instance.id}"
+    transaction.on_commit(lambda: invalidate_tags(tag))
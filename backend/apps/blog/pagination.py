@@ -0,0 +1,63 @@
+"""Paginacion en la base de datos: solo se consultan y serializan los elementos de
+la pagina pedida. Por defecto se usa paginacion por cursor (keyset), con el
+parametro "p" se mantiene la paginacion por numero de pagina (LIMIT/OFFSET)"""
+from django.conf import settings
+from rest_framework import status
+from rest_framework.pagination import CursorPagination
+from rest_framework_api.pagination import CustomPagination
+from rest_framework_api.serializers import APIResponseSerializer
+
+from core.timing import timed
+
+
+class KeysetPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = "page_size"
+
+    def __init__(self, ordering):
+        #El primer campo es la posicion del cursor, el resto desempata
+        self.ordering = ordering
+        self.max_page_size = getattr(settings, "MAX_PAGE_SIZE", 100)
+
+
+def paginate_queryset(request, queryset, serializer_class, ordering):
+    """Retorna (datos de la respuesta con el formato de StandardAPIView.paginate,
+    objetos de la pagina)"""
+    #Aplicar el plan de consultas del serializer (select_related/prefetch_related/only)
+    if hasattr(serializer_class, "setup_queryset"):
+        queryset = serializer_class.setup_queryset(queryset)
+    if CustomPagination.page_query_param in request.query_params:
+        paginator = CustomPagination()
+        paginator.page_size = paginator._get_page_size(request)
+        page = paginator.paginate_queryset(queryset.order_by(*ordering), request)
+        count = paginator.page.paginator.count
+    else:
+        paginator = KeysetPagination(ordering)
+        page = paginator.paginate_queryset(queryset, request)
+        count = queryset.count()
+
+    return _response_data(serializer_class, page, count, paginator), page
+
+
+def paginate_ranking(request, ranking, serializer_class):
+    """Igual que paginate_queryset para un ranking de redis (rankings.RankedPosts),
+    siempre por numero de pagina porque los puntajes cambian entre requests"""
+    if hasattr(serializer_class, "setup_queryset"):
+        ranking.queryset = serializer_class.setup_queryset(ranking.queryset)
+    paginator = CustomPagination()
+    paginator.page_size = paginator._get_page_size(request)
+    page = paginator.paginate_queryset(ranking, request)
+    return _response_data(serializer_class, page, paginator.page.paginator.count, paginator), page
+
+
+def _response_data(serializer_class, page, count, paginator):
+    with timed("serialize"):
+        serializer = APIResponseSerializer({
+            "success": True,
+            "status": status.HTTP_200_OK,
+            "results": serializer_class(page, many=True).data,
+            "count": count,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+        })
+        return serializer.data
@@ -0,0 +1,164 @@
+"""Rankings de posts en sorted sets de redis: vistas y clicks de siempre, y un
+"trending" con decaimiento exponencial.
+
+El trending no se reescala con el tiempo: cada evento suma 2^((t - inicio) / vida media)
+asi los eventos recientes pesan mas y el orden es el mismo que si todos los puntajes
+decayeran. Para que los puntajes no crezcan sin limite se usa una clave por periodo de
+PERIOD_HALF_LIVES vidas medias, al empezar un periodo se copian los puntajes anteriores
+reescalados (carry_trending)"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+VIEWS_KEY = "post:ranking:views"
+CLICKS_KEY = "post:ranking:clicks"
+TRENDING_PREFIX = "post:ranking:trending"
+#Un click indica mas interes que una vista
+TRENDING_CLICK_WEIGHT = 3.0
+#Dentro de un periodo el peso de un evento llega como maximo a 2^32
+PERIOD_HALF_LIVES = 32
+#ZADD de la reconciliacion por pipeline
+BATCH_SIZE = 10000
+
+
+def half_life():
+    return getattr(settings, "BLOG_TRENDING_HALF_LIFE", 60 * 60 * 24)
+
+
+def trending_period(now=None):
+    return int((time.time() if now is None else now) // (half_life() * PERIOD_HALF_LIVES))
+
+
+def trending_key(period):
+    return f"{TRENDING_PREFIX}:{period}"
+
+
+def trending_weight(now, period):
+    start = period * half_life() * PERIOD_HALF_LIVES
+    return 2 ** ((now - start) / half_life())
+
+
+def ranking_key(redis_client, sorting, now=None):
+    """Sorted set de cada sorting de PostListView, None si no tiene ranking"""
+    if sorting == "most_viewed":
+        return VIEWS_KEY
+    if sorting == "most_clicked":
+        return CLICKS_KEY
+    if sorting == "trending":
+        return carry_trending(redis_client, trending_period(now))
+    return None
+
+
+def add_events(pipe, views=None, clicks=None, now=None):
+    """Agrega al pipeline los ZINCRBY de {post_id: cantidad}, no lo ejecuta"""
+    now = time.time() if now is None else now
+    period = trending_period(now)
+    weight = trending_weight(now, period)
+    for key, counts, trending in ((VIEWS_KEY, views, 1.0), (CLICKS_KEY, clicks, TRENDING_CLICK_WEIGHT)):
+        for post_id, amount in (counts or {}).items():
+            pipe.zincrby(key, amount, str(post_id))
+            pipe.zincrby(trending_key(period), amount * trending * weight, str(post_id))
+    #El periodo anterior se necesita para copiar sus puntajes al empezar el siguiente
+    pipe.expire(trending_key(period), int(half_life() * PERIOD_HALF_LIVES * 2))
+
+
+def record(redis_client, views=None, clicks=None, now=None):
+    if not views and not clicks:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    add_events(pipe, views, clicks, now)
+    pipe.execute()
+
+
+def carry_trending(redis_client, period):
+    """Suma al periodo actual los puntajes del anterior reescalados, una sola vez por
+    periodo. Retorna la clave del periodo"""
+    key = trending_key(period)
+    if redis_client.set(f"{key}:carried", 1, nx=True, ex=int(half_life() * PERIOD_HALF_LIVES * 2)):
+        redis_client.zunionstore(key, {key: 1, trending_key(period - 1): 2 ** -PERIOD_HALF_LIVES})
+    return key
+
+
+class RankedPosts:
+    """Secuencia para el Paginator de django: count() con ZCARD y cada pagina con
+    ZREVRANGE y una sola consulta de los posts por id"""
+
+    def __init__(self, redis_client, key, queryset):
+        self.redis_client = redis_client
+        self.key = key
+        self.queryset = queryset
+
+    def count(self):
+        return self.redis_client.zcard(self.key)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        if index.stop is not None and index.stop <= start:
+            return []
+        stop = -1 if index.stop is None else index.stop - 1
+        ids = [uuid.UUID(post_id.decode("utf-8")) for post_id in self.redis_client.zrevrange(self.key, start, stop)]
+        posts = self.queryset.in_bulk(ids)
+        missing = [str(post_id) for post_id in ids if post_id not in posts]
+        if missing:
+            #Borrados o despublicados desde la ultima reconciliacion
+            self.redis_client.zrem(self.key, *missing)
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+def reconcile(redis_client, pending_clicks_key=None):
+    """Reconstruye los rankings de vistas y clicks desde PostAnalytics (solo posts
+    publicados, con 0 los que no tienen analiticas) y quita del trending los posts
+    que ya no estan publicados. Retorna la cantidad de posts"""
+    pending = {}
+    if pending_clicks_key:
+        #Clicks que todavia no se sincronizaron con la base de datos
+        pending = {post_id.decode("utf-8"): int(amount)
+                   for post_id, amount in redis_client.hgetall(pending_clicks_key).items()}
+    views_tmp, clicks_tmp = f"{VIEWS_KEY}:rebuild", f"{CLICKS_KEY}:rebuild"
+    redis_client.delete(views_tmp, clicks_tmp)
+
+    rows = (Post.postobjects.order_by()
+            .values_list("id", "post_analytics__views", "post_analytics__clicks")
+            .iterator(chunk_size=BATCH_SIZE))
+    total = 0
+    views, clicks = {}, {}
+    for post_id, post_views, post_clicks in rows:
+        post_id = str(post_id)
+        views[post_id] = post_views or 0
+        clicks[post_id] = (post_clicks or 0) + pending.get(post_id, 0)
+        if len(views) >= BATCH_SIZE:
+            total += _write(redis_client, views_tmp, views, clicks_tmp, clicks)
+            views, clicks = {}, {}
+    if views:
+        total += _write(redis_client, views_tmp, views, clicks_tmp, clicks)
+
+    key = carry_trending(redis_client, trending_period())
+    pipe = redis_client.pipeline(transaction=True)
+    if total:
+        #Peso 0 para las vistas: solo se usa para quitar los posts no publicados
+        pipe.zinterstore(key, {key: 1, views_tmp: 0})
+        pipe.rename(views_tmp, VIEWS_KEY)
+        pipe.rename(clicks_tmp, CLICKS_KEY)
+    else:
+        pipe.delete(key, VIEWS_KEY, CLICKS_KEY)
+    pipe.execute()
+    return total
+
+
+def _write(redis_client, views_key, views, clicks_key, clicks):
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zadd(views_key, views)
+    pipe.zadd(clicks_key, clicks)
+    pipe.execute()
+    return len(views)
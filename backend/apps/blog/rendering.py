@@ -0,0 +1,107 @@
+"""Cache de respuestas ya renderizadas: cada pagina de un listado se guarda como el
+JSON compacto (opcionalmente comprimido) que se envia al cliente, asi en un acierto
+no se deserializa ni se vuelve a renderizar"""
+import copy
+import hashlib
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, QueryDict
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from core.timing import timed
+
+from .caching import get_or_compute, aget_or_compute
+
+#Unicos parametros que cambian una pagina de los listados, los demas se ignoran para
+#que no se pueda crear una entrada nueva del cache con cualquier parametro extra
+PAGE_PARAMS = ("search", "sorting", "ordering", "p", "page_size", "cursor")
+
+
+def cached_page_response(request, cache_key, compute):
+    """Retorna (respuesta, ids de los elementos de la pagina) de un listado paginado.
+    compute(page_request) -> (datos de la pagina, tags), igual que en get_or_compute.
+    page_request (ver page_request) es el que se debe paginar"""
+    normalized = page_request(request)
+    page_key = _page_key(normalized, cache_key)
+    if not getattr(settings, "BLOG_CACHE_RENDERED_JSON", True):
+        data = get_or_compute(page_key, lambda: compute(normalized))
+        return Response(data), _page_ids(data)
+
+    codec, body, ids = get_or_compute(page_key, lambda: _render_page(lambda: compute(normalized)))
+    response = HttpResponse(decompress(codec, body), content_type="application/json")
+    return response, ids
+
+
+async def acached_page_response(request, cache_key, compute):
+    """Version para las vistas async, compute() es sincrono (paginacion y serializers de
+    DRF) y solo se ejecuta en un hilo cuando la pagina no esta en cache"""
+    normalized = page_request(request)
+    page_key = _page_key(normalized, cache_key)
+    if not getattr(settings, "BLOG_CACHE_RENDERED_JSON", True):
+        data = await aget_or_compute(page_key, sync_to_async(lambda: compute(normalized)))
+        return HttpResponse(JSONRenderer().render(data), content_type="application/json"), _page_ids(data)
+
+    codec, body, ids = await aget_or_compute(
+        page_key, sync_to_async(lambda: _render_page(lambda: compute(normalized))))
+    return HttpResponse(decompress(codec, body), content_type="application/json"), ids
+
+
+def page_request(request):
+    """Request de DRF con solo los PAGE_PARAMS normalizados. La clave de la pagina y los
+    links next/previous salen de los mismos valores"""
+    http_request = getattr(request, "_request", request)
+    params = QueryDict(mutable=True)
+    for name in PAGE_PARAMS:
+        value = http_request.GET.get(name, "").strip()
+        if name in ("p", "page_size"):
+            value = str(int(value)) if value.isdigit() and int(value) > 0 else ""
+        if name == "page_size" and value:
+            value = str(min(int(value), getattr(settings, "MAX_PAGE_SIZE", 100)))
+        if value:
+            params[name] = value
+    normalized = copy.copy(http_request)
+    normalized.GET = params
+    normalized.META = {**http_request.META, "QUERY_STRING": params.urlencode()}
+    return Request(normalized)
+
+
+def _page_key(request, cache_key):
+    #La ruta y los parametros normalizados, no el Host ni otros parametros: los links
+    #next/previous guardados usan el host (de ALLOWED_HOSTS) del request que los calculo
+    url = f"{request.path}?{request.query_params.urlencode()}"
+    return f"{cache_key}:page:{hashlib.md5(url.encode('utf-8')).hexdigest()}"
+
+
+def _render_page(compute):
+    data, tags = compute()
+    with timed("render"):
+        codec, body = compress(JSONRenderer().render(data))
+    return (codec, body, _page_ids(data)), tags
+
+
+def _page_ids(data):
+    return [str(item["id"]) for item in data["results"]]
+
+
+def compress(body):
+    """Comprime el JSON segun BLOG_CACHE_COMPRESSION: None, "zlib" o "zstd" (zstandard)"""
+    codec = getattr(settings, "BLOG_CACHE_COMPRESSION", "zlib")
+    if codec == "zlib":
+        return codec, zlib.compress(body, 6)
+    if codec == "zstd":
+        import zstandard
+        return codec, zstandard.ZstdCompressor(level=3).compress(body)
+    return None, body
+
+
+def decompress(codec, body):
+    if codec == "zlib":
+        return zlib.decompress(body)
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
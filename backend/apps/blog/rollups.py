@@ -0,0 +1,105 @@
+"""Analiticas por hora y por dia. apply_counter_deltas suma cada lote de vistas,
+impresiones y clicks tambien a los buckets de la hora y del dia actuales con
+INSERT ... ON CONFLICT DO UPDATE, asi un reporte de 30 dias lee 30 filas por post
+en lugar de agregar las filas PostView.
+
+prune() borra las filas PostView/CategoryView antiguas (ya estan contadas en los
+rollups) y los buckets por hora que ya no se consultan"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now
+
+from .models import (PostAnalytics, CategoryAnalytics, PostAnalyticsRollup, CategoryAnalyticsRollup,
+                     PostView, CategoryView)
+
+PERIODS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+COUNTERS = ("views", "impressions", "clicks")
+ROLLUP_MODELS = {
+    PostAnalytics: PostAnalyticsRollup,
+    CategoryAnalytics: CategoryAnalyticsRollup,
+}
+#Filas que se borran por consulta en la retencion
+PRUNE_BATCH_SIZE = 5000
+
+
+def truncate(timestamp, period):
+    hour = timestamp.replace(minute=0, second=0, microsecond=0)
+    return hour if period == "hour" else hour.replace(hour=0)
+
+
+def record_rollups(analytics_model, related_field, deltas, counter, timestamp=None):
+    """Suma los deltas {id: cantidad} al contador de los buckets de la hora y del dia"""
+    rollup_model = ROLLUP_MODELS.get(analytics_model)
+    if rollup_model is None or not deltas:
+        return
+    timestamp = timestamp or now()
+    opts = rollup_model._meta
+    fields = [opts.get_field(name) for name in ("id", related_field, "period", "bucket", *COUNTERS)]
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(field.column) for field in fields)
+    conflict = ", ".join(qn(field.column) for field in fields[1:4])
+    column = qn(opts.get_field(counter).column)
+    sql = (f"INSERT INTO {qn(opts.db_table)} AS r ({columns}) VALUES %s "
+           f"ON CONFLICT ({conflict}) DO UPDATE SET {column} = r.{column} + EXCLUDED.{column}")
+
+    rows = []
+    for object_id, amount in deltas.items():
+        counts = [amount if name == counter else 0 for name in COUNTERS]
+        for period in PERIODS:
+            values = (uuid.uuid4(), object_id, period, truncate(timestamp, period), *counts)
+            rows.append([field.get_db_prep_save(value, connection) for field, value in zip(fields, values)])
+    placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    batch_size = connection.ops.bulk_batch_size(fields, rows) or len(rows)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            cursor.execute(sql % ", ".join([placeholder] * len(chunk)), [value for row in chunk for value in row])
+
+
+def series(rollup_model, related_field, object_id, period="day", length=30, end=None):
+    """Serie de tiempo de los ultimos `length` buckets hasta `end` (incluido):
+    [{bucket, views, impressions, clicks}], con ceros en los buckets sin datos"""
+    last = truncate(end or now(), period)
+    first = last - PERIODS[period] * (length - 1)
+    rows = {
+        row["bucket"]: row for row in
+        rollup_model.objects.filter(**{related_field: object_id}, period=period, bucket__gte=first, bucket__lte=last)
+        .values("bucket", *COUNTERS)
+    }
+    data = []
+    for index in range(length):
+        bucket = first + PERIODS[period] * index
+        row = rows.get(bucket, {})
+        data.append({"bucket": bucket.isoformat(), **{counter: row.get(counter, 0) for counter in COUNTERS}})
+    return data
+
+
+def prune(at=None):
+    """Borra por lotes las vistas crudas anteriores a BLOG_RAW_VIEWS_RETENTION_DAYS y los
+    buckets por hora anteriores a BLOG_HOURLY_ROLLUP_RETENTION_DAYS. Retorna {modelo: filas}.
+    Con BLOG_UNIQUE_VIEWS = "exact" una IP vuelve a contar como vista nueva despues de
+    la retencion"""
+    at = at or now()
+    raw_cutoff = at - timedelta(days=getattr(settings, "BLOG_RAW_VIEWS_RETENTION_DAYS", 90))
+    hourly_cutoff = at - timedelta(days=getattr(settings, "BLOG_HOURLY_ROLLUP_RETENTION_DAYS", 14))
+    deleted = {}
+    for model, filters in ((PostView, {"timestamp__lt": raw_cutoff}),
+                           (CategoryView, {"timestamp__lt": raw_cutoff}),
+                           (PostAnalyticsRollup, {"period": "hour", "bucket__lt": hourly_cutoff}),
+                           (CategoryAnalyticsRollup, {"period": "hour", "bucket__lt": hourly_cutoff})):
+        deleted[model.__name__] = _delete_in_batches(model.objects.filter(**filters))
+    return deleted
+
+
+def _delete_in_batches(queryset):
+    #Lotes cortos para no bloquear la tabla con un solo DELETE enorme
+    total = 0
+    while True:
+        ids = list(queryset.values_list("pk", flat=True)[:PRUNE_BATCH_SIZE])
+        if not ids:
+            return total
+        queryset.model.objects.filter(pk__in=ids).delete()
+        total += len(ids)
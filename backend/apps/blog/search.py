@@ -0,0 +1,221 @@
+"""Busqueda de texto completo de posts y categorias.
+- PostgreSQL: columna search_vector (tsvector) desnormalizada que se actualiza al
+  guardar, con indice GIN y resultados ordenados por SearchRank
+- Otras bases de datos (SQLite en desarrollo/tests): indice invertido en memoria del
+  proceso, se construye en la primera busqueda y se mantiene con las señales"""
+import html
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict, Counter
+from operator import itemgetter
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, connections
+from django.db.models import Value, F, FloatField, Func
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+
+#Pesos por defecto de ts_rank para A, B, C y D
+WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.2, "D": 0.1}
+TAG_RE = re.compile(r"<[^>]+>")
+TOKEN_RE = re.compile(r"\w+")
+
+
+def uses_postgres():
+    return connection.vendor == "postgresql"
+
+
+def search_config():
+    return getattr(settings, "BLOG_SEARCH_CONFIG", "simple")
+
+
+def tokenize(text):
+    """Palabras en minusculas y sin acentos, sin etiquetas HTML"""
+    if not text:
+        return []
+    text = html.unescape(TAG_RE.sub(" ", text))
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in TOKEN_RE.findall(text) if len(token) > 1]
+
+
+class InvertedIndex:
+    """Indice invertido token -> {id: puntaje}, el puntaje de un documento es la suma
+    de los pesos de los campos en los que aparece cada palabra"""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+
+    def add(self, pk, texts):
+        """texts: [(texto, peso)]"""
+        self.remove(pk)
+        scores = Counter()
+        for text, weight in texts:
+            for token in tokenize(text):
+                scores[token] += WEIGHTS[weight]
+        for token, score in scores.items():
+            self.postings[token][pk] = score
+        self.documents[pk] = list(scores)
+
+    def remove(self, pk):
+        for token in self.documents.pop(pk, ()):
+            postings = self.postings[token]
+            postings.pop(pk, None)
+            if not postings:
+                del self.postings[token]
+
+    def search(self, query, limit, include=None):
+        """Documentos que contienen todas las palabras, los `limit` mejores como [(id, rank)].
+        include(ids) -> ids filtra los candidatos antes de cortar en `limit`"""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        postings = [self.postings.get(token, {}) for token in tokens]
+        postings.sort(key=len)
+        if not postings[0]:
+            return []
+        #Se intersecta empezando por la lista mas corta
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates.intersection_update(other)
+            if not candidates:
+                return []
+        if include is not None:
+            candidates = include(candidates)
+            if not candidates:
+                return []
+
+        total = len(self.documents)
+        idf = [math.log(1 + total / len(posting)) for posting in postings]
+        scores = ((pk, sum(posting[pk] * weight for posting, weight in zip(postings, idf)))
+                  for pk in candidates)
+        return heapq.nlargest(limit, scores, key=itemgetter(1))
+
+
+class SearchIndex:
+    def __init__(self, model_label, fields):
+        #fields: {campo: peso de ts_rank}
+        self.model_label = model_label
+        self.fields = fields
+        self._memory = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def vector(self):
+        """Expresion SearchVector ponderada de los campos (sin etiquetas HTML)"""
+        vector = None
+        for field, weight in self.fields.items():
+            text = Func(F(field), Value("<[^>]+>"), Value(" "), Value("g"), function="regexp_replace")
+            part = SearchVector(text, weight=weight, config=search_config())
+            vector = part if vector is None else vector + part
+        return vector
+
+    def search(self, queryset, query):
+        """Filtra el queryset con la busqueda y agrega la anotacion `rank`"""
+        if uses_postgres():
+            search_query = SearchQuery(query, search_type="websearch", config=search_config())
+            return queryset.filter(search_vector=search_query).annotate(
+                rank=SearchRank(F("search_vector"), search_query))
+
+        limit = getattr(settings, "BLOG_SEARCH_MAX_RESULTS", 500)
+        #El indice tiene todos los objetos (borradores incluidos), se corta en `limit`
+        #solo entre los que estan en el queryset
+        ranked = self.memory().search(
+            query, limit, include=lambda pks: set(queryset.filter(pk__in=pks).values_list("pk", flat=True)))
+        if not ranked:
+            return queryset.none().annotate(rank=Value(0.0, output_field=FloatField()))
+        #CASE simple en SQL crudo: compilar miles de When() es mas lento que la consulta
+        opts = queryset.model._meta
+        qn = connection.ops.quote_name
+        column = f"{qn(opts.db_table)}.{qn(opts.pk.column)}"
+        params = []
+        for pk, rank in ranked:
+            params.extend([opts.pk.get_db_prep_value(pk, connection), rank])
+        rank = RawSQL(f"CASE {column} {' '.join(['WHEN %s THEN %s'] * len(ranked))} ELSE 0 END", params,
+                      output_field=FloatField())
+        return queryset.filter(pk__in=[pk for pk, _ in ranked]).annotate(rank=rank)
+
+    def update(self, instance):
+        if uses_postgres():
+            self.model.objects.filter(pk=instance.pk).update(search_vector=self.vector())
+        elif self._memory is not None:
+            with self._lock:
+                self._memory.add(instance.pk, self._texts(instance))
+
+    def remove(self, pk):
+        if self._memory is not None:
+            with self._lock:
+                self._memory.remove(pk)
+
+    def rebuild(self):
+        """Recalcula el indice completo (por ejemplo despues de un bulk_create)"""
+        if uses_postgres():
+            return self.model.objects.update(search_vector=self.vector())
+        with self._lock:
+            self._memory = self._build()
+            return len(self._memory.documents)
+
+    def memory(self):
+        if self._memory is None:
+            with self._lock:
+                if self._memory is None:
+                    self._memory = self._build()
+        return self._memory
+
+    def _build(self):
+        index = InvertedIndex()
+        fields = list(self.fields)
+        rows = self.model.objects.values_list("pk", *fields).iterator(chunk_size=2000)
+        for pk, *values in rows:
+            index.add(pk, list(zip(values, self.fields.values())))
+        return index
+
+    def _texts(self, instance):
+        return [(getattr(instance, field), weight) for field, weight in self.fields.items()]
+
+
+post_index = SearchIndex("blog.Post", {"title": "A", "keywords": "A", "description": "B", "content": "C"})
+category_index = SearchIndex("blog.Category", {"name": "A", "title": "A", "slug": "B", "description": "B"})
+INDEXES = {"blog.Post": post_index, "blog.Category": category_index}
+
+
+@receiver(post_save, dispatch_uid="blog_search_update")
+def update_search_index(sender, instance, raw=False, **kwargs):
+    index = INDEXES.get(sender._meta.label)
+    if index is not None and not raw:
+        index.update(instance)
+
+
+@receiver(post_delete, dispatch_uid="blog_search_remove")
+def remove_search_index(sender, instance, **kwargs):
+    index = INDEXES.get(sender._meta.label)
+    if index is not None:
+        index.remove(instance.pk)
+
+
+@receiver(post_migrate, dispatch_uid="blog_search_gin_indexes")
+def create_gin_indexes(sender, using="default", **kwargs):
+    """El indice GIN solo existe en PostgreSQL, se crea aqui para que el modelo siga
+    funcionando con SQLite"""
+    if sender.label != "blog":
+        return
+    db = connections[using]
+    if db.vendor != "postgresql":
+        return
+    with db.cursor() as cursor:
+        for index in INDEXES.values():
+            table = index.model._meta.db_table
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_search_vector_gin "
+                f"ON {db.ops.quote_name(table)} USING gin (search_vector)"
+            )
@@ -0,0 +1,185 @@
+"""Datos falsos para pruebas de carga (python manage.py seed_blog). Todo se crea con
+bulk_create por lotes, sin las señales de save(): las analiticas, los headings y
+path/depth de las categorias se calculan aqui.
+
+Cada fila se genera con un random.Random propio derivado de (semilla, tipo, indice),
+asi la misma semilla produce los mismos ids y textos sin importar el tamaño de los
+lotes ni la cantidad de procesos"""
+import random
+import uuid
+from datetime import timedelta
+from functools import lru_cache
+
+from django.db import transaction
+from django.utils.text import slugify
+from faker import Faker
+
+from .models import Category, CategoryAnalytics, Post, PostAnalytics, PostView, Heading
+from ..media.models import Media
+
+NAMESPACE = uuid.UUID("5b0f7c7e-8e1a-4c4e-9a57-2f1d1c6f3b10")
+#Lorem de Faker, se arma el texto con random en lugar de llamar a Faker por fila
+WORDS = Faker().get_words_list()
+#Oraciones precalculadas por semilla para armar los parrafos
+SENTENCE_POOL_SIZE = 4096
+
+
+def seed_uuid(seed, kind, index):
+    """Id determinista de la fila `index` del tipo `kind` ("post", "category", "media")"""
+    return uuid.uuid5(NAMESPACE, f"{seed}:{kind}:{index}")
+
+
+def row_random(seed, kind, index):
+    return random.Random(f"{seed}:{kind}:{index}")
+
+
+def row_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def sentence(rng, words):
+    return " ".join(rng.choices(WORDS, k=words)).capitalize()
+
+
+@lru_cache(maxsize=4)
+def sentence_pool(seed):
+    return [sentence(row_random(seed, "sentence", index), 6 + index % 9) + "."
+            for index in range(SENTENCE_POOL_SIZE)]
+
+
+def paragraph(rng, seed, sentences):
+    return " ".join(rng.choices(sentence_pool(seed), k=sentences))
+
+
+def bulk_insert_raw(model, objs, batch_size=1000):
+    """bulk_create que conserva la fecha de cada fila en los campos auto_now_add.
+    Un INSERT raw (como loaddata) no llama a pre_save, asi no se modifica el campo
+    compartido del modelo mientras otros hilos guardan"""
+    fields = model._meta.concrete_fields
+    for start in range(0, len(objs), batch_size):
+        model._base_manager._insert(objs[start:start + batch_size], fields=fields, raw=True)
+
+
+def build_categories(seed, count, max_depth):
+    """Categorias con subcategorias hasta max_depth niveles, con path y depth ya calculados"""
+    categories = []
+    #Categorias que todavia pueden tener hijos, en orden de creacion
+    parents = []
+    for index in range(count):
+        rng = row_random(seed, "category", index)
+        #Cerca de un tercio son raices, el resto cuelga de una categoria anterior
+        parent = rng.choice(parents) if parents and rng.random() > 0.3 else None
+        name = sentence(rng, rng.randint(1, 3))
+        category_id = seed_uuid(seed, "category", index)
+        path = f"{parent.path if parent else '/'}{category_id.hex}/"
+        categories.append(Category(
+            id=category_id, parent=parent, name=name, title=name, description=sentence(rng, 12),
+            slug=f"{slugify(name)[:100]}-{seed}-{index}", path=path, depth=path.count("/") - 2,
+        ))
+        if categories[-1].depth < max_depth - 1:
+            parents.append(categories[-1])
+    return categories
+
+
+def seed_categories(seed, count, max_depth):
+    categories = build_categories(seed, count, max_depth)
+    analytics = []
+    for index, category in enumerate(categories):
+        rng = row_random(seed, "category-analytics", index)
+        analytics.append(CategoryAnalytics(id=row_uuid(rng), category=category, **counters(rng)))
+    with transaction.atomic():
+        Category.objects.bulk_create(categories, batch_size=1000)
+        CategoryAnalytics.objects.bulk_create(analytics, batch_size=1000)
+    return len(categories)
+
+
+def counters(rng):
+    views = rng.randint(0, 1000)
+    impressions = views + rng.randint(0, 2000)
+    clicks = rng.randint(0, views)
+    return {
+        "views": views, "impressions": impressions, "clicks": clicks,
+        "click_through_rate": clicks * 100.0 / impressions if impressions else 0.0,
+        "avg_time_on_page": round(rng.uniform(10, 300), 2) if views else 0.0,
+        "time_on_page_samples": views,
+    }
+
+
+def seed_media(seed, start, count):
+    media = []
+    for index in range(start, start + count):
+        rng = row_random(seed, "media", index)
+        media.append(Media(
+            id=seed_uuid(seed, "media", index), order=0, name=f"{slugify(sentence(rng, 2))}-{index}.jpg",
+            size=str(rng.randint(20_000, 2_000_000)), type="image/jpeg",
+            key=f"media/seed-{seed}/{index}.jpg", media_type="image",
+        ))
+    Media.objects.bulk_create(media, batch_size=1000)
+    return {"media": len(media)}
+
+
+def build_post(seed, index, options):
+    """Post con contenido en secciones (h2/h3) y su tabla de contenido"""
+    rng = row_random(seed, "post", index)
+    title = sentence(rng, rng.randint(4, 10))
+    sections, toc = [], []
+    for order in range(1, rng.randint(2, 5) + 1):
+        level = rng.choice((2, 2, 3))
+        heading = sentence(rng, rng.randint(2, 6))
+        #Con el id como ancla la tabla es la misma que calcularia extract_headings al guardar
+        slug = f"{slugify(heading)}-{order}"
+        toc.append({"title": heading, "slug": slug, "level": level, "order": order})
+        sections.append(f'<h{level} id="{slug}">{heading}</h{level}>'
+                        f"<p>{paragraph(rng, seed, rng.randint(3, 6))}</p>")
+    content = "".join(sections)
+    created_at = options["end"] - timedelta(seconds=rng.randint(0, options["days"] * 86400))
+    media = options["media"]
+    post = Post(
+        id=seed_uuid(seed, "post", index), title=title[:128], description=sentence(rng, 12)[:256],
+        content=content, toc=toc, keywords=", ".join(rng.sample(WORDS, 5))[:128],
+        slug=f"{slugify(title)[:100]}-{seed}-{index}",
+        category_id=seed_uuid(seed, "category", rng.randrange(options["categories"])),
+        thumbnail_id=seed_uuid(seed, "media", rng.randrange(media)) if media else None,
+        status="draft" if rng.random() < options["draft_ratio"] else "published",
+        created_at=created_at,
+    )
+    return post, rng
+
+
+def seed_posts(seed, start, count, options):
+    """Crea los posts [start, start + count) con sus headings, analiticas y vistas"""
+    posts, headings, analytics, views = [], [], [], []
+    for index in range(start, start + count):
+        post, rng = build_post(seed, index, options)
+        posts.append(post)
+        headings.extend(Heading(id=row_uuid(rng), post_id=post.id, **heading) for heading in post.toc)
+        values = counters(rng)
+        #Vistas crudas unicas por IP: una muestra, el contador viene de las analiticas
+        sample = rng.randint(0, options["views_per_post"] * 2)
+        for address in rng.sample(range(1 << 24), min(sample, values["views"])):
+            seconds = rng.randint(0, max(int((options["end"] - post.created_at).total_seconds()), 0))
+            views.append(PostView(id=row_uuid(rng), post_id=post.id, ip_address=
+                                  f"10.{address >> 16}.{(address >> 8) & 255}.{address & 255}",
+                                  timestamp=post.created_at + timedelta(seconds=seconds)))
+        analytics.append(PostAnalytics(id=row_uuid(rng), post_id=post.id, **values))
+
+    with transaction.atomic():
+        Post.objects.bulk_create(posts, batch_size=1000)
+        Heading.objects.bulk_create(headings, batch_size=1000)
+        PostAnalytics.objects.bulk_create(analytics, batch_size=1000)
+        bulk_insert_raw(PostView, views)
+    return {"posts": len(posts), "headings": len(headings), "views": len(views)}
+
+
+def run_chunk(task):
+    """Punto de entrada de cada proceso: (tipo, semilla, inicio, cantidad, opciones)"""
+    kind, seed, start, count, options = task
+    if kind == "media":
+        return seed_media(seed, start, count)
+    return seed_posts(seed, start, count, options)
+
+
+def init_worker():
+    #Con spawn el proceso empieza sin django configurado, con fork no hace nada
+    import django
+    django.setup()
@@ -1,17 +1,42 @@
 from rest_framework import serializers
 from .models import Post,Category,Heading,PostView,PostAnalytics
-from ..media.serializers import MediaSerializer
+from ..media.serializers import MediaSerializer, SignedMediaListSerializer
+
+
+class QueryPlanMixin:
+    """Cada serializer declara las relaciones y columnas que lee, las vistas aplican
+    el plan con setup_queryset para no hacer una consulta por objeto (N+1)"""
+    select_related = ()
+    prefetch_related = ()
+    only_fields = ()
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        if cls.select_related:
+            queryset = queryset.select_related(*cls.select_related)
+        if cls.prefetch_related:
+            queryset = queryset.prefetch_related(*cls.prefetch_related)
+        if cls.only_fields:
+            queryset = queryset.only(*cls.only_fields)
+        return queryset
+
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = "__all___"
+        exclude = ["search_vector"]
 
-class CategoryListSerializer(serializers.ModelSerializer):
+class CategoryListSerializer(QueryPlanMixin, serializers.ModelSerializer):
     thumbnail = MediaSerializer()
+    #Las URLs de las imagenes de la lista se firman juntas
+    media_fields = ("thumbnail",)
+    select_related = ("thumbnail",)
+    only_fields = ("id", "name", "slug", "thumbnail")
     class Meta:
         model = Category
+        list_serializer_class = SignedMediaListSerializer
         fields = [
+            'id',
             'name',
             'slug',
             'thumbnail'
@@ -28,28 +53,38 @@ class HeadingSerializer(serializers.ModelSerializer):
 class PostViewSerializer(serializers.ModelSerializer):
     class Meta:
         model = PostView
-        fields = "__all___"
+        fields = "__all__"
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(QueryPlanMixin, serializers.ModelSerializer):
     category = CategorySerializer()
-    headings = HeadingSerializer(many=True)
+    #La tabla de contenido ya esta guardada en el post, no hace falta consultar Heading
+    headings = serializers.JSONField(source="toc", read_only=True)
     view_count = serializers.SerializerMethodField()
     thumbnail = MediaSerializer()
+    #category.thumbnail se usa para los tags de invalidacion de la cache
+    select_related = ("category", "category__thumbnail", "thumbnail", "post_analytics")
     class Meta:
         model = Post
-        fields = "__all__"
+        exclude = ["search_vector", "toc"]
 
     def get_view_count(self,obj):
         return obj.post_analytics.views if obj.post_analytics else 0
 
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(QueryPlanMixin, serializers.ModelSerializer):
     category = CategoryListSerializer()
     view_count = serializers.SerializerMethodField()
     thumbnail = MediaSerializer()
+    media_fields = ("thumbnail", "category.thumbnail")
+    select_related = ("category", "category__thumbnail", "thumbnail", "post_analytics")
+    #Sin content ni search_vector. created_at/updated_at son posiciones del cursor
+    only_fields = ("id", "title", "description", "slug", "created_at", "updated_at", "thumbnail",
+                   "category__id", "category__name", "category__slug", "category__thumbnail",
+                   "post_analytics__views")
 
     class Meta:
         model = Post
+        list_serializer_class = SignedMediaListSerializer
         fields = [
             "id",
             "title",
@@ -67,4 +102,4 @@ class PostListSerializer(serializers.ModelSerializer):
 class PostAnalyticsSerializer(serializers.ModelSerializer):
     class Meta:
         model = PostAnalytics
-        fields = "__all___"
+        fields = "__all__"
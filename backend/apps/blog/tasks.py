@@ -1,21 +1,28 @@
 from celery import shared_task
 import logging
-import redis
 from django.conf import settings
+from django.utils.timezone import now
 
+from core.redis_pools import LazyRedis
+
+from . import rankings, rollups
+from .clicks import post_clicks, category_clicks
+from .impressions import post_impressions, category_impressions
+from .dwell_time import post_dwell, category_dwell
+from .view_events import consume_view_events
+from .unique_views import get_unique_views, HyperLogLogUniqueViews
 from .models import PostAnalytics, Post, CategoryAnalytics, Category
 
 logger = logging.getLogger(__name__)
 
-redis_client = redis.StrictRedis(host=settings.REDIS_HOST, port=6379, db=0)
+redis_client = LazyRedis("counters")
 
 @shared_task
 def increment_post_impressions(post_id):
     """Incrementa las impressiones del post asociado"""
     logger.info("Task to: Update Post Impressions")
     try:
-        analytics, created = PostAnalytics.objects.get_or_create(post__id=post_id)
-        analytics.increment_impression()
+        PostAnalytics.objects.increment_or_create({"post_id": post_id}, impressions=1)
     except Exception as e:
         logger.info(f"Error incrementando las impresiones para el Post ID {post_id}:{str(e)}")
 
@@ -24,77 +31,86 @@ def increment_post_impressions(post_id):
 def increment_post_view_task(slug, ip_address):
     """Incrementa las vistas de un post"""
     try:
-        post = Post.objects.get(slug=slug)
-        post_analytics, _ = PostAnalytics.objects.get_or_create(post=post)
-        post_analytics.increment_view(ip_address)
+        post_id = Post.objects.values_list("id", flat=True).get(slug=slug)
+        new_views = get_unique_views(redis_client).record([(post_id, ip_address, now())])
+        rankings.record(redis_client, views=new_views)
     except Exception as e:
         logger.info(f"Error incrementing views for Post Slug {slug}:{str(e)}")
 
 
+@shared_task
+def consume_post_view_events():
+    """Procesa por lotes las vistas que PostDetailView agrega al stream de redis"""
+    processed = consume_view_events(redis_client)
+    logger.info(f"Processed {processed} post view events")
+
+
 @shared_task
 def sync_impressions_to_db():
     """Sincroniza las impresiones guardadas en redis con la base de datos de Posgress"""
-    #Obtener las claves que tenemos en redis
-    keys = redis_client.keys("post:impressions:*")
-    for key in keys:
-        try:
-            # Decodificar y extraer el ID de la categoria desde la clave redis
-            post_id = key.decode("utf-8").split(":")[-1]
-            try:
-                post = Post.objects.get(id=post_id)
-            except Post.DoesNotExist:
-                logger.info(f"Post with ID {post_id} does not exist")
-                continue
-
-            #Obtener Impresiones de Redis
-            impressions = int(redis_client.get(key))
-            if impressions == 0:
-                redis_client.delete(key)
-                continue
-
-            #Obtener y crear instancia de category analytics
-            analytics, created = PostAnalytics.objects.get_or_create(post=post)
-
-            #Incrementar impresiones
-            analytics.impressions += impressions
-            analytics.save()
-            # Actualizar la tasa de Clicks(CTR)
-            analytics._update_click_through_rate()
-            #Elimnar la clave de redis despues de sincronizar
-            redis_client.delete(key)
-        except Exception as e:
-            logger.info(f"Error syncing impressions for {key}:{str(e)}")
+    _sync_impressions(post_impressions)
+
 
 @shared_task
 def sync_category_impressions_to_db():
     """Sincroniza las impresiones guardadas en redis con la base de datos de Posgress"""
-    #Obtener las claves que tenemos en redis
-    keys = redis_client.keys("category:impressions:*")
-    for key in keys:
+    _sync_impressions(category_impressions)
+
+
+@shared_task
+def sync_clicks_to_db():
+    """Sincroniza los clicks acumulados en redis con la base de datos de Posgress"""
+    for buffer in (post_clicks, category_clicks):
+        try:
+            synced = buffer.flush(redis_client)
+            logger.info(f"Synced clicks for {synced} {buffer.analytics_model.__name__} rows")
+        except Exception as e:
+            logger.info(f"Error syncing clicks for {buffer.pending_key}:{str(e)}")
+
+
+@shared_task
+def fold_dwell_times():
+    """Agrega a avg_time_on_page los tiempos en pagina acumulados en redis"""
+    for buffer in (post_dwell, category_dwell):
         try:
-            #Decodificar y extraer el ID de la categoria desde la clave redis
-            category_id = key.decode("utf-8").split(":")[-1]
-            #Validar que la categoria existe
-            try:
-                category = Category.objects.get(id=category_id)
-            except Category.DoesNotExist:
-                logger.info(f"Category with ID {category_id} does not exist. ")
-                continue
-
-            #Obtener Impresiones de Redis
-            impressions = int(redis_client.get(key))
-            if impressions == 0:
-                redis_client.delete(key)
-                continue
-
-            #Obtener y crear instancia de category analytics
-            analytics, created = CategoryAnalytics.objects.get_or_create(category=category)
-            #Imcrementar impressiones
-            analytics.impressions += impressions
-            analytics.save()
-            #Actualizar la tasa de Clicks
-            analytics._update_click_through_rate()
-            #Eliminar la clave de redis
-            redis_client.delete(key)
+            folded = buffer.flush(redis_client)
+            logger.info(f"Folded dwell times for {folded} {buffer.analytics_model.__name__} rows")
         except Exception as e:
-            logger.info(f"Error syncing category impressions for {key}:{str(e)}")
+            logger.info(f"Error folding dwell times for {buffer.sum_key}:{str(e)}")
+
+
+@shared_task
+def materialize_unique_views():
+    """Guarda en PostAnalytics.views los visitantes unicos estimados con HyperLogLog"""
+    unique_views = get_unique_views(redis_client)
+    if isinstance(unique_views, HyperLogLogUniqueViews):
+        synced = unique_views.materialize()
+        logger.info(f"Materialized unique views for {synced} posts")
+
+
+@shared_task
+def reconcile_rankings():
+    """Reconstruye los rankings de redis (vistas, clicks, trending) desde PostAnalytics"""
+    try:
+        synced = rankings.reconcile(redis_client, post_clicks.pending_key)
+        logger.info(f"Reconciled rankings for {synced} posts")
+    except Exception as e:
+        logger.info(f"Error reconciling rankings:{str(e)}")
+
+
+@shared_task
+def prune_analytics():
+    """Borra las vistas crudas y los rollups por hora que ya pasaron su retencion"""
+    try:
+        deleted = rollups.prune()
+        logger.info(f"Pruned analytics rows: {deleted}")
+    except Exception as e:
+        logger.info(f"Error pruning analytics:{str(e)}")
+
+
+def _sync_impressions(buffer):
+    try:
+        synced = buffer.flush(redis_client)
+        logger.info(f"Synced impressions for {synced} {buffer.analytics_model.__name__} rows")
+    except Exception as e:
+        logger.info(f"Error syncing impressions for {buffer.pending_key}:{str(e)}")
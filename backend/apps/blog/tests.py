@@ -1,10 +1,73 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-from backend.apps.blog.models import Category
+import fakeredis
+import fakeredis.aioredis
+import redis
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, DatabaseError, OperationalError
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory, AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from core import redis_pools
+from core.timing import TimedRedis, ServerTimingMiddleware
+from core.db_routers import (ReplicaRouter, ReplicaStickinessMiddleware, replica_reads, mark_primary_write,
+                              STICKY_COOKIE)
+
+from .caching import set_cached, get_cached, get_or_compute, invalidate_tags, POST_LIST_TAG
+from .counters import scan_and_drain, apply_counter_deltas
+from .impressions import post_impressions
+from .category_tree import rebuild_paths
+from ..media.models import Media
+from ..media.signing import note_expiry
+from .models import Category, CategoryAnalytics, Post, PostAnalytics, Heading, PostView, PostAnalyticsRollup
+from . import rankings, rollups, view_events
+from .search import post_index, category_index
+from .tasks import (sync_clicks_to_db, reconcile_rankings, consume_post_view_events, sync_impressions_to_db,
+                    prune_analytics, fold_dwell_times)
+from .toc import extract_headings
+from .unique_views import HyperLogLogUniqueViews
+from .dwell_time import post_dwell
+from .view_events import STREAM_KEY
+from .async_views import AsyncPostListView, AsyncPostDetailView, AsyncPostHeadingView, AsyncCategoryListView
 
 
 # Create your tests here.
 
+class FakeRedisMixin:
+    """Un fakeredis por test para redis_client (vistas y tareas) y para el cache
+    (caching.get_redis_connection). El cache de django se limpia al terminar"""
+
+    def setUp(self):
+        super().setUp()
+        self.redis_server = fakeredis.FakeServer()
+        self.redis = self.make_redis(self.redis_server)
+        for target in ("apps.blog.views.redis_client", "apps.blog.tasks.redis_client"):
+            self.patch(target, self.redis)
+        self.patch("apps.blog.caching.get_redis_connection", mock.Mock(return_value=self.redis))
+        self.addCleanup(cache.clear)
+
+    @staticmethod
+    def make_redis(server):
+        return fakeredis.FakeStrictRedis(server=server)
+
+    def patch(self, target, value):
+        patcher = mock.patch(target, value)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
 class CategoryModelTest(TestCase):
     def setUp(self):
         self.category = Category.objects.create(
@@ -17,3 +80,1029 @@ class CategoryModelTest(TestCase):
     def test_category_creation(self):
         self.assertEqual(str(self.category), 'Tech')
         self.assertEqual(self.category.title, 'Tech')
+
+
+class IncrementPostClickConcurrencyTest(FakeRedisMixin, TransactionTestCase):
+    """Muchos hilos incrementando los clicks del mismo post no deben perder incrementos"""
+    threads = 8
+    clicks_per_thread = 25
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Tech", slug="tech")
+        self.post = Post.objects.create(
+            title="Post", description="Post", keywords="post", slug="post",
+            category=category, status="published"
+        )
+
+    def test_no_lost_increments(self):
+        errors = []
+
+        def hammer():
+            client = APIClient()
+            try:
+                for _ in range(self.clicks_per_thread):
+                    response = client.post("/api/blog/post/increment_click/", {"slug": "post"}, format="json")
+                    if response.status_code != 200:
+                        errors.append(response.data)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=hammer) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        sync_clicks_to_db()
+        analytics = PostAnalytics.objects.get(post=self.post)
+        self.assertEqual(analytics.clicks, self.threads * self.clicks_per_thread)
+
+    def test_concurrent_f_increments(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("In-memory SQLite locks the table for concurrent writers")
+
+        def hammer():
+            try:
+                for _ in range(self.clicks_per_thread):
+                    PostAnalytics.objects.filter(post=self.post).increment(clicks=1)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=hammer) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        analytics = PostAnalytics.objects.get(post=self.post)
+        self.assertEqual(analytics.clicks, self.threads * self.clicks_per_thread)
+
+    def test_increment_returns_new_value(self):
+        response = APIClient().post("/api/blog/post/increment_click/", {"slug": "post"}, format="json")
+        self.assertEqual(response.data["results"]["clicks"], 1)
+        #Los clicks quedan en redis hasta sync_clicks_to_db; el RETURNING se prueba directo
+        sync_clicks_to_db()
+        rows = PostAnalytics.objects.filter(post=self.post).increment(
+            returning=["impressions", "click_through_rate"], impressions=4
+        )
+        self.assertEqual(list(rows), [(4, 25.0)])
+        analytics = PostAnalytics.objects.get(post=self.post)
+        self.assertEqual(analytics.click_through_rate, 25.0)
+        analytics.increment_click()
+        self.assertEqual((analytics.clicks, analytics.click_through_rate), (2, 50.0))
+
+    def test_clicks_include_pending_delta(self):
+        client = APIClient()
+        PostAnalytics.objects.filter(post=self.post).set_counters(clicks=10, impressions=40)
+        response = client.post("/api/blog/post/increment_click/", {"slug": "post"}, format="json")
+        self.assertEqual(response.data["results"]["clicks"], 11)
+        #Sin tocar la base de datos hasta que se sincroniza
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).clicks, 10)
+
+        sync_clicks_to_db()
+        response = client.post("/api/blog/post/increment_click/", {"slug": "post"}, format="json")
+        self.assertEqual(response.data["results"]["clicks"], 12)
+        analytics = PostAnalytics.objects.get(post=self.post)
+        self.assertEqual(analytics.clicks, 11)
+        self.assertEqual(analytics.click_through_rate, 27.5)
+
+    def test_unknown_slug(self):
+        response = APIClient().post("/api/blog/post/increment_click/", {"slug": "missing"}, format="json")
+        self.assertEqual(response.status_code, 404)
+
+
+class CounterTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Tech", slug="tech")
+        self.posts = [Post.objects.create(title=f"Post {i}", description="Post", keywords="post", slug=f"post-{i}",
+                                          category=category, status="published") for i in range(2)]
+
+    def drain_and_apply(self):
+        for deltas in scan_and_drain(self.redis, "post:impressions:*", batch_size=1):
+            apply_counter_deltas(PostAnalytics, "post", deltas, "impressions")
+
+    def impressions(self):
+        return dict(PostAnalytics.objects.values_list("post__slug", "impressions"))
+
+    def test_drained_deltas_are_added_to_the_counters(self):
+        self.redis.set(f"post:impressions:{self.posts[0].id}", 3)
+        self.redis.set(f"post:impressions:{self.posts[1].id}", 1)
+        self.drain_and_apply()
+        self.redis.set(f"post:impressions:{self.posts[0].id}", 2)
+        self.drain_and_apply()
+        self.assertEqual(self.impressions(), {"post-0": 5, "post-1": 1})
+        self.assertEqual(self.redis.keys("post:impressions:*"), [])
+
+    def test_missing_analytics_rows_are_created(self):
+        PostAnalytics.objects.filter(post=self.posts[1]).delete()
+        self.redis.set(f"post:impressions:{self.posts[1].id}", 4)
+        self.drain_and_apply()
+        self.assertEqual(self.impressions(), {"post-0": 0, "post-1": 4})
+
+    def test_failed_update_restores_drained_counters(self):
+        key = f"post:impressions:{self.posts[0].id}"
+        self.redis.set(key, 3)
+        with mock.patch("apps.blog.counters._update_from_values", side_effect=DatabaseError("locked")), \
+                mock.patch("apps.blog.counters._bulk_update", side_effect=DatabaseError("locked")), \
+                self.assertRaises(DatabaseError):
+            post_impressions.flush(self.redis)
+        self.assertEqual(self.redis.get(key), b"3")
+        self.assertEqual(self.impressions(), {"post-0": 0, "post-1": 0})
+
+
+class HyperLogLogUniqueViewsTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Tech", slug="tech")
+        self.post = Post.objects.create(title="Post", description="Post", keywords="post", slug="post",
+                                        category=category, status="published")
+        self.engine = HyperLogLogUniqueViews(self.redis)
+
+    def record(self, *ips):
+        return self.engine.record([(str(self.post.id), ip, None) for ip in ips])
+
+    def views(self):
+        return PostAnalytics.objects.get(post=self.post).views
+
+    def test_repeated_ip_is_counted_once(self):
+        self.assertEqual(self.record("1.1.1.1", "1.1.1.1", "2.2.2.2"), {str(self.post.id): 2})
+        self.assertEqual(self.record("1.1.1.1"), {})
+        self.assertEqual(self.engine.count(self.post.id), 2)
+        self.assertEqual(self.engine.count(self.post.id, now().date()), 2)
+
+    def test_materialize_adds_only_the_delta(self):
+        self.record("1.1.1.1", "2.2.2.2")
+        self.assertEqual(self.engine.materialize(), 1)
+        self.record("2.2.2.2", "3.3.3.3")
+        self.engine.materialize()
+        self.assertEqual(self.views(), 3)
+        self.assertEqual(self.redis.hget(HyperLogLogUniqueViews.materialized_key, str(self.post.id)), b"3")
+
+    def test_materialize_without_new_events_is_a_noop(self):
+        self.record("1.1.1.1")
+        self.engine.materialize()
+        with mock.patch("apps.blog.unique_views.apply_counter_deltas") as apply:
+            self.assertEqual(self.engine.materialize(), 0)
+            #Una IP repetida no vuelve a marcar el post
+            self.record("1.1.1.1")
+            self.assertEqual(self.engine.materialize(), 0)
+        apply.assert_not_called()
+        self.assertEqual(self.views(), 1)
+
+    def test_failed_apply_keeps_the_post_dirty(self):
+        self.record("1.1.1.1")
+        with mock.patch("apps.blog.unique_views.apply_counter_deltas", side_effect=DatabaseError("locked")), \
+                self.assertRaises(DatabaseError):
+            self.engine.materialize()
+        self.assertEqual(self.redis.smembers(HyperLogLogUniqueViews.dirty_key), {str(self.post.id).encode()})
+        self.assertIsNone(self.redis.hget(HyperLogLogUniqueViews.materialized_key, str(self.post.id)))
+
+        self.engine.materialize()
+        self.assertEqual(self.views(), 1)
+
+
+class ViewEventsTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Tech", slug="tech")
+        self.post = Post.objects.create(title="Post", description="Post", keywords="post", slug="post",
+                                        category=category, status="published")
+
+    def views(self):
+        return PostAnalytics.objects.get(post=self.post).views
+
+    def pending(self):
+        return self.redis.xpending(STREAM_KEY, view_events.GROUP)["pending"]
+
+    def test_group_is_created_on_first_run(self):
+        self.assertEqual(view_events.consume_view_events(self.redis), 0)
+        self.assertEqual([group["name"] for group in self.redis.xinfo_groups(STREAM_KEY)],
+                         [view_events.GROUP.encode()])
+        #Las siguientes ejecuciones reusan el grupo (BUSYGROUP)
+        view_events.publish_view(self.redis, self.post.id, "1.1.1.1")
+        self.assertEqual(view_events.consume_view_events(self.redis), 1)
+        self.assertEqual(self.views(), 1)
+
+    def test_pending_messages_are_reclaimed_after_idle_timeout(self):
+        view_events.consume_view_events(self.redis)
+        view_events.publish_view(self.redis, self.post.id, "1.1.1.1")
+        #Un consumidor que leyo el mensaje y se cayo antes del XACK
+        self.redis.xreadgroup(view_events.GROUP, "dead", {STREAM_KEY: ">"})
+        self.assertEqual(view_events.consume_view_events(self.redis), 0)
+        self.assertEqual(self.pending(), 1)
+
+        with mock.patch("apps.blog.view_events.CLAIM_IDLE_MS", 0):
+            self.assertEqual(view_events.consume_view_events(self.redis), 1)
+        self.assertEqual(self.pending(), 0)
+        self.assertEqual(self.views(), 1)
+
+    def test_poisoned_messages_are_dead_lettered_and_acked(self):
+        view_events.consume_view_events(self.redis)
+        self.redis.xadd(STREAM_KEY, {"post": str(self.post.id)})
+        self.redis.xadd(STREAM_KEY, {"post": str(self.post.id), "ip": "not-an-ip"})
+        self.redis.xadd(STREAM_KEY, {"post": str(self.post.id), "ip": b"\xff"})
+        view_events.publish_view(self.redis, self.post.id, "1.1.1.1")
+        with self.assertLogs("apps.blog.view_events", "WARNING"):
+            self.assertEqual(view_events.consume_view_events(self.redis), 4)
+        self.assertEqual((self.pending(), self.redis.xlen(STREAM_KEY)), (0, 0))
+        self.assertEqual(self.redis.xlen(view_events.DEAD_LETTER_KEY), 3)
+        self.assertEqual(self.views(), 1)
+
+    def test_invalid_ips_are_not_published(self):
+        view_events.publish_view(self.redis, self.post.id, "unknown")
+        view_events.publish_view(self.redis, self.post.id, " 2001:DB8::1")
+        self.assertEqual([fields[b"ip"] for _, fields in self.redis.xrange(STREAM_KEY)], [b"2001:db8::1"])
+
+    def test_messages_are_acked_after_the_counters_are_applied(self):
+        view_events.publish_view(self.redis, self.post.id, "1.1.1.1")
+        with mock.patch("apps.blog.unique_views.apply_counter_deltas", side_effect=DatabaseError("locked")), \
+                self.assertRaises(DatabaseError):
+            view_events.consume_view_events(self.redis)
+        self.assertEqual((self.pending(), self.redis.xlen(STREAM_KEY)), (1, 1))
+
+        with mock.patch("apps.blog.view_events.CLAIM_IDLE_MS", 0):
+            self.assertEqual(view_events.consume_view_events(self.redis), 1)
+        self.assertEqual((self.pending(), self.redis.xlen(STREAM_KEY)), (0, 0))
+        self.assertEqual(self.views(), 1)
+
+
+class CacheInvalidationTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tech = Category.objects.create(name="Tech", slug="tech")
+        self.food = Category.objects.create(name="Food", slug="food")
+
+    def test_only_affected_entries_are_invalidated(self):
+        set_cached("post_detail:tech", {"title": "Tech"}, [f"category:{self.tech.id}"])
+        set_cached("post_detail:food", {"title": "Food"}, [f"category:{self.food.id}"])
+
+        self.tech.title = "Technology"
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.tech.save()
+        #Antes del commit se sigue sirviendo la entrada
+        self.assertEqual(get_cached("post_detail:tech"), {"title": "Tech"})
+        for callback in callbacks:
+            callback()
+
+        self.assertIsNone(get_cached("post_detail:tech"))
+        self.assertEqual(get_cached("post_detail:food"), {"title": "Food"})
+
+    def test_new_post_invalidates_post_lists(self):
+        set_cached("post_list:::", [], ["post_list"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(title="Post", description="Post", keywords="post", slug="post", category=self.tech)
+        self.assertIsNone(get_cached("post_list:::"))
+
+    def test_values_computed_before_an_invalidation_are_not_stored(self):
+        def compute():
+            #Otro worker invalida el tag mientras se calcula el valor
+            invalidate_tags(f"category:{self.tech.id}")
+            return {"title": "Tech"}, [f"category:{self.tech.id}"]
+
+        self.assertEqual(get_or_compute("post_detail:tech", compute), {"title": "Tech"})
+        self.assertIsNone(get_cached("post_detail:tech"))
+        #Los calculos que empiezan despues de la invalidacion si se guardan
+        get_or_compute("post_detail:tech", lambda: ({"title": "Technology"}, [f"category:{self.tech.id}"]))
+        self.assertEqual(get_cached("post_detail:tech"), {"title": "Technology"})
+
+    @override_settings(MEDIA_URL_EXPIRES=60, BLOG_CACHE_SOFT_TIMEOUT=600, BLOG_CACHE_TIMEOUT=7200)
+    def test_entries_with_signed_urls_end_before_the_urls_expire(self):
+        expires = time.time() + 200
+
+        def compute():
+            #Lo que hace signer.sign_many al firmar las imagenes del valor
+            note_expiry(expires)
+            return {"url": "signed"}, [POST_LIST_TAG]
+        get_or_compute("post_list:signed", compute)
+        self.assertLessEqual(cache.get("post_list:signed")["fresh_until"], expires - 60)
+
+        #Un listado que contiene esa entrada tampoco dura mas que sus URLs
+        get_or_compute("post_list:outer", lambda: (get_or_compute("post_list:signed", compute), [POST_LIST_TAG]))
+        self.assertLessEqual(cache.get("post_list:outer")["fresh_until"], expires - 60)
+
+        def late():
+            note_expiry(time.time() + 30)
+            return {"url": "signed"}, [POST_LIST_TAG]
+        self.assertEqual(get_or_compute("post_list:late", late), {"url": "signed"})
+        self.assertIsNone(cache.get("post_list:late"))
+
+    def test_invalidation_between_check_and_write_removes_the_entry(self):
+        generation = int(self.redis.get("cache:generation") or 0)
+        real_set = cache.set
+
+        def set_then_invalidate(*args, **kwargs):
+            real_set(*args, **kwargs)
+            invalidate_tags(f"category:{self.tech.id}")
+        with mock.patch.object(cache, "set", side_effect=set_then_invalidate):
+            set_cached("post_detail:tech", {"title": "Tech"}, [f"category:{self.tech.id}"], generation=generation)
+        self.assertIsNone(get_cached("post_detail:tech"))
+
+
+class RenderedPageCacheTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Tech", slug="tech")
+        for i in range(8):
+            Post.objects.create(title=f"Post {i}", description="Post", keywords="post",
+                                slug=f"post-{i}", category=category, status="published")
+
+    def test_cached_page_is_served_as_rendered_json(self):
+        client = APIClient()
+        first = client.get("/api/blog/posts/", {"p": 2, "page_size": 3})
+        with mock.patch("apps.blog.views.PostListView.get_page") as get_page:
+            second = client.get("/api/blog/posts/", {"p": 2, "page_size": 3})
+        get_page.assert_not_called()
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(len(second.json()["results"]), 3)
+        self.assertEqual(second.json()["count"], 8)
+        #Solo se cuentan impresiones de los posts de la pagina
+        self.assertEqual(self.redis.hlen("post:impressions"), 3)
+
+    @override_settings(ALLOWED_HOSTS=["testserver", "api.example.com"])
+    def test_extra_parameters_do_not_create_entries(self):
+        client = APIClient()
+        first = client.get("/api/blog/posts/", {"p": 2, "page_size": 3}).json()
+        with mock.patch("apps.blog.views.PostListView.get_page") as get_page:
+            for params, host in (({"p": "02", "page_size": " 3", "utm": "x"}, "testserver"),
+                                 ({"p": 2, "page_size": 3, "_": "123"}, "api.example.com")):
+                response = client.get("/api/blog/posts/", params, HTTP_HOST=host)
+                self.assertEqual(response.json(), first)
+        get_page.assert_not_called()
+        #Los links solo llevan los parametros normalizados
+        self.assertEqual(first["next"], "http://testserver/api/blog/posts/?p=3&page_size=3")
+
+    def test_impressions_are_synced_in_batches(self):
+        client = APIClient()
+        client.get("/api/blog/posts/", {"page_size": 3})
+        client.get("/api/blog/posts/", {"page_size": 3})
+        #Contador de la version anterior que todavia no se sincronizo
+        legacy = Post.objects.get(slug="post-7")
+        self.redis.set(f"post:impressions:{legacy.id}", 4)
+        sync_impressions_to_db()
+        impressions = dict(PostAnalytics.objects.filter(impressions__gt=0).values_list("post__slug", "impressions"))
+        self.assertEqual(impressions, {"post-5": 2, "post-6": 2, "post-7": 6})
+        self.assertEqual(self.redis.keys("post:impressions*"), [])
+
+    def test_cursor_pagination_walks_every_post_once(self):
+        client = APIClient()
+        seen = []
+        response = client.get("/api/blog/posts/", {"page_size": 3, "ordering": "az"}).json()
+        while True:
+            seen.extend(post["title"] for post in response["results"])
+            if not response["next"]:
+                break
+            response = client.get(response["next"]).json()
+        self.assertEqual(seen, sorted(f"Post {i}" for i in range(8)))
+
+
+class SearchTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(post_index.rebuild)
+        self.addCleanup(category_index.rebuild)
+        self.tech = Category.objects.create(name="Tech", title="Técnica", slug="tech")
+        Category.objects.create(name="Food", slug="food")
+        post_index.rebuild()
+        category_index.rebuild()
+
+    def create_post(self, title, content, status="published"):
+        return Post.objects.create(title=title, description="Post", keywords="post", content=content,
+                                   slug=title.lower().replace(" ", "-"), category=self.tech, status=status)
+
+    def test_results_are_ranked(self):
+        self.create_post("Other", "<p>Mentions django once</p>")
+        self.create_post("Django caching", "<p>Django and <b>redis</b></p>")
+        self.create_post("Django draft", "<p>Django</p>", status="draft")
+        response = APIClient().get("/api/blog/posts/", {"search": "django"}).json()
+        self.assertEqual([post["title"] for post in response["results"]], ["Django caching", "Other"])
+        self.assertEqual(response["count"], 2)
+
+    @override_settings(BLOG_SEARCH_MAX_RESULTS=1)
+    def test_limit_applies_to_published_posts(self):
+        #El borrador tiene mejor puntaje y antes ocupaba el unico resultado
+        self.create_post("Django draft", "<p>Django django</p>", status="draft")
+        self.create_post("Other", "<p>Mentions django once</p>")
+        response = APIClient().get("/api/blog/posts/", {"search": "django"}).json()
+        self.assertEqual([post["title"] for post in response["results"]], ["Other"])
+
+    def test_index_follows_saves_and_deletes(self):
+        post = self.create_post("Celery", "<p>Tasks</p>")
+        self.assertEqual(list(post_index.search(Post.objects.all(), "tasks")), [post])
+        post.content = "<p>Queues</p>"
+        post.save()
+        self.assertFalse(post_index.search(Post.objects.all(), "tasks").exists())
+        post.delete()
+        self.assertFalse(post_index.search(Post.objects.all(), "queues").exists())
+
+    def test_category_search(self):
+        response = APIClient().get("/api/blog/categories/", {"search": "tecnica"}).json()
+        self.assertEqual([category["slug"] for category in response["results"]], ["tech"])
+
+
+class QueryCountTest(FakeRedisMixin, TestCase):
+    """La cantidad de consultas de cada endpoint no debe crecer con la cantidad de resultados"""
+
+    def setUp(self):
+        super().setUp()
+        #URLs sin firmar, no hace falta la llave de CloudFront
+        self.patch("apps.media.signing.access_mode", mock.Mock(return_value="public"))
+        self.client = APIClient()
+
+    def create_posts(self, count):
+        category = Category.objects.create(name=f"Category {count}", slug=f"category-{count}",
+                                           thumbnail=self.create_media(f"category-{count}"))
+        content = "".join(f"<h2>Heading {order}</h2><p>Text</p>" for order in range(count))
+        for i in range(count):
+            Post.objects.create(title=f"Post {count} {i}", description="Post", keywords=f"batch{count}",
+                                slug=f"post-{count}-{i}", category=category, status="published",
+                                content=content, thumbnail=self.create_media(f"post-{count}-{i}"))
+        return category
+
+    def create_media(self, name):
+        return Media.objects.create(name=name, size="1", type="image/png", key=f"media/{name}.png",
+                                    media_type="image")
+
+    def count_queries(self, path, params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def assertConstantQueries(self, path, params_for):
+        small = self.count_queries(path, params_for(self.small))
+        large = self.count_queries(path, params_for(self.large))
+        self.assertEqual(small, large, f"{path} runs more queries with more results")
+
+    def test_endpoints(self):
+        self.small = self.create_posts(2)
+        self.large = self.create_posts(12)
+        #El indice de busqueda en memoria se construye antes de contar
+        post_index.rebuild()
+        self.addCleanup(post_index.rebuild)
+        page = {"page_size": 20}
+        self.assertConstantQueries("/api/blog/posts/", lambda category: {**page, "search": f"batch{category.slug[9:]}"})
+        self.assertConstantQueries("/api/blog/posts/", lambda category: {**page, "p": 1, "search": f"batch{category.slug[9:]}"})
+        self.assertConstantQueries("/api/blog/category/posts/", lambda category: {**page, "slug": category.slug})
+        self.assertConstantQueries("/api/blog/post/", lambda category: {"slug": f"post-{category.slug[9:]}-0"})
+        self.assertConstantQueries("/api/blog/post/headings/", lambda category: {"slug": f"post-{category.slug[9:]}-0"})
+        for i in range(10):
+            Category.objects.create(name=f"Extra {i}", slug=f"extra-{i}", thumbnail=self.create_media(f"extra-{i}"))
+        self.assertEqual(self.count_queries("/api/blog/categories/", {"page_size": 2}),
+                         self.count_queries("/api/blog/categories/", {"page_size": 12}))
+
+
+class TableOfContentsTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name="Tech", slug="tech")
+
+    def test_extract_headings(self):
+        content = ('<h1>Intro &amp; <em>setup</em></h1><p>Text <b>bold</b></p>'
+                   '<H2 id="install">Install</H2><h3>Step</h3><h3>Step</h3><h4></h4><h2>Unclosed <i>end')
+        self.assertEqual(extract_headings(content), [
+            {"title": "Intro & setup", "slug": "intro-setup", "level": 1, "order": 1},
+            {"title": "Install", "slug": "install", "level": 2, "order": 2},
+            {"title": "Step", "slug": "step", "level": 3, "order": 3},
+            {"title": "Step", "slug": "step-2", "level": 3, "order": 4},
+            {"title": "Unclosed end", "slug": "unclosed-end", "level": 2, "order": 5},
+        ])
+        self.assertEqual(extract_headings(None), [])
+
+    def test_headings_follow_content(self):
+        post = Post.objects.create(title="Post", description="Post", keywords="post", slug="post",
+                                   category=self.category, status="published",
+                                   content="<h2>One</h2><h2>Two</h2>")
+        self.assertEqual(list(post.headings.values_list("slug", flat=True)), ["one", "two"])
+        post.content = "<h2>Three</h2>"
+        post.save(update_fields=["content"])
+        self.assertEqual(post.toc, [{"title": "Three", "slug": "three", "level": 2, "order": 1}])
+        self.assertEqual(list(post.headings.values_list("slug", flat=True)), ["three"])
+        #Guardar sin cambiar los titulos no vuelve a escribir los Heading
+        with CaptureQueriesContext(connection) as queries:
+            post.save(update_fields=["title"])
+        self.assertFalse([query for query in queries if "blog_heading" in query["sql"]])
+
+    def test_headings_endpoint_reads_post_detail_cache(self):
+        Post.objects.create(title="Post", description="Post", keywords="post", slug="post",
+                            category=self.category, status="published", content="<h2>One</h2>")
+        detail = self.client.get("/api/blog/post/", {"slug": "post"}).json()["results"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/blog/post/headings/", {"slug": "post"})
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response.json()["results"], detail["headings"])
+        self.assertEqual(response.json()["results"][0]["slug"], "one")
+        self.assertEqual(self.client.get("/api/blog/post/headings/", {"slug": "missing"}).json()["results"], [])
+
+
+class RankingTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Tech", slug="tech")
+        self.posts = [Post.objects.create(title=f"Post {i}", description="Post", keywords="post", slug=f"post-{i}",
+                                          category=category, status="published") for i in range(3)]
+
+    def list_titles(self, sorting):
+        cache.clear()
+        response = APIClient().get("/api/blog/posts/", {"sorting": sorting, "p": 1})
+        return [post["title"] for post in response.json()["results"]]
+
+    def test_views_and_clicks_feed_the_rankings(self):
+        client = APIClient()
+        for i, clicks in enumerate((1, 3, 2)):
+            for _ in range(clicks):
+                client.post("/api/blog/post/increment_click/", {"slug": f"post-{i}"}, format="json")
+        self.assertEqual(self.list_titles("most_clicked"), ["Post 1", "Post 2", "Post 0"])
+
+        for ip_address in ("1.1.1.1", "2.2.2.2", "2.2.2.2"):
+            client.get("/api/blog/post/", {"slug": "post-2"}, REMOTE_ADDR=ip_address)
+        consume_post_view_events()
+        self.assertEqual(self.redis.zscore(rankings.VIEWS_KEY, str(self.posts[2].id)), 2)
+        #Los posts despublicados se quitan del ranking al leerlo, los que no tienen
+        #vistas aparecen despues de la reconciliacion
+        self.redis.zadd(rankings.VIEWS_KEY, {str(self.posts[1].id): 10})
+        self.posts[1].status = "draft"
+        self.posts[1].save()
+        with CaptureQueriesContext(connection) as queries:
+            titles = self.list_titles("most_viewed")
+        self.assertEqual(titles, ["Post 2"])
+        self.assertIsNone(self.redis.zscore(rankings.VIEWS_KEY, str(self.posts[1].id)))
+        self.assertFalse([query for query in queries if "ORDER BY" in query["sql"]])
+
+    def test_trending_prefers_recent_events(self):
+        period_start = rankings.trending_period(10 ** 9) * rankings.half_life() * rankings.PERIOD_HALF_LIVES
+        old, new = str(self.posts[0].id), str(self.posts[1].id)
+        #Cuatro vistas de hace tres vidas medias pesan la mitad que una vista de ahora
+        rankings.record(self.redis, views={old: 4}, now=period_start)
+        rankings.record(self.redis, views={new: 1}, now=period_start + 3 * rankings.half_life())
+        key = rankings.trending_key(rankings.trending_period(period_start))
+        self.assertEqual(self.redis.zrevrange(key, 0, -1), [new.encode(), old.encode()])
+        self.assertEqual(self.redis.zscore(key, new), 2 * self.redis.zscore(key, old))
+
+        #El siguiente periodo empieza con los puntajes reescalados del anterior
+        next_start = period_start + rankings.half_life() * rankings.PERIOD_HALF_LIVES
+        next_key = rankings.ranking_key(self.redis, "trending", now=next_start)
+        rankings.record(self.redis, views={old: 1}, now=next_start)
+        self.assertEqual(self.redis.zrevrange(next_key, 0, -1), [old.encode(), new.encode()])
+
+    def test_reconcile_rebuilds_from_analytics(self):
+        PostAnalytics.objects.filter(post=self.posts[0]).set_counters(clicks=5)
+        PostAnalytics.objects.filter(post=self.posts[1]).update(views=7)
+        rankings.record(self.redis, views={str(self.posts[2].id): 1})
+        self.redis.zadd(rankings.VIEWS_KEY, {"stale": 100})
+        self.posts[2].status = "draft"
+        self.posts[2].save()
+
+        reconcile_rankings()
+        self.assertEqual(self.redis.zrevrange(rankings.VIEWS_KEY, 0, -1, withscores=True),
+                         [(str(self.posts[1].id).encode(), 7.0), (str(self.posts[0].id).encode(), 0.0)])
+        self.assertEqual(self.redis.zscore(rankings.CLICKS_KEY, str(self.posts[0].id)), 5)
+        self.assertEqual(self.redis.zcard(rankings.ranking_key(self.redis, "trending")), 0)
+        self.assertEqual(self.list_titles("most_viewed"), ["Post 1", "Post 0"])
+
+
+class RollupTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name="Tech", slug="tech")
+        self.post = Post.objects.create(title="Post", description="Post", keywords="post", slug="post",
+                                        category=self.category, status="published")
+
+    def test_sync_tasks_fill_hour_and_day_buckets(self):
+        client = APIClient()
+        for _ in range(2):
+            client.get("/api/blog/posts/")
+            client.post("/api/blog/post/increment_click/", {"slug": "post"}, format="json")
+            #Cada sincronizacion suma al mismo bucket (ON CONFLICT DO UPDATE)
+            sync_impressions_to_db()
+            sync_clicks_to_db()
+        client.get("/api/blog/post/", {"slug": "post"})
+        consume_post_view_events()
+
+        rows = PostAnalyticsRollup.objects.filter(post=self.post)
+        self.assertEqual(sorted(rows.values_list("period", "views", "impressions", "clicks")),
+                         [("day", 1, 2, 2), ("hour", 1, 2, 2)])
+        series = client.get("/api/blog/post/analytics/", {"slug": "post", "period": "hour", "length": 3}).json()
+        self.assertEqual([(point["views"], point["clicks"]) for point in series["results"]], [(0, 0), (0, 0), (1, 2)])
+
+    def test_category_views_reach_the_series(self):
+        analytics = CategoryAnalytics.objects.get(category=self.category)
+        for ip_address in ("1.1.1.1", "2.2.2.2", "2.2.2.2"):
+            analytics.increment_view(ip_address)
+        analytics.refresh_from_db()
+        self.assertEqual(analytics.views, 2)
+        series = APIClient().get("/api/blog/category/analytics/", {"slug": "tech", "length": 1}).json()
+        self.assertEqual([point["views"] for point in series["results"]], [2])
+
+    def test_post_views_reach_the_series(self):
+        analytics = PostAnalytics.objects.get(post=self.post)
+        for ip_address in ("1.1.1.1", "2.2.2.2", "2.2.2.2"):
+            analytics.increment_view(ip_address)
+        analytics.refresh_from_db()
+        self.assertEqual(analytics.views, 2)
+        rows = PostAnalyticsRollup.objects.filter(post=self.post)
+        self.assertEqual(sorted(rows.values_list("period", "views")), [("day", 2), ("hour", 2)])
+
+    def test_series_are_zero_filled(self):
+        today = rollups.truncate(now(), "day")
+        PostAnalyticsRollup.objects.create(post=self.post, period="day", bucket=today - timedelta(days=2), views=5)
+        response = APIClient().get("/api/blog/post/analytics/", {"slug": "post", "length": 3}).json()
+        self.assertEqual([point["views"] for point in response["results"]], [5, 0, 0])
+        self.assertEqual(response["results"][-1]["bucket"], today.isoformat())
+        self.assertEqual(APIClient().get("/api/blog/post/analytics/", {"slug": "post", "period": "week"}).status_code,
+                         400)
+        self.assertEqual(APIClient().get("/api/blog/category/analytics/", {"slug": "missing"}).status_code, 404)
+
+    def test_prune_keeps_daily_rollups(self):
+        old = now() - timedelta(days=120)
+        view = PostView.objects.create(post=self.post, ip_address="1.1.1.1")
+        PostView.objects.filter(pk=view.pk).update(timestamp=old)
+        PostView.objects.create(post=self.post, ip_address="2.2.2.2")
+        for period in ("hour", "day"):
+            PostAnalyticsRollup.objects.create(post=self.post, period=period, bucket=rollups.truncate(old, period),
+                                               views=1)
+        prune_analytics()
+        self.assertEqual(list(PostView.objects.values_list("ip_address", flat=True)), ["2.2.2.2"])
+        self.assertEqual(list(PostAnalyticsRollup.objects.values_list("period", flat=True)), ["day"])
+
+
+@override_settings(BLOG_DWELL_MAX_SECONDS=600)
+class DwellTimeTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Tech", slug="tech")
+        self.post = Post.objects.create(title="Post", description="Post", keywords="post", slug="post",
+                                        category=category, status="published")
+
+    def beacon(self, body, content_type="text/plain;charset=UTF-8"):
+        return self.client.post("/api/blog/post/dwell/", body, content_type=content_type)
+
+    def test_beacons_do_not_touch_the_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.beacon(f'{{"id": "{self.post.id}", "seconds": 30}}').status_code, 204)
+            self.assertEqual(self.beacon(f"id={self.post.id}&seconds=90",
+                                         "application/x-www-form-urlencoded").status_code, 204)
+        self.assertEqual(len(queries), 0)
+        for body in ("", "{}", '{"id": "nope", "seconds": 1}', f'{{"id": "{self.post.id}", "seconds": -1}}',
+                     f'{{"id": "{self.post.id}", "seconds": "nan"}}', "x" * 1000):
+            self.assertEqual(self.beacon(body).status_code, 400, body)
+
+    def test_fold_keeps_the_running_mean(self):
+        samples = [30, 90, 5000, 12.5]
+        for seconds in samples[:2]:
+            self.beacon(f'{{"id": "{self.post.id}", "seconds": {seconds}}}')
+        fold_dwell_times()
+        for seconds in samples[2:]:
+            self.beacon(f'{{"id": "{self.post.id}", "seconds": {seconds}}}')
+        fold_dwell_times()
+        analytics = PostAnalytics.objects.get(post=self.post)
+        #5000 se limita a BLOG_DWELL_MAX_SECONDS
+        self.assertAlmostEqual(analytics.avg_time_on_page, (30 + 90 + 600 + 12.5) / 4)
+        self.assertEqual(analytics.time_on_page_samples, 4)
+        self.assertFalse(self.redis.exists(post_dwell.sum_key, post_dwell.count_key))
+
+
+class CategoryTreeTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tech = Category.objects.create(name="Tech", slug="tech")
+        self.web = Category.objects.create(name="Web", slug="web", parent=self.tech)
+        self.django = Category.objects.create(name="Django", slug="django", parent=self.web)
+        self.food = Category.objects.create(name="Food", slug="food")
+
+    def test_listing_includes_subcategories(self):
+        Post.objects.create(title="Views", description="Post", keywords="post", slug="views",
+                            category=self.django, status="published")
+        Post.objects.create(title="Pasta", description="Post", keywords="post", slug="pasta",
+                            category=self.food, status="published")
+        client = APIClient()
+        response = client.get("/api/blog/category/posts/", {"slug": "tech"}).json()
+        self.assertEqual([post["slug"] for post in response["results"]], ["views"])
+        response = client.get("/api/blog/category/posts/", {"slug": "food", "descendants": "false"}).json()
+        self.assertEqual([post["slug"] for post in response["results"]], ["pasta"])
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.web.parent = self.food
+        self.web.save()
+        self.django.refresh_from_db()
+        self.assertEqual(self.django.path, f"/{self.food.id.hex}/{self.web.id.hex}/{self.django.id.hex}/")
+        self.assertEqual(self.django.depth, 2)
+        self.food.parent = self.django
+        with self.assertRaises(ValidationError):
+            self.food.save()
+
+    def test_tree_endpoint(self):
+        response = APIClient().get("/api/blog/categories/tree/").json()["results"]
+        self.assertEqual({node["slug"] for node in response}, {"tech", "food"})
+        tech = next(node for node in response if node["slug"] == "tech")
+        self.assertEqual(tech["children"][0]["children"][0]["slug"], "django")
+
+        response = APIClient().get("/api/blog/categories/tree/", {"slug": "django"}).json()["results"]
+        self.assertEqual([item["slug"] for item in response["breadcrumb"]], ["tech", "web", "django"])
+        #El arbol se recarga cuando cambia una categoria
+        Category.objects.create(name="Flask", slug="flask", parent=self.web)
+        response = APIClient().get("/api/blog/categories/tree/", {"slug": "web"}).json()["results"]
+        self.assertEqual({node["slug"] for node in response["tree"][0]["children"]}, {"django", "flask"})
+
+    def test_categories_without_path_use_parent_links(self):
+        #Categorias que existian antes de la columna path
+        Category.objects.update(path="", depth=0)
+        Post.objects.create(title="Views", description="Post", keywords="post", slug="views",
+                            category=self.django, status="published")
+        Post.objects.create(title="Pasta", description="Post", keywords="post", slug="pasta",
+                            category=self.food, status="published")
+        client = APIClient()
+        response = client.get("/api/blog/category/posts/", {"slug": "food"}).json()
+        self.assertEqual([post["slug"] for post in response["results"]], ["pasta"])
+        response = client.get("/api/blog/category/posts/", {"slug": "tech"}).json()
+        self.assertEqual([post["slug"] for post in response["results"]], ["views"])
+        response = client.get("/api/blog/categories/tree/", {"slug": "django"}).json()["results"]
+        self.assertEqual([item["slug"] for item in response["breadcrumb"]], ["tech", "web", "django"])
+
+        out = StringIO()
+        call_command("rebuild_category_paths", stdout=out)
+        self.assertIn("4 categories updated", out.getvalue())
+        self.django.refresh_from_db()
+        self.assertEqual(self.django.path, f"/{self.tech.id.hex}/{self.web.id.hex}/{self.django.id.hex}/")
+
+    def test_rebuild_paths(self):
+        Category.objects.bulk_create([Category(name="Orphan", slug="orphan", parent=self.django)])
+        rebuild_paths()
+        orphan = Category.objects.get(slug="orphan")
+        self.assertEqual(orphan.path, f"{self.django.path}{orphan.id.hex}/")
+        self.assertEqual(orphan.depth, 3)
+
+
+class IndexPlanTest(TestCase):
+    def test_lookups_use_indexes(self):
+        #Falla si alguna busqueda por slug/id de las vistas recorre una tabla completa
+        call_command("explain_queries", "--check", stdout=StringIO())
+
+    def test_one_view_per_ip(self):
+        category = Category.objects.create(name="Tech", slug="tech")
+        analytics = category.category_analytics
+        analytics.increment_view("127.0.0.1")
+        analytics.increment_view("127.0.0.1")
+        analytics.refresh_from_db()
+        self.assertEqual(analytics.views, 1)
+
+class SeedBlogTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+    def seed(self, **options):
+        options = {"posts": 40, "categories": 8, "chunk_size": 15, "end": now(), "skip_index": True, **options}
+        call_command("seed_blog", stdout=StringIO(), **options)
+
+    def test_seed_creates_related_rows(self):
+        with mock.patch("apps.blog.models.PostAnalytics.objects.create") as create:
+            self.seed(seed=3)
+        create.assert_not_called()
+        posts = list(Post.objects.all())
+        self.assertEqual(len(posts), 40)
+        self.assertEqual(PostAnalytics.objects.count(), 40)
+        self.assertEqual(Heading.objects.count(), sum(len(post.toc) for post in posts))
+        self.assertEqual(posts[0].toc, extract_headings(posts[0].content))
+        self.assertEqual(Media.objects.count(), 4)
+        #Los path calculados al generar son los mismos que se calculan al guardar
+        paths = dict(Category.objects.values_list("id", "path"))
+        rebuild_paths()
+        self.assertEqual(dict(Category.objects.values_list("id", "path")), paths)
+
+    def test_seed_keeps_view_timestamps(self):
+        end = now() - timedelta(days=1)
+        self.seed(seed=3, views_per_post=5, end=end)
+        views = PostView.objects.select_related("post")
+        self.assertTrue(views.exists())
+        self.assertTrue(all(view.post.created_at <= view.timestamp <= end for view in views))
+        #El campo del modelo no se modifica: los guardados normales siguen usando auto_now_add
+        self.assertTrue(PostView._meta.get_field("timestamp").auto_now_add)
+
+    def test_seed_is_deterministic(self):
+        self.seed(seed=5)
+        first = list(Post.objects.order_by("id").values_list("id", "title", "category_id"))
+        Post.objects.all().delete()
+        Category.objects.all().delete()
+        Media.objects.all().delete()
+        self.seed(seed=5, chunk_size=7)
+        self.assertEqual(list(Post.objects.order_by("id").values_list("id", "title", "category_id")), first)
+        with self.assertRaises(CommandError):
+            self.seed(seed=5)
+
+
+class AsyncViewTest(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_redis = fakeredis.aioredis.FakeRedis(server=self.redis_server)
+        self.patch("apps.blog.aio.get_redis", mock.Mock(return_value=self.async_redis))
+        category = Category.objects.create(name="Tech", slug="tech")
+        for i in range(4):
+            Post.objects.create(title=f"Post {i}", description="Post", keywords="post", slug=f"post-{i}",
+                                content=f"<h2>Intro {i}</h2>", category=category, status="published")
+
+    async def get(self, view, params):
+        return await view.as_view()(AsyncRequestFactory().get("/api/blog/posts/", params))
+
+    async def test_async_views_match_sync_views(self):
+        sync_list = await sync_to_async(APIClient().get)("/api/blog/posts/", {"page_size": 2})
+        response = await self.get(AsyncPostListView, {"page_size": 2})
+        self.assertEqual(response.content, sync_list.content)
+        self.assertEqual(await self.async_redis.hlen("post:impressions"), 2)
+
+        response = await self.get(AsyncPostDetailView, {"slug": "post-1"})
+        self.assertEqual(json.loads(response.content)["results"]["title"], "Post 1")
+        self.assertEqual(await self.async_redis.xlen(STREAM_KEY), 1)
+        response = await self.get(AsyncPostHeadingView, {"slug": "post-1"})
+        self.assertEqual(json.loads(response.content)["results"][0]["slug"], "intro-1")
+
+        response = await self.get(AsyncPostDetailView, {"slug": "missing"})
+        self.assertEqual(response.status_code, 404)
+        response = await self.get(AsyncPostHeadingView, {"slug": "missing"})
+        self.assertEqual(json.loads(response.content)["results"], [])
+        response = await self.get(AsyncCategoryListView, {"search": "nothing"})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_missing_slug_is_not_found(self):
+        for params in ({}, {"slug": "missing"}):
+            sync_detail = await sync_to_async(APIClient().get)("/api/blog/post/", params)
+            response = await self.get(AsyncPostDetailView, params)
+            self.assertEqual((response.status_code, response.content), (404, sync_detail.content))
+        self.assertEqual(sync_detail.status_code, 404)
+        #Sin slug no se consulta ni se bloquea la entrada post_detail:None
+        self.assertFalse(self.redis.keys("*post_detail:None*"))
+
+    async def test_async_cache_is_shared_with_sync_views(self):
+        #Cache django_redis sobre el mismo fakeredis que el cliente async
+        caches = {"default": {
+            "BACKEND": "django_redis.cache.RedisCache", "LOCATION": "redis://localhost:6379/0",
+            "OPTIONS": {"CONNECTION_POOL_KWARGS": {"connection_class": fakeredis.FakeRedisConnection,
+                                                   "server": self.redis_server}},
+        }}
+        with override_settings(CACHES=caches), \
+                mock.patch("apps.blog.aio.get_cache_redis", mock.Mock(return_value=self.async_redis)):
+            #La entrada que escribe la vista async la lee la sincrona y al reves
+            response = await self.get(AsyncPostDetailView, {"slug": "post-2"})
+            with mock.patch("apps.blog.views.PostDetailView.get_post") as get_post:
+                sync_detail = await sync_to_async(APIClient().get)("/api/blog/post/", {"slug": "post-2"})
+            get_post.assert_not_called()
+            self.assertEqual(sync_detail.json()["results"], json.loads(response.content)["results"])
+
+            sync_list = await sync_to_async(APIClient().get)("/api/blog/posts/", {"page_size": 3})
+            with mock.patch("apps.blog.views.PostListView.get_page") as get_page:
+                response = await self.get(AsyncPostListView, {"page_size": 3})
+            get_page.assert_not_called()
+            self.assertEqual(response.content, sync_list.content)
+
+            #Guardar un post invalida las entradas escritas por las vistas async
+            post = await Post.objects.aget(slug="post-2")
+            post.title = "Renamed"
+
+            def save():
+                with self.captureOnCommitCallbacks(execute=True):
+                    post.save()
+            await sync_to_async(save)()
+            response = await self.get(AsyncPostDetailView, {"slug": "post-2"})
+            self.assertEqual(json.loads(response.content)["results"]["title"], "Renamed")
+
+
+class RedisPoolsTest(TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        pool = {"url": "redis://redis:6379/0", "max_connections": 3, "socket_keepalive": True,
+                "health_check_interval": 15, "connection_class": fakeredis.FakeRedisConnection, "server": server}
+        patcher = override_settings(REDIS_POOLS={"counters": pool})
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        redis_pools._reset()
+        self.addCleanup(redis_pools._reset)
+
+    def test_pools_are_created_on_first_use(self):
+        client = redis_pools.LazyRedis("counters")
+        self.assertEqual(redis_pools.pool_stats(), {})
+
+        client.incr("post:clicks:1")
+        self.assertIs(redis_pools.get_redis("counters"), redis_pools.get_redis("counters"))
+        pool = redis_pools.get_redis("counters").connection_pool
+        self.assertEqual(pool.connection_kwargs["health_check_interval"], 15)
+        self.assertEqual(redis_pools.pool_stats()["counters"],
+                         {"max_connections": 3, "created": 1, "in_use": 0, "idle": 1, "utilization": 0})
+
+        connection = pool.get_connection()
+        self.assertEqual(redis_pools.pool_stats()["counters"]["utilization"], 0.333)
+        pool.release(connection)
+
+    def test_forked_process_creates_its_own_pools(self):
+        parent = redis_pools.get_redis("counters")
+        #Lo que ejecuta os.register_at_fork en el proceso hijo
+        redis_pools._reset()
+        self.assertIsNot(redis_pools.get_redis("counters"), parent)
+
+
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.replica = mock.Mock()
+        for target, value in (("core.db_routers.replica_aliases", mock.Mock(return_value=["replica_0"])),
+                              ("core.db_routers.connections", {"replica_0": self.replica}),
+                              ("core.db_routers._down", {})):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(cache.clear)
+
+    def test_only_replica_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), "default")
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), "replica_0")
+            self.assertEqual(self.router.db_for_write(Post), "default")
+        with replica_reads(primary=True):
+            self.assertEqual(self.router.db_for_read(Post), "default")
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        mark_primary_write()
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), "default")
+        cache.clear()
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), "replica_0")
+
+    def test_unavailable_replica_falls_back_to_primary(self):
+        self.replica.ensure_connection.side_effect = OperationalError("connection refused")
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), "default")
+        #No se vuelve a intentar hasta REPLICA_RETRY_SECONDS
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), "default")
+        self.assertEqual(self.replica.ensure_connection.call_count, 1)
+
+    def test_read_views_use_the_replica_unless_sticky(self):
+        reads = []
+
+        def get_post(slug):
+            reads.append(self.router.db_for_read(Post))
+            raise Post.DoesNotExist
+
+        client = APIClient()
+        with mock.patch("apps.blog.views.PostDetailView.get_post", staticmethod(get_post)):
+            client.get("/api/blog/post/", {"slug": "missing"})
+            client.cookies[STICKY_COOKIE] = "1"
+            client.get("/api/blog/post/", {"slug": "missing"})
+        self.assertEqual(reads, ["replica_0", "default"])
+
+    def test_staff_writes_set_the_sticky_cookie(self):
+        middleware = ReplicaStickinessMiddleware(lambda request: HttpResponse())
+        request = RequestFactory().post("/admin/blog/post/add/")
+        request.user = mock.Mock(is_staff=True)
+        self.assertIn(STICKY_COOKIE, middleware(request).cookies)
+        request.user = mock.Mock(is_staff=False)
+        self.assertNotIn(STICKY_COOKIE, middleware(request).cookies)
+
+
+@override_settings(MIDDLEWARE=["core.timing.ServerTimingMiddleware"], PERF_SAMPLE_RATE=1)
+class ServerTimingTest(FakeRedisMixin, TestCase):
+    @staticmethod
+    def make_redis(server):
+        pool = redis.ConnectionPool(connection_class=fakeredis.FakeRedisConnection, server=server)
+        return TimedRedis(connection_pool=pool)
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Tech", slug="tech")
+        Post.objects.create(title="Post", description="Post", keywords="post", slug="post",
+                            category=category, status="published")
+        cache.clear()
+
+    def test_sampled_requests_report_timings(self):
+        client = APIClient()
+        with self.assertLogs("core.timing", "INFO") as logs:
+            first = client.get("/api/blog/post/", {"slug": "post"})
+            second = client.get("/api/blog/post/", {"slug": "post"})
+
+        timing = first["Server-Timing"]
+        for metric in ("db;dur=", "redis;dur=", "serialize;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+        self.assertIn('cache_post_detail;desc="0 hit, 1 miss"', timing)
+        self.assertIn('cache_post_detail;desc="1 hit, 0 miss"', second["Server-Timing"])
+        self.assertNotIn("db;", second["Server-Timing"])
+        log = json.loads(logs.records[0].getMessage())
+        self.assertEqual((log["path"], log["status"]), ("/api/blog/post/", 200))
+        self.assertGreater(log["db_count"], 0)
+        #El wrapper solo existe durante los requests de la muestra
+        self.assertEqual(connection.execute_wrappers, [])
+
+    async def test_async_requests_time_queries_in_the_request_thread(self):
+        async def view(request):
+            await sync_to_async(Post.objects.count)()
+            return HttpResponse()
+
+        with self.assertLogs("core.timing", "INFO"):
+            response = await ServerTimingMiddleware(view)(AsyncRequestFactory().get("/"))
+        self.assertIn('db;dur=', response["Server-Timing"])
+        self.assertEqual(await sync_to_async(lambda: connection.execute_wrappers)(), [])
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_requests_outside_the_sample_are_not_measured(self):
+        response = APIClient().get("/api/blog/post/", {"slug": "post"})
+        self.assertFalse(response.has_header("Server-Timing"))
@@ -0,0 +1,88 @@
+"""Tabla de contenido de los posts: se extraen los h1-h6 del HTML de CKEditor al
+guardar el post, se guarda como JSON en Post.toc y se reemplazan sus Heading"""
+import re
+from html.parser import HTMLParser
+
+from django.utils.text import slugify
+
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+HEADING_RE = re.compile(r"<h([1-6])[\s>/]", re.IGNORECASE)
+CLOSING_RE = {level: re.compile(rf"</h{level}\s*>", re.IGNORECASE) for level in range(1, 7)}
+
+
+class HeadingParser(HTMLParser):
+    """Parser incremental: solo guarda el texto que esta dentro de un h1-h6"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.headings = []
+        self._level = None
+        self._anchor = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        level = HEADING_TAGS.get(tag)
+        if level is not None and self._level is None:
+            self._level = level
+            #Si CKEditor ya le puso un id al titulo se usa como slug (ancla)
+            self._anchor = dict(attrs).get("id")
+            self._text = []
+
+    def handle_endtag(self, tag):
+        if self._level is not None and HEADING_TAGS.get(tag) == self._level:
+            self._finish()
+
+    def close(self):
+        super().close()
+        #Titulo sin cerrar al final del contenido
+        if self._level is not None:
+            self._finish()
+
+    def _finish(self):
+        title = " ".join("".join(self._text).split())
+        if title:
+            self.headings.append((title, self._anchor, self._level))
+        self._level = None
+
+    def handle_data(self, data):
+        if self._level is not None:
+            self._text.append(data)
+
+
+def heading_fragments(content):
+    """Recorre el HTML y genera solo los trozos <hN ...>...</hN>, el resto del
+    contenido (parrafos, imagenes, tablas) no pasa por el parser"""
+    position = 0
+    while True:
+        match = HEADING_RE.search(content, position)
+        if match is None:
+            return
+        closing = CLOSING_RE[int(match.group(1))].search(content, match.end())
+        if closing is None:
+            #Titulo sin cerrar: se parsea hasta el final
+            yield content[match.start():]
+            return
+        yield content[match.start():closing.end()]
+        position = closing.end()
+
+
+def extract_headings(content):
+    """Retorna la tabla de contenido [{title, slug, level, order}] del HTML"""
+    if not content:
+        return []
+    parser = HeadingParser()
+    for fragment in heading_fragments(content):
+        parser.feed(fragment)
+    parser.close()
+
+    toc = []
+    used = set()
+    for order, (title, anchor, level) in enumerate(parser.headings, start=1):
+        slug = anchor or slugify(title) or f"heading-{order}"
+        #Las anclas deben ser unicas dentro del post
+        unique, suffix = slug, 2
+        while unique in used:
+            unique, suffix = f"{slug}-{suffix}", suffix + 1
+        used.add(unique)
+        toc.append({"title": title[:255], "slug": unique[:255], "level": level, "order": order})
+    return toc
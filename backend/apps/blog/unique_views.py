@@ -0,0 +1,168 @@
+"""Conteo de visitantes unicos por post. Se elige el motor con BLOG_UNIQUE_VIEWS:
+- "exact": una fila PostView por (post, ip) con INSERT ... ON CONFLICT DO NOTHING
+- "hll": HyperLogLog de redis (PFADD/PFCOUNT) por post y por dia, se materializa
+  periodicamente en PostAnalytics.views"""
+import logging
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from .counters import apply_counter_deltas
+from .models import Post, PostView, PostAnalytics
+
+logger = logging.getLogger(__name__)
+
+#Los HyperLogLog diarios se conservan 35 dias
+DAILY_TIMEOUT = 60 * 60 * 24 * 35
+MATERIALIZE_BATCH_SIZE = 1000
+
+
+def existing_post_ids(post_ids):
+    """Valida los IDs de los posts con una sola consulta, retorna {str(id): UUID}"""
+    field = PostView._meta.get_field("post").target_field
+    cleaned = set()
+    for post_id in post_ids:
+        try:
+            cleaned.add(field.to_python(post_id))
+        except ValidationError:
+            logger.info(f"Invalid Post ID {post_id}")
+    return {str(pk): pk for pk in Post.objects.filter(pk__in=cleaned).values_list("pk", flat=True)}
+
+
+class ExactUniqueViews:
+    def record(self, events):
+        """Registra los eventos (post_id, ip_address, timestamp) y retorna cuantas
+        vistas nuevas tuvo cada post"""
+        valid = existing_post_ids({post_id for post_id, _, _ in events})
+        rows = {}
+        for post_id, ip_address, timestamp in events:
+            if str(post_id) in valid:
+                rows.setdefault((valid[str(post_id)], ip_address), timestamp)
+
+        new_views = Counter()
+        rows = list(rows.items())
+        if not rows:
+            return new_views
+        batch_size = connection.ops.bulk_batch_size(["id", "post", "ip_address", "timestamp"], rows) or len(rows)
+        #Si falla el contador tampoco quedan las filas PostView, al reprocesar los
+        #eventos las vistas se vuelven a contar
+        with transaction.atomic():
+            for start in range(0, len(rows), batch_size):
+                new_views.update(_insert_views(rows[start:start + batch_size]))
+            if new_views:
+                apply_counter_deltas(PostAnalytics, "post", new_views, "views")
+        return new_views
+
+
+def _insert_views(rows):
+    """INSERT ... ON CONFLICT (post, ip_address) DO NOTHING, retorna los post_id insertados"""
+    opts = PostView._meta
+    fields = [opts.get_field(name) for name in ("id", "post", "ip_address", "timestamp")]
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(field.column) for field in fields)
+    conflict = f"{qn(opts.get_field('post').column)}, {qn(opts.get_field('ip_address').column)}"
+    sql = f"INSERT INTO {qn(opts.db_table)} ({columns}) VALUES %s ON CONFLICT ({conflict}) DO NOTHING"
+
+    params = []
+    for (post_id, ip_address), timestamp in rows:
+        values = (uuid.uuid4(), post_id, ip_address, timestamp or now())
+        params.append([field.get_db_prep_save(value, connection) for field, value in zip(fields, values)])
+
+    placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    with connection.cursor() as cursor:
+        if connection.features.can_return_rows_from_bulk_insert:
+            cursor.execute(
+                sql % ", ".join([placeholder] * len(params)) + f" RETURNING {qn(fields[1].column)}",
+                [value for row in params for value in row],
+            )
+            return [fields[1].to_python(row[0]) for row in cursor.fetchall()]
+
+        inserted = []
+        for row, ((post_id, _), _) in zip(params, rows):
+            cursor.execute(sql % placeholder, row)
+            if cursor.rowcount:
+                inserted.append(post_id)
+        return inserted
+
+
+class HyperLogLogUniqueViews:
+    #Posts con visitantes nuevos pendientes de materializar
+    dirty_key = "post:unique_views:dirty"
+    #Visitantes unicos que ya se sumaron a PostAnalytics.views
+    materialized_key = "post:unique_views:materialized"
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+
+    @staticmethod
+    def key(post_id, day=None):
+        if day is None:
+            return f"post:unique_views:{post_id}"
+        return f"post:unique_views:{post_id}:{day:%Y%m%d}"
+
+    def record(self, events):
+        """Agrega las IPs a los HyperLogLog del post (total y del dia), los posts
+        cuyo conteo cambio se marcan para materializarlos despues"""
+        valid = existing_post_ids({post_id for post_id, _, _ in events})
+        events = [event for event in events if str(event[0]) in valid]
+        pipe = self.redis_client.pipeline(transaction=False)
+        for post_id, ip_address, timestamp in events:
+            day_key = self.key(post_id, (timestamp or now()).date())
+            pipe.pfadd(self.key(post_id), ip_address)
+            pipe.pfadd(day_key, ip_address)
+            pipe.expire(day_key, DAILY_TIMEOUT)
+        results = pipe.execute()
+
+        changed = Counter()
+        for index, (post_id, _, _) in enumerate(events):
+            if results[index * 3]:
+                changed[str(post_id)] += 1
+        if changed:
+            self.redis_client.sadd(self.dirty_key, *changed.keys())
+        return changed
+
+    def count(self, post_id, day=None):
+        return self.redis_client.pfcount(self.key(post_id, day))
+
+    def materialize(self):
+        """Suma a PostAnalytics.views lo que crecio cada HyperLogLog desde la ultima vez"""
+        updated = 0
+        while True:
+            post_ids = self.redis_client.spop(self.dirty_key, MATERIALIZE_BATCH_SIZE)
+            if not post_ids:
+                return updated
+            post_ids = [post_id.decode("utf-8") for post_id in post_ids]
+            pipe = self.redis_client.pipeline(transaction=False)
+            for post_id in post_ids:
+                pipe.pfcount(self.key(post_id))
+            counts = pipe.execute()
+            previous = self.redis_client.hmget(self.materialized_key, post_ids)
+
+            deltas = {}
+            for post_id, count, last in zip(post_ids, counts, previous):
+                #El estimado puede bajar un poco al cambiar de representacion, se ignora
+                delta = count - int(last or 0)
+                if delta > 0:
+                    deltas[post_id] = delta
+            if not deltas:
+                continue
+            try:
+                updated += apply_counter_deltas(PostAnalytics, "post", deltas, "views")
+            except Exception:
+                self.redis_client.sadd(self.dirty_key, *post_ids)
+                raise
+            pipe = self.redis_client.pipeline(transaction=False)
+            for post_id, delta in deltas.items():
+                pipe.hincrby(self.materialized_key, post_id, delta)
+            pipe.execute()
+
+
+def get_unique_views(redis_client):
+    """Motor de visitantes unicos configurado en BLOG_UNIQUE_VIEWS"""
+    if getattr(settings, "BLOG_UNIQUE_VIEWS", "exact") == "hll":
+        return HyperLogLogUniqueViews(redis_client)
+    return ExactUniqueViews()
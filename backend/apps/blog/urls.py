@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (PostListView,
                     PostDetailView,
@@ -5,10 +6,22 @@ from .views import (PostListView,
                     IncrementPostClickView,
                     CategoryListView,
                     CategoryDetailView,
+                    CategoryTreeView,
+                    PostAnalyticsSeriesView,
+                    PostDwellTimeView,
+                    CategoryDwellTimeView,
+                    CategoryAnalyticsSeriesView,
                     GenerateFakePostsView,
                     GenerateFakeAnalyticsView, IncrementCategoryClickView
                     )
 
+#Bajo ASGI (uvicorn) las vistas de lectura pueden ser async (apps/blog/async_views.py)
+if getattr(settings, "BLOG_ASYNC_VIEWS", False):
+    from .async_views import (AsyncPostListView as PostListView,
+                              AsyncPostDetailView as PostDetailView,
+                              AsyncPostHeadingView as PostHeadingView,
+                              AsyncCategoryListView as CategoryListView)
+
 urlpatterns = [
     path('generate_posts/',GenerateFakePostsView.as_view()),
     path('generate_analytics/',GenerateFakeAnalyticsView.as_view()),
@@ -16,7 +29,12 @@ urlpatterns = [
     path('post/',PostDetailView.as_view(), name='post-detail'),
     path('post/headings/',PostHeadingView.as_view(), name='post-headings'),
     path('post/increment_click/',IncrementPostClickView.as_view(), name='increment-post-click'),
+    path('post/analytics/',PostAnalyticsSeriesView.as_view(), name='post-analytics'),
+    path('post/dwell/',PostDwellTimeView.as_view(), name='post-dwell'),
     path('categories/', CategoryListView.as_view(), name='category-list'),
+    path('categories/tree/', CategoryTreeView.as_view(), name='category-tree'),
     path('category/posts/', CategoryDetailView.as_view(), name='category-posts'),
     path('category/increment_click/', IncrementCategoryClickView.as_view(), name='increment-category-click'),
+    path('category/analytics/', CategoryAnalyticsSeriesView.as_view(), name='category-analytics'),
+    path('category/dwell/', CategoryDwellTimeView.as_view(), name='category-dwell'),
 ]
\ No newline at end of file
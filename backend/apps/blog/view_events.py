@@ -0,0 +1,124 @@
+"""Ingesta de vistas por lotes: PostDetailView agrega (post_id, ip, timestamp) a un
+stream de redis y consume_post_view_events los procesa de miles en miles"""
+import ipaddress
+import logging
+import os
+import socket
+from datetime import datetime, timezone
+
+import redis
+
+from . import rankings
+from .unique_views import get_unique_views
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "post:view_events"
+#Mensajes invalidos que se confirmaron sin procesar, para revisarlos
+DEAD_LETTER_KEY = "post:view_events:dead"
+DEAD_LETTER_MAXLEN = 10000
+GROUP = "post-views"
+#Tamaño maximo aproximado del stream, protege la memoria de redis si el consumidor se detiene
+STREAM_MAXLEN = 1_000_000
+BATCH_SIZE = 5000
+#Mensajes pendientes de un consumidor caido que se vuelven a procesar
+CLAIM_IDLE_MS = 5 * 60 * 1000
+
+
+def clean_ip(ip_address):
+    """IP normalizada o None si no es valida (X-Forwarded-For lo envia el cliente)"""
+    try:
+        return str(ipaddress.ip_address(ip_address.strip()))
+    except (AttributeError, ValueError):
+        return None
+
+
+def publish_view(redis_client, post_id, ip_address):
+    """Agrega la vista al stream, un solo XADD por request"""
+    ip_address = clean_ip(ip_address)
+    if ip_address is None:
+        return
+    redis_client.xadd(STREAM_KEY, {"post": str(post_id), "ip": ip_address},
+                      maxlen=STREAM_MAXLEN, approximate=True)
+
+
+async def apublish_view(redis_client, post_id, ip_address):
+    """publish_view con un cliente redis.asyncio"""
+    ip_address = clean_ip(ip_address)
+    if ip_address is None:
+        return
+    await redis_client.xadd(STREAM_KEY, {"post": str(post_id), "ip": ip_address},
+                            maxlen=STREAM_MAXLEN, approximate=True)
+
+
+def consume_view_events(redis_client, batch_size=BATCH_SIZE, max_batches=100):
+    """Lee el stream con un grupo de consumidores, registra los eventos con el motor
+    de visitantes unicos y confirma (XACK) los mensajes procesados"""
+    _ensure_group(redis_client)
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    processed = 0
+
+    #Recuperar los mensajes que otro consumidor leyo pero no confirmo
+    _, claimed, *_ = redis_client.xautoclaim(STREAM_KEY, GROUP, consumer, CLAIM_IDLE_MS,
+                                             start_id="0-0", count=batch_size)
+    if claimed:
+        processed += _process(redis_client, claimed)
+
+    for _ in range(max_batches):
+        response = redis_client.xreadgroup(GROUP, consumer, {STREAM_KEY: ">"}, count=batch_size)
+        if not response:
+            break
+        messages = response[0][1]
+        if not messages:
+            break
+        processed += _process(redis_client, messages)
+    return processed
+
+
+def _ensure_group(redis_client):
+    try:
+        redis_client.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _parse(message_id, fields):
+    """(post_id, ip, timestamp) del mensaje o None si es invalido"""
+    try:
+        post_id = fields[b"post"].decode("utf-8")
+        ip_address = clean_ip(fields[b"ip"].decode("utf-8"))
+    except (KeyError, TypeError, UnicodeDecodeError):
+        return None
+    if ip_address is None:
+        return None
+    #El ID del mensaje empieza con el timestamp en milisegundos
+    milliseconds = int(message_id.split(b"-")[0])
+    return post_id, ip_address, datetime.fromtimestamp(milliseconds / 1000, tz=timezone.utc)
+
+
+def _process(redis_client, messages):
+    events = []
+    invalid = []
+    for message_id, fields in messages:
+        if not fields:
+            continue
+        event = _parse(message_id, fields)
+        if event is None:
+            invalid.append((message_id, fields))
+        else:
+            events.append(event)
+
+    #Solo las vistas nuevas (visitantes unicos) suben en los rankings
+    rankings.record(redis_client, views=get_unique_views(redis_client).record(events))
+
+    #Los mensajes invalidos tambien se confirman, si no se reclamarian y fallarian siempre
+    ids = [message_id for message_id, _ in messages]
+    pipe = redis_client.pipeline(transaction=False)
+    for message_id, fields in invalid:
+        logger.warning(f"Invalid post view event {message_id}: {fields}")
+        pipe.xadd(DEAD_LETTER_KEY, {**fields, b"id": message_id}, maxlen=DEAD_LETTER_MAXLEN, approximate=True)
+    pipe.xack(STREAM_KEY, GROUP, *ids)
+    pipe.xdel(STREAM_KEY, *ids)
+    pipe.execute()
+    return len(messages)
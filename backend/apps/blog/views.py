@@ -5,9 +5,11 @@ from rest_framework.views import APIView
 from rest_framework_api.views import StandardAPIView
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound, APIException
-import redis
 from django.conf import settings
 from django.utils.decorators import method_decorator
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 
 #Hacer cache predeterminado (1 minuto) que se guarda en redis
 from django.views.decorators.cache import cache_page
@@ -16,23 +18,39 @@ from django.views.decorators.cache import cache_page
 from django.core.cache import cache
 from unicodedata import category
 
-from .models import Post, Heading, PostAnalytics, Category, CategoryAnalytics
-from .serializers import PostListSerializer, PostSerializer, HeadingSerializer, CategoryListSerializer
+from .models import Post, PostAnalytics, Category, CategoryAnalytics, PostAnalyticsRollup, CategoryAnalyticsRollup
+from .serializers import PostListSerializer, PostSerializer, CategoryListSerializer
 from core.permissions import HasValidAPIKey
+from core.db_routers import use_replica
+from core.redis_pools import LazyRedis
+from core.timing import timed
 from .utils import get_client_ip
 from .tasks import increment_post_view_task
+from .clicks import post_clicks, category_clicks
+from .impressions import post_impressions, category_impressions
+from .dwell_time import post_dwell, category_dwell, parse_beacon, InvalidBeacon
+from .view_events import publish_view
+from .caching import get_or_compute, post_tags, post_list_tags, category_list_tags
+from .rendering import cached_page_response
+from .pagination import paginate_queryset, paginate_ranking
+from .rankings import ranking_key, RankedPosts
+from .search import post_index, category_index
+from .category_tree import get_tree
+from .rollups import series, PERIODS
 from faker import Faker
 import random
 from django.utils.text import slugify
-from django.db.models import Q, F, Prefetch
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 
-redis_client = redis.StrictRedis(host=settings.REDIS_HOST, port=6379, db=0)
+redis_client = LazyRedis("counters")
 
 #class PostListView(ListAPIView):
 #    queryset = Post.objects.all()
 #    serializer_class = PostListSerializer
 
+@method_decorator(use_replica, name="get")
 class PostListView(StandardAPIView):
     #Establecer un api key para permitir/denegar el uso de la solicitud HTTP
     #permission_classes = [HasValidAPIKey]
@@ -46,75 +64,70 @@ class PostListView(StandardAPIView):
             cache_key = f"post_list:{search}:{sorting}:{ordering}"
 
             #HACER CACHE PERSONALIZADA
-            #Verificar si los datos que se requieren estan en una cache guardada
-            cached_posts = cache.get(cache_key)
-            #si existe retornar la cache a la vista del usuario
-            if cached_posts:
-                if search != "":
-                    search_lower = search.lower()
-                    cached_posts = [
-                        post for post in cached_posts
-                        if search_lower in post.get('title','').lower()
-                           or search_lower in post.get('description','').lower()
-                           or search_lower in post.get('content','').lower()
-                           or search_lower in post.get('keywords','').lower()
-                    ]
-
-                for post in cached_posts:
-                    redis_client.incr(f"post:impressions:{post['id']}")
-                return self.paginate(request, cached_posts)
-
-            # si no existe, obtener los posts de la base de datos
-            if search != "":
-                posts = Post.postobjects.filter(
-                    Q(title__icontains=search) |
-                    Q(description__icontains=search) |
-                    Q(content__icontains=search) |
-                    Q(keywords__icontains=search)
-                )
-            else:
-                posts = Post.postobjects.all()
-                #.select_related("category").prefetch_related(
-                #    Prefetch("post_analytics", to_attr="analytics_cache")
-                #))
+            #Si la pagina esta en la cache se retorna el JSON ya renderizado, sino un solo
+            #worker obtiene los posts de la base de datos mientras los demas esperan o
+            #usan la version anterior
+            response, post_ids = cached_page_response(
+                request, cache_key, lambda page_request: self.get_page(page_request, search, sorting, ordering))
 
-            if not posts.exists():
-                raise NotFound(detail="No Posts Found!")
-
-            if sorting:
-                if sorting == 'newest':
-                    posts = posts.order_by("-created_at")
-                elif sorting == 'recently_updated':
-                    posts = posts.order_by("-updated_at")
-                elif sorting == 'most_viewed':
-                    posts = posts.annotate(popularity=F("post_analytics__views")).order_by("-popularity")
-            if ordering:
-                if ordering == 'az':
-                    posts = posts.order_by("title")
-                if ordering == 'za':
-                    posts = posts.order_by("-title")
-
-            #Serializamos los datos de los posts
-            serialized_posts = PostListSerializer(posts, many=True).data
-
-            #Guardar datos de los posts/la vista del usuario en la cache llamada "post_list"
-            cache.set(cache_key, serialized_posts, timeout=(60 * 5) )
-
-            for post in posts:
-                #incrementar impressiones en redis
-                redis_client.incr(f"post:impressions:{post.id}")
-                #increment_post_impressions.delay(post.id)
-
-            return self.paginate(request, serialized_posts)
+            #incrementar impressiones en redis solo de los posts de la pagina
+            post_impressions.record(redis_client, post_ids)
+
+            return response
 
         except Exception as e:
             raise APIException(detail=f"An Unexpected Error Ocurred: {str(e)}")
 
+    def get_page(self, request, search, sorting, ordering):
+        if search == "" and not ordering:
+            #most_viewed/trending: la pagina sale del ranking de redis, sin ordenar todos los posts
+            key = ranking_key(redis_client, sorting)
+            ranking = RankedPosts(redis_client, key, Post.postobjects.all()) if key else None
+            if ranking is not None and ranking.count():
+                data, page = paginate_ranking(request, ranking, PostListSerializer)
+                return data, post_list_tags(page)
+
+        # si no existe, obtener los posts de la base de datos
+        if search != "":
+            #Busqueda de texto completo, ordenada por relevancia si no se pide otro orden
+            posts = post_index.search(Post.postobjects.all(), search)
+        else:
+            posts = Post.postobjects.all()
+
+        if not posts.exists():
+            raise NotFound(detail="No Posts Found!")
+
+        #El orden incluye el id para que el cursor de la paginacion sea estable
+        order = ("-rank", "-id") if search != "" else ("-created_at", "-id")
+        if sorting:
+            if sorting == 'newest':
+                order = ("-created_at", "-id")
+            elif sorting == 'recently_updated':
+                order = ("-updated_at", "-id")
+            elif sorting in ('most_viewed', 'trending'):
+                #Sin ranking en redis (todavia no se reconcilia) se ordena en la base de datos
+                posts = posts.annotate(popularity=Coalesce(F("post_analytics__views"), 0))
+                order = ("-popularity", "-id")
+            elif sorting == 'most_clicked':
+                posts = posts.annotate(popularity=Coalesce(F("post_analytics__clicks"), 0))
+                order = ("-popularity", "-id")
+        if ordering:
+            if ordering == 'az':
+                order = ("title", "id")
+            if ordering == 'za':
+                order = ("-title", "-id")
+
+        #Paginar en la base de datos y serializar solo los posts de la pagina
+        data, page = paginate_queryset(request, posts, PostListSerializer, order)
+        #Se registran las categorias/imagenes que contiene para invalidar la cache
+        return data, post_list_tags(page)
+
 #class PostDetailView(RetrieveAPIView):
 #    queryset = Post.objects.all()
 #    serializer_class = PostSerializer
 #    lookup_field = 'slug'
 
+@method_decorator(use_replica, name="get")
 class PostDetailView(StandardAPIView):
     # Establecer un api key para permitir/denegar el uso de la solicitud HTTP
     #permission_classes = [HasValidAPIKey]
@@ -122,35 +135,48 @@ class PostDetailView(StandardAPIView):
     def get(self, request):
         ip_address = get_client_ip(request)
         slug = request.query_params.get("slug")
+        if not slug:
+            raise NotFound(detail="The request Post does not exist")
         try:
-            cached_post = cache.get(f"post_detail:{slug}")
-            if cached_post:
-                increment_post_view_task.delay(cached_post['slug'], ip_address)
-                return self.response(cached_post)
             #sino esta en cache, obtener el post de la base de datos
-            post = Post.postobjects.get(slug=slug)
-            serialized_post = PostSerializer(post).data
-            #Guardar el post en la cache
-            cache.set(f"post_detail:{slug}", serialized_post, timeout=(60*5))
+            serialized_post = get_or_compute(f"post_detail:{slug}", lambda: self.get_post(slug))
 
-            # TODO Incrementar vistas en segundo plano
-            increment_post_view_task.delay(post.slug, ip_address)
+            #Incrementar vistas en segundo plano
+            record_post_view(serialized_post['id'], serialized_post['slug'], ip_address)
 
-            return self.paginate(request, serialized_post)
+            return self.response(serialized_post)
 
         except Post.DoesNotExist:
             raise NotFound(detail="The request Post does not exist")
         except Exception as e:
             raise APIException(detail=f"An Unexpected Error Ocurred HERE: {str(e)}")
 
+    @staticmethod
+    def get_post(slug):
+        post = PostSerializer.setup_queryset(Post.postobjects.all()).get(slug=slug)
+        with timed("serialize"):
+            return PostSerializer(post).data, post_tags(post)
+
+def record_post_view(post_id, slug, ip_address):
+    """Envia la vista al stream de redis o a una tarea de celery segun BLOG_VIEW_INGESTION"""
+    if getattr(settings, "BLOG_VIEW_INGESTION", "stream") == "stream":
+        publish_view(redis_client, post_id, ip_address)
+    else:
+        increment_post_view_task.delay(slug, ip_address)
+
+@method_decorator(use_replica, name="get")
 class PostHeadingView(StandardAPIView):
     # Establecer un api key para permitir/denegar el uso de la solicitud HTTP
     #permission_classes = [HasValidAPIKey]
     def get(self, request):
         post_slug = request.query_params.get("slug")
-        heading_objects = Heading.objects.filter(post__slug=post_slug)
-        serialized_data = HeadingSerializer(heading_objects, many=True).data
-        return self.response(serialized_data)
+        try:
+            #La tabla de contenido viene dentro del detalle del post en cache
+            serialized_post = get_or_compute(f"post_detail:{post_slug}",
+                                             lambda: PostDetailView.get_post(post_slug))
+        except Post.DoesNotExist:
+            return self.response([])
+        return self.response(serialized_post["headings"])
 
     # serializer_class = HeadingSerializer
     #HACER CACHE AUTOMATICA de 1 minuto
@@ -170,91 +196,90 @@ class IncrementPostClickView(StandardAPIView):
         """Incrementa el contador de clicks de un post basado en su slug"""
         data = request.data
         try:
-            post = Post.postobjects.get(slug=data['slug'])
-        except Post.DoesNotExist:
-            raise NotFound(detail="The request post does not exist")
-
-        try:
-            post_analytics, created = PostAnalytics.objects.get_or_create(post=post)
-            post_analytics.increment_click()
+            #Los clicks se acumulan en redis y se sincronizan con sync_clicks_to_db
+            clicks = post_clicks.record(redis_client, data['slug'])
         except Exception as e:
             raise APIException(
                 detail=f"An  Error Ocurred While updating Post Analytics: {str(e)}")
+        if clicks is None:
+            raise NotFound(detail="The request post does not exist")
         return self.response({
             "message":"Click Incremented Successfully",
-            "clicks": post_analytics.clicks
+            "clicks": clicks
         })
 
 class IncrementCategoryClickView(StandardAPIView):
     # Establecer un api key para permitir/denegar el uso de la solicitud HTTP
     #permission_classes = [HasValidAPIKey]
 
-    def category(self,request):
-        """Incrementa el contador de clicks de un post basado en su slug"""
+    def post(self,request):
+        """Incrementa el contador de clicks de una categoria basado en su slug"""
         data = request.data
         try:
-            category = Category.objects.get(slug=data['slug'])
-        except Category.DoesNotExist:
-            raise NotFound(detail="The request category does not exist")
-
-        try:
-            category_analytics, created = CategoryAnalytics.objects.get_or_create(category=category)
-            category_analytics.increment_click()
+            #Los clicks se acumulan en redis y se sincronizan con sync_clicks_to_db
+            clicks = category_clicks.record(redis_client, data['slug'])
         except Exception as e:
             raise APIException(
                 detail=f"An  Error Ocurred While updating Category Analytics: {str(e)}")
+        if clicks is None:
+            raise NotFound(detail="The request category does not exist")
         return self.response({
             "message":"Click Incremented Successfully",
-            "clicks": category_analytics.clicks
+            "clicks": clicks
         })
 
+#Vista de django sin DRF (negociacion de contenido, parsers, sesion): el beacon llega
+#como text/plain o formulario desde navigator.sendBeacon y se responde 204 sin cuerpo
+@method_decorator(csrf_exempt, name="dispatch")
+class DwellTimeBeaconView(View):
+    buffer = None
+
+    def post(self, request):
+        """Registra el tiempo en pagina {"id": ..., "seconds": ...} en redis"""
+        try:
+            object_id, seconds = parse_beacon(request.body)
+        except InvalidBeacon as e:
+            return HttpResponseBadRequest(str(e))
+        self.buffer.record(redis_client, object_id, seconds)
+        return HttpResponse(status=204)
+
+class PostDwellTimeView(DwellTimeBeaconView):
+    buffer = post_dwell
+
+class CategoryDwellTimeView(DwellTimeBeaconView):
+    buffer = category_dwell
+
+@method_decorator(use_replica, name="get")
 class CategoryListView(StandardAPIView):
     def get(self, request, *args, **kwargs):
 
         try:
             search = request.query_params.get("search", "").strip()
             cache_key = f"category_list:{search}"
-            cached_categories = cache.get(cache_key)
-            if cached_categories:
-                if search != "":
-                    search_lower = search.lower()
-                    cached_categories = [
-                        category for category in cached_categories
-                        if search_lower in category.get('name','').lower()
-                           or search_lower in category.get('description','').lower()
-                           or search_lower in category.get('title','').lower()
-                           or search_lower in category.get('slug', '').lower()
-                    ]
-
-                for category in cached_categories:
-                    redis_client.incr(f"category:impressions:{category.id}")
-                return self.paginate(request, cached_categories)
-
-            categories = Category.objects.all()
-            # si no existe, obtener los posts de la base de datos
-            if search != "":
-                categories = categories.filter(
-                    Q(name__icontains=search) |
-                    Q(description__icontains=search) |
-                    Q(title__icontains=search) |
-                    Q(slug__icontains=search)
-                )
-
-
-            if not categories.exists():
-                raise NotFound(detail="No Categories Found!")
-
-            serialized_categories = CategoryListSerializer(categories, many=True).data
-
-            cache.set(cache_key, serialized_categories, timeout=(60 * 5))
-
-            for category in categories:
-                redis_client.incr(f"category:impressions:{category.id}")
-            return  self.paginate(request, serialized_categories)
+            response, category_ids = cached_page_response(
+                request, cache_key, lambda page_request: self.get_page(page_request, search))
+
+            category_impressions.record(redis_client, category_ids)
+            return response
 
         except Exception as e:
             raise APIException(detail=f"An Unexpected Error Ocurred: {str(e)}")
 
+    def get_page(self, request, search):
+        categories = Category.objects.all()
+        order = ("name", "id")
+        # si no existe, obtener los posts de la base de datos
+        if search != "":
+            categories = category_index.search(categories, search)
+            order = ("-rank", "name", "id")
+
+        if not categories.exists():
+            raise NotFound(detail="No Categories Found!")
+
+        data, page = paginate_queryset(request, categories, CategoryListSerializer, order)
+        return data, category_list_tags(page)
+
+@method_decorator(use_replica, name="get")
 class CategoryDetailView(StandardAPIView):
     def get(self, request):
         try:
@@ -264,19 +289,79 @@ class CategoryDetailView(StandardAPIView):
 
             category = get_object_or_404(Category, slug=slug)
 
-            posts = Post.postobjects.filter(category=category).select_related("category").prefetch_related(
-                Prefetch("post_analytics", to_attr="analytics_cache")
-            )
+            #Incluye los posts de todas las subcategorias con una sola consulta por rango
+            #de path, con descendants=false solo los de la categoria
+            if request.query_params.get("descendants", "true").lower() == "false":
+                posts = Post.postobjects.filter(category=category)
+            elif not category.path:
+                #Categoria anterior a la columna path (rebuild_category_paths), el rango
+                #sobre "" incluiria todas; se usan los ids del arbol por parent_id
+                posts = Post.postobjects.filter(category__in=get_tree().descendant_ids(category.id))
+            else:
+                posts = Post.postobjects.filter(Category.subtree_filter(category.path, "category__"))
 
             if not posts.exists():
                 raise NotFound(detail=f"No Posts Found For Category '{category.name}' ")
 
-            serialized_posts = PostListSerializer(posts, many=True).data
-
-            return self.paginate(request, serialized_posts)
+            #Paginar en la base de datos y serializar solo los posts de la pagina
+            data, _ = paginate_queryset(request, posts, PostListSerializer, ("-created_at", "-id"))
+            return Response(data)
         except Exception as e:
             raise APIException(detail=f"An unexpected Error occurred: {str(e)}")
 
+@method_decorator(use_replica, name="get")
+class CategoryTreeView(StandardAPIView):
+    def get(self, request):
+        """Arbol completo de categorias, o con ?slug= el subarbol y sus migas de pan"""
+        tree = get_tree()
+        slug = request.query_params.get("slug")
+        if not slug:
+            return self.response(tree.as_data())
+
+        node = tree.by_slug.get(slug)
+        if node is None:
+            raise NotFound(detail="The request category does not exist")
+        return self.response({
+            "breadcrumb": [{"id": str(item["id"]), "name": item["name"], "slug": item["slug"]}
+                           for item in tree.ancestors(node["id"])],
+            "tree": tree.as_data([node]),
+        })
+
+@method_decorator(use_replica, name="get")
+class AnalyticsSeriesView(StandardAPIView):
+    """Serie de tiempo de las analiticas por hora o por dia, ejemplo:
+    ?slug=<slug>&period=day&length=30"""
+    rollup_model = None
+    related_field = None
+    queryset = None
+    max_length = {"hour": 24 * 14, "day": 366}
+
+    def get(self, request):
+        slug = request.query_params.get("slug")
+        period = request.query_params.get("period", "day")
+        if not slug:
+            return self.error("Missing Slug Parameter")
+        if period not in PERIODS:
+            return self.error(f"Invalid period, use one of: {', '.join(PERIODS)}")
+        try:
+            length = min(int(request.query_params.get("length", 30)), self.max_length[period])
+        except ValueError:
+            return self.error("Invalid length")
+        object_id = self.queryset.filter(slug=slug).values_list("id", flat=True).first()
+        if object_id is None:
+            raise NotFound(detail=f"The request {self.related_field} does not exist")
+        return self.response(series(self.rollup_model, self.related_field, object_id, period, max(length, 1)))
+
+class PostAnalyticsSeriesView(AnalyticsSeriesView):
+    rollup_model = PostAnalyticsRollup
+    related_field = "post"
+    queryset = Post.postobjects.all()
+
+class CategoryAnalyticsSeriesView(AnalyticsSeriesView):
+    rollup_model = CategoryAnalyticsRollup
+    related_field = "category"
+    queryset = Category.objects.all()
+
 class GenerateFakePostsView(StandardAPIView):
     def get(self, request):
         fake = Faker()
@@ -305,22 +390,25 @@ class GenerateFakeAnalyticsView(StandardAPIView):
     def get(self, request):
         fake = Faker()
 
-        posts = Post.objects.all()
-        if not posts:
+        post_ids = list(Post.objects.values_list("id", flat=True))
+        if not post_ids:
             return self.response({"error":"No hay posts disponibles para generar analiticas"}, status=400)
 
-        analytics_to_generate = len(posts)
-        for post in posts:
+        #Crear las analiticas que falten y actualizarlas todas por lotes
+        PostAnalytics.objects.bulk_create([PostAnalytics(post_id=post_id) for post_id in post_ids],
+                                          ignore_conflicts=True)
+        analytics = list(PostAnalytics.objects.filter(post_id__in=post_ids))
+        for post_analytics in analytics:
             views = random.randint(50,1000)
             impressions = views + random.randint(100,2000)
             clicks = random.randint(0, views)
-            avg_time_on_page = round(random.uniform(10,300), 2)
-
-            analytics, created = PostAnalytics.objects.get_or_create(post=post)
-            analytics.views = views
-            analytics.impressions = impressions
-            analytics.clicks = clicks
-            analytics.avg_time_on_page = avg_time_on_page
-            analytics._update_click_through_rate()
-            analytics.save()
-        return self.response({"message": f"Analiticas generadas para {analytics_to_generate} posts."})
\ No newline at end of file
+            post_analytics.views = views
+            post_analytics.impressions = impressions
+            post_analytics.clicks = clicks
+            post_analytics.click_through_rate = (clicks / impressions) * 100
+            post_analytics.avg_time_on_page = round(random.uniform(10,300), 2)
+        PostAnalytics.objects.bulk_update(
+            analytics, ["views", "impressions", "clicks", "click_through_rate", "avg_time_on_page"],
+            batch_size=1000,
+        )
+        return self.response({"message": f"Analiticas generadas para {len(analytics)} posts."})
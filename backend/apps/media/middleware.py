@@ -0,0 +1,74 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .signing import signer, access_mode
+
+
+class CloudFrontCookieMiddleware:
+    """Con cloudfront_access = "signed_cookie" entrega las cookies de CloudFront a
+    cada cliente (una vez por intervalo), las URLs de los media van sin firmar"""
+
+    #Bajo ASGI un middleware solo sincrono obliga a ejecutar las vistas async en un hilo
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.set_cookies(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.set_cookies(request, await self.get_response(request))
+
+    def set_cookies(self, request, response):
+        if access_mode() != "signed_cookie":
+            return response
+
+        cookies, expires = signer.cookies()
+        if request.COOKIES.get("CloudFront-Policy") == cookies["CloudFront-Policy"]:
+            return response
+        max_age = int(expires - time.time())
+        for name, value in cookies.items():
+            response.set_cookie(
+                name, value, max_age=max_age,
+                #Debe ser un dominio comun a la API y a CloudFront, ejemplo: .example.com
+                domain=getattr(settings, "MEDIA_COOKIE_DOMAIN", None),
+                secure=True, httponly=True, samesite="Lax",
+            )
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoiseMiddleware que tambien es async. WhiteNoise 6 es solo sincrono y con
+    ASGI django ejecutaria el resto de la cadena (y las vistas async) en un hilo"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            #find_file revisa el disco
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
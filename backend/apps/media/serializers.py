@@ -1,26 +1,51 @@
-import datetime
-from django.conf import settings
-from django.utils import timezone
+from operator import attrgetter
+
 #Hacer el llamado a cloudfront de AWS para retornar la url del media
 #que si podemos usar para ver el archivo de medios
+from django.db import models
 from rest_framework import serializers
-from botocore.signers import CloudFrontSigner
-from utils.s3_utils import rsa_signer
+
+from core.timing import timed
 from .models import Media
+from .signing import signer
+
+
+class SignedMediaListSerializer(serializers.ListSerializer):
+    """Con many=True firma de una sola vez las URLs de todos los media de la lista.
+    El serializer hijo indica donde estan los media con `media_fields`"""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        keys = []
+        for item in items:
+            for field in getattr(self.child, "media_fields", ()):
+                try:
+                    media = attrgetter(field)(item) if field else item
+                except AttributeError:
+                    continue
+                if media is not None and media.key:
+                    keys.append(media.key)
+        if keys:
+            with timed("sign"):
+                self.context.setdefault("signed_urls", {}).update(signer.sign_many(keys))
+        return super().to_representation(items)
+
 
 class MediaSerializer(serializers.ModelSerializer):
     url = serializers.SerializerMethodField()
+    #El propio objeto es el media
+    media_fields = ("",)
 
     class Meta:
         model = Media
         fields = "__all__"
+        list_serializer_class = SignedMediaListSerializer
+
     def get_url(self, obj):
         if not obj.key:
             return None
-
-        cloudfront_key_id = settings.AWS_CLOUDFRONT_KEY_ID
-        signer = CloudFrontSigner(cloudfront_key_id, rsa_signer)
-        expire_date = timezone.now() + datetime.timedelta(seconds=60)
-        obj_url = f"https://{settings.AWS_CLOUDFRONT_DOMAIN}/{obj.key}"
-        signed_url = signer.generate_presigned_url(obj_url, date_less_than=expire_date)
-        return signed_url
\ No newline at end of file
+        signed_urls = self.context.get("signed_urls", {})
+        if obj.key in signed_urls:
+            return signed_urls[obj.key]
+        with timed("sign"):
+            return signer.sign(obj.key)
@@ -0,0 +1,171 @@
+"""Firma de URLs de CloudFront para los media.
+La expiracion se redondea a intervalos fijos (MEDIA_URL_BUCKET): todas las firmas de
+un mismo intervalo son identicas, asi que se guardan en un LRU del proceso y en la
+cache (redis) mientras les quede al menos MEDIA_URL_EXPIRES segundos de vida.
+Si el storage de los media usa cloudfront_access = "signed_cookie" o "public" las
+URLs no se firman y el acceso se da con las cookies de `cookies()`.
+
+Lo que guarde URLs firmadas (el cache del blog) las obtiene dentro de
+track_expiry() para no servirlas despues de su expiracion"""
+import base64
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from botocore.signers import CloudFrontSigner
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from utils.s3_utils import rsa_signer
+
+#URLs firmadas que se guardan en memoria por proceso
+LRU_SIZE = 10000
+
+_expiry = ContextVar("signed_url_expiry", default=None)
+
+
+@contextmanager
+def track_expiry():
+    """Registra en scope["expires"] la expiracion mas temprana de las URLs firmadas
+    dentro del bloque (None si no se firmo ninguna)"""
+    scope = {"expires": None}
+    token = _expiry.set(scope)
+    try:
+        yield scope
+    finally:
+        _expiry.reset(token)
+
+
+def note_expiry(expires):
+    """Informa al track_expiry() activo que se uso una URL que vence en `expires`"""
+    scope = _expiry.get()
+    if scope is not None and expires is not None and (scope["expires"] is None or expires < scope["expires"]):
+        scope["expires"] = expires
+
+
+def access_mode():
+    """cloudfront_access del storage de los media (DEFAULT_FILE_STORAGE)"""
+    storage_class = import_string(settings.DEFAULT_FILE_STORAGE)
+    return getattr(storage_class, "cloudfront_access", "signed_url")
+
+
+def _url_b64encode(data):
+    #Base64 con los caracteres que acepta CloudFront en URLs y cookies
+    return base64.b64encode(data).replace(b"+", b"-").replace(b"=", b"_").replace(b"/", b"~").decode("utf-8")
+
+
+class CloudFrontURLSigner:
+    def __init__(self, lru_size=LRU_SIZE):
+        self.lru_size = lru_size
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def lifetime(self):
+        #Vida minima que le queda a una URL entregada
+        return getattr(settings, "MEDIA_URL_EXPIRES", 60)
+
+    @property
+    def bucket(self):
+        return getattr(settings, "MEDIA_URL_BUCKET", 600)
+
+    def expires_at(self, now=None, lifetime=None, bucket=None):
+        """Fin del intervalo actual, siempre al menos `lifetime` segundos despues de ahora"""
+        now = int(time.time() if now is None else now)
+        lifetime = self.lifetime if lifetime is None else lifetime
+        bucket = self.bucket if bucket is None else bucket
+        return (now + lifetime) // bucket * bucket + bucket
+
+    @staticmethod
+    def unsigned_url(key):
+        return f"https://{settings.AWS_CLOUDFRONT_DOMAIN}/{key}"
+
+    def sign(self, key):
+        return self.sign_many([key])[key]
+
+    def sign_many(self, keys):
+        """Firma varias claves de S3, retorna {key: url}. Se busca primero en el LRU,
+        luego en la cache con un solo get_many, y solo se firma lo que falta"""
+        if access_mode() != "signed_url":
+            return {key: self.unsigned_url(key) for key in keys}
+        now = time.time()
+        expires = self.expires_at(now)
+        if keys:
+            note_expiry(expires)
+        urls = {}
+        missing = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                url = self._urls.get((key, expires))
+                if url is None:
+                    missing.append(key)
+                else:
+                    self._urls.move_to_end((key, expires))
+                    urls[key] = url
+        if not missing:
+            return urls
+
+        cache_keys = {self._cache_key(key, expires): key for key in missing}
+        cached = cache.get_many(list(cache_keys))
+        signed = {cache_keys[cache_key]: url for cache_key, url in cached.items()}
+
+        to_sign = [key for key in missing if key not in signed]
+        if to_sign:
+            signer = CloudFrontSigner(settings.AWS_CLOUDFRONT_KEY_ID, rsa_signer)
+            date_less_than = datetime.datetime.fromtimestamp(expires, tz=datetime.timezone.utc)
+            new = {
+                key: signer.generate_presigned_url(self.unsigned_url(key), date_less_than=date_less_than)
+                for key in to_sign
+            }
+            #Se guarda mientras le queden al menos `lifetime` segundos
+            timeout = int(expires - self.lifetime - now)
+            if timeout > 0:
+                cache.set_many({self._cache_key(key, expires): url for key, url in new.items()}, timeout)
+            signed.update(new)
+
+        with self._lock:
+            for key, url in signed.items():
+                self._urls[(key, expires)] = url
+            while len(self._urls) > self.lru_size:
+                self._urls.popitem(last=False)
+        urls.update(signed)
+        return urls
+
+    def cookies(self, now=None):
+        """Cookies de CloudFront con una politica personalizada para todos los media
+        (https://{dominio}/{location}/*). Se firma una sola vez por intervalo de
+        MEDIA_COOKIE_BUCKET, retorna (cookies, expiracion)"""
+        expires = self.expires_at(now, lifetime=getattr(settings, "MEDIA_COOKIE_EXPIRES", 60 * 60),
+                                  bucket=getattr(settings, "MEDIA_COOKIE_BUCKET", 60 * 60 * 6))
+        storage_class = import_string(settings.DEFAULT_FILE_STORAGE)
+        resource = f"https://{settings.AWS_CLOUDFRONT_DOMAIN}/{getattr(storage_class, 'location', '')}/*"
+        with self._lock:
+            cookies = self._urls.get((resource, expires))
+        if cookies is None:
+            signer = CloudFrontSigner(settings.AWS_CLOUDFRONT_KEY_ID, rsa_signer)
+            policy = signer.build_policy(
+                resource, datetime.datetime.fromtimestamp(expires, tz=datetime.timezone.utc)).encode("utf-8")
+            cookies = {
+                "CloudFront-Policy": _url_b64encode(policy),
+                "CloudFront-Signature": _url_b64encode(rsa_signer(policy)),
+                "CloudFront-Key-Pair-Id": settings.AWS_CLOUDFRONT_KEY_ID,
+            }
+            with self._lock:
+                self._urls[(resource, expires)] = cookies
+        return cookies, expires
+
+    def clear(self):
+        with self._lock:
+            self._urls.clear()
+
+    @staticmethod
+    def _cache_key(key, expires):
+        return f"media:url:{expires}:{hashlib.md5(key.encode('utf-8')).hexdigest()}"
+
+
+signer = CloudFrontURLSigner()
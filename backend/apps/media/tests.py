@@ -1,3 +1,138 @@
-from django.test import TestCase
+import base64
+import json
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+from asgiref.sync import iscoroutinefunction
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from utils import s3_utils
+from .middleware import CloudFrontCookieMiddleware, StaticFilesMiddleware
+from .models import Media
+from .serializers import MediaSerializer
+from .signing import signer, track_expiry
 
 # Create your tests here.
+
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+PEM = PRIVATE_KEY.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+
+
+def cloudfront_b64decode(value):
+    return base64.b64decode(value.replace("-", "+").replace("_", "=").replace("~", "/"))
+
+
+@override_settings(AWS_CLOUDFRONT_KEY=PEM, AWS_CLOUDFRONT_KEY_ID="KTEST", AWS_CLOUDFRONT_DOMAIN="cdn.example.com",
+                   MEDIA_URL_EXPIRES=60, MEDIA_URL_BUCKET=600)
+class SignedURLTest(TestCase):
+    def setUp(self):
+        signer.clear()
+        cache.clear()
+        self.addCleanup(signer.clear)
+        self.addCleanup(cache.clear)
+        self.media = [Media.objects.create(name=f"image {i}", size="1", type="image/png",
+                                           key=f"media/image-{i}.png", media_type="image")
+                      for i in range(3)]
+
+    def test_signature_is_valid(self):
+        url = MediaSerializer(self.media[0]).data["url"]
+        query = parse_qs(urlparse(url).query)
+        self.assertTrue(url.startswith("https://cdn.example.com/media/image-0.png?"))
+        self.assertEqual(query["Key-Pair-Id"], ["KTEST"])
+        expires = int(query["Expires"][0])
+        self.assertEqual(expires % 600, 0)
+        policy = ('{"Statement":[{"Resource":"https://cdn.example.com/media/image-0.png",'
+                  f'"Condition":{{"DateLessThan":{{"AWS:EpochTime":{expires}}}}}}}]}}')
+        PRIVATE_KEY.public_key().verify(cloudfront_b64decode(query["Signature"][0]), policy.encode("utf-8"),
+                                        padding.PKCS1v15(), hashes.SHA1())
+
+    def test_urls_are_reused_within_the_bucket(self):
+        s3_utils.load_private_key.cache_clear()
+        with mock.patch("apps.media.signing.rsa_signer", wraps=s3_utils.rsa_signer) as rsa_signer:
+            first = MediaSerializer(self.media, many=True).data
+            second = MediaSerializer(self.media, many=True).data
+            signer.clear()
+            #Otro proceso: el LRU esta vacio pero la URL sigue en la cache
+            third = MediaSerializer(self.media, many=True).data
+        self.assertEqual(first, second)
+        self.assertEqual(first, third)
+        self.assertEqual(rsa_signer.call_count, 3)
+        self.assertEqual(s3_utils.load_private_key.cache_info().misses, 1)
+
+    def test_track_expiry_reports_the_signed_urls_expiry(self):
+        with track_expiry() as scope:
+            MediaSerializer(self.media, many=True).data
+        self.assertEqual(scope["expires"], signer.expires_at())
+        with track_expiry() as scope:
+            MediaSerializer(Media(name="empty", size="1", type="image/png", key="", media_type="image")).data
+        self.assertIsNone(scope["expires"])
+
+    def test_expiry_moves_to_next_bucket(self):
+        #Con menos de 60 segundos de vida se firma para el siguiente intervalo
+        self.assertEqual(signer.expires_at(1200 - 61), 1200)
+        self.assertEqual(signer.expires_at(1200 - 60), 1800)
+
+
+@override_settings(AWS_CLOUDFRONT_KEY=PEM, AWS_CLOUDFRONT_KEY_ID="KTEST", AWS_CLOUDFRONT_DOMAIN="cdn.example.com",
+                   DEFAULT_FILE_STORAGE="core.storage_backends.SignedCookieMediaStorage",
+                   MEDIA_COOKIE_EXPIRES=3600, MEDIA_COOKIE_BUCKET=21600)
+class SignedCookieTest(TestCase):
+    def setUp(self):
+        signer.clear()
+        self.addCleanup(signer.clear)
+        self.media = Media.objects.create(name="image", size="1", type="image/png",
+                                          key="media/image.png", media_type="image")
+
+    def test_urls_are_not_signed(self):
+        with mock.patch("apps.media.signing.rsa_signer") as rsa_signer:
+            data = MediaSerializer([self.media], many=True).data
+        self.assertEqual(data[0]["url"], "https://cdn.example.com/media/image.png")
+        rsa_signer.assert_not_called()
+
+    def test_policy_covers_every_media(self):
+        cookies, expires = signer.cookies()
+        policy = cloudfront_b64decode(cookies["CloudFront-Policy"])
+        self.assertEqual(json.loads(policy), {"Statement": [{
+            "Resource": "https://cdn.example.com/media/*",
+            "Condition": {"DateLessThan": {"AWS:EpochTime": expires}},
+        }]})
+        self.assertEqual(expires % 21600, 0)
+        self.assertEqual(cookies["CloudFront-Key-Pair-Id"], "KTEST")
+        PRIVATE_KEY.public_key().verify(cloudfront_b64decode(cookies["CloudFront-Signature"]), policy,
+                                        padding.PKCS1v15(), hashes.SHA1())
+
+    def test_middleware_sets_cookies_once(self):
+        middleware = CloudFrontCookieMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+        with mock.patch("apps.media.signing.rsa_signer", wraps=s3_utils.rsa_signer) as rsa_signer:
+            first = middleware(factory.get("/api/blog/posts/"))
+            request = factory.get("/api/blog/posts/")
+            request.COOKIES = {name: morsel.value for name, morsel in first.cookies.items()}
+            second = middleware(request)
+        self.assertEqual(set(first.cookies), {"CloudFront-Policy", "CloudFront-Signature", "CloudFront-Key-Pair-Id"})
+        self.assertTrue(first.cookies["CloudFront-Policy"]["httponly"])
+        self.assertEqual(len(second.cookies), 0)
+        self.assertEqual(rsa_signer.call_count, 1)
+
+    async def test_middleware_is_async_capable(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = CloudFrontCookieMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get("/api/blog/posts/"))
+        self.assertIn("CloudFront-Policy", response.cookies)
+
+    async def test_static_files_middleware_is_async_capable(self):
+        async def get_response(request):
+            return HttpResponse("api")
+
+        middleware = StaticFilesMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get("/api/blog/posts/"))
+        self.assertEqual(response.content, b"api")
@@ -12,6 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+#Antes de cargar settings: sin conexiones persistentes bajo ASGI (DATABASES en settings.py)
+os.environ['DJANGO_ASGI'] = '1'
 
 django_asgi_app = get_asgi_application()
 
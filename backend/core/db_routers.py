@@ -0,0 +1,157 @@
+"""Router de lecturas a las replicas de PostgreSQL (DATABASES "replica_<n>").
+
+Solo se leen de una replica las consultas hechas dentro de replica_reads() (las vistas
+de lectura del blog y los reportes de analiticas usan el decorador use_replica), todo lo
+demas va a "default". Las lecturas vuelven a "default" cuando:
+
+- el cliente hizo un cambio hace menos de DATABASE_REPLICA_STICKY_SECONDS (cookie que
+  pone ReplicaStickinessMiddleware despues de una edicion en el admin)
+- hubo un cambio en el contenido del blog en ese tiempo (mark_primary_write, las
+  entradas del cache que se invalidaron no se deben recalcular con datos viejos)
+- la replica no responde, se deja de usar durante REPLICA_RETRY_SECONDS"""
+import functools
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, DEFAULT_DB_ALIAS, OperationalError
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = "replica_"
+STICKY_COOKIE = "primary_reads"
+RECENT_WRITE_KEY = "db:recent_write"
+REPLICA_RETRY_SECONDS = 30
+
+#None: lecturas a "default". Un dict mientras esta activo replica_reads()
+_reads = ContextVar("replica_reads", default=None)
+#Alias -> time.monotonic() hasta el que no se usa la replica
+_down = {}
+
+
+def sticky_seconds():
+    return getattr(settings, "DATABASE_REPLICA_STICKY_SECONDS", 10)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+@contextmanager
+def replica_reads(primary=False):
+    """Las lecturas dentro del bloque pueden ir a una replica, con primary=True (cliente
+    con cambios recientes) siguen en "default" """
+    token = _reads.set({"primary": primary, "alias": None})
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def use_replica(view):
+    """Decorador de vistas (o de metodos con method_decorator) de solo lectura"""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            with replica_reads(primary=_is_sticky(request)):
+                return await view(request, *args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with replica_reads(primary=_is_sticky(request)):
+                return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _is_sticky(request):
+    return STICKY_COOKIE in getattr(request, "COOKIES", {})
+
+
+def mark_primary_write():
+    """Durante DATABASE_REPLICA_STICKY_SECONDS todas las lecturas van a "default" """
+    if replica_aliases():
+        cache.set(RECENT_WRITE_KEY, 1, timeout=sticky_seconds())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _reads.get()
+        if state is None or state["primary"]:
+            return DEFAULT_DB_ALIAS
+        if state["alias"] is None:
+            #Se elige una vez por bloque: todas sus consultas ven el mismo estado
+            state["alias"] = self._choose_replica()
+        return state["alias"]
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #Las replicas tienen los mismos datos que "default"
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+    @staticmethod
+    def _choose_replica():
+        now = time.monotonic()
+        replicas = [alias for alias in replica_aliases() if _down.get(alias, 0) <= now]
+        if not replicas or cache.get(RECENT_WRITE_KEY):
+            return DEFAULT_DB_ALIAS
+        random.shuffle(replicas)
+        for alias in replicas:
+            try:
+                #Con CONN_HEALTH_CHECKS una conexion persistente rota se reabre aqui
+                connections[alias].ensure_connection()
+                return alias
+            except OperationalError as e:
+                logger.warning(f"Replica {alias} unavailable, reading from primary: {str(e)}")
+                _down[alias] = now + REPLICA_RETRY_SECONDS
+        return DEFAULT_DB_ALIAS
+
+
+class ReplicaStickinessMiddleware:
+    """Despues de un cambio de un usuario del staff (el admin) sus lecturas van a
+    "default" durante DATABASE_REPLICA_STICKY_SECONDS, para que vea lo que guardo"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.is_write(request, response) and self.is_staff(request):
+            self.set_cookie(response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        #request.user consulta la sesion en la base de datos
+        if self.is_write(request, response) and await sync_to_async(self.is_staff)(request):
+            self.set_cookie(response)
+        return response
+
+    @staticmethod
+    def is_write(request, response):
+        return request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400 \
+            and bool(replica_aliases())
+
+    @staticmethod
+    def is_staff(request):
+        return getattr(getattr(request, "user", None), "is_staff", False)
+
+    @staticmethod
+    def set_cookie(response):
+        response.set_cookie(STICKY_COOKIE, "1", max_age=sticky_seconds(), httponly=True, samesite="Lax")
@@ -0,0 +1,81 @@
+"""Clientes de redis compartidos por proceso, uno por pool logico de settings.REDIS_POOLS
+("cache", "counters", "broker").
+
+Los pools se crean en el primer uso, no al importar, y se descartan despues de un
+fork (gunicorn --preload, workers de celery): cada proceso abre sus propias conexiones.
+El pool "cache" es el de django_redis para no tener dos pools contra el mismo redis"""
+import os
+import threading
+
+import redis
+from django.conf import settings
+
+from .timing import TimedRedis
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def pool_settings(name):
+    """URL y kwargs del ConnectionPool de un pool logico"""
+    options = dict(settings.REDIS_POOLS[name])
+    return options.pop("url"), options
+
+
+def get_redis(name="counters"):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = _create(name)
+    return client
+
+
+def _create(name):
+    if name == "cache":
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    url, options = pool_settings(name)
+    return TimedRedis(connection_pool=redis.ConnectionPool.from_url(url, **options))
+
+
+def _reset():
+    global _lock
+    _clients.clear()
+    _lock = threading.Lock()
+
+
+#Proceso hijo: las conexiones y el lock heredados son del padre
+os.register_at_fork(after_in_child=_reset)
+
+
+class LazyRedis:
+    """Cliente que se resuelve con get_redis(name) en cada uso, para guardarlo en una
+    variable de modulo sin crear conexiones al importar"""
+
+    def __init__(self, name="counters"):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_redis(self.name), attr)
+
+    def __repr__(self):
+        return f"<LazyRedis {self.name}>"
+
+
+def pool_stats():
+    """Uso de los pools creados en este proceso"""
+    stats = {}
+    for name, client in list(_clients.items()):
+        pool = client.connection_pool
+        in_use = len(getattr(pool, "_in_use_connections", ()))
+        max_connections = pool.max_connections
+        stats[name] = {
+            "max_connections": max_connections,
+            "created": getattr(pool, "_created_connections", in_use),
+            "in_use": in_use,
+            "idle": len(getattr(pool, "_available_connections", ())),
+            "utilization": round(in_use / max_connections, 3) if max_connections else 0,
+        }
+    return stats
@@ -76,14 +76,17 @@ CKEDITOR_CONFIGS = {
 CKEDITOR_UPLOAD_PATH = 'media/'
 
 MIDDLEWARE = [
+    'core.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'apps.media.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.media.middleware.CloudFrontCookieMiddleware',
+    'core.db_routers.ReplicaStickinessMiddleware',
 ]
 
 CKEDITOR_CONFIGS = {
@@ -130,9 +133,24 @@ DATABASES = {
         'OPTIONS': {
             'client_encoding': 'UTF8',
         },
+        #Reusar la conexion entre requests durante estos segundos (0: una por request),
+        #antes de reusarla se verifica que siga viva. Solo con WSGI: bajo ASGI (core/asgi.py)
+        #cada hilo de sync_to_async abre su propia conexion y con CONN_MAX_AGE > 0 quedan
+        #abiertas hasta agotar max_connections de PostgreSQL
+        'CONN_MAX_AGE': 0 if env.bool("DJANGO_ASGI", default=False) else env.int("DATABASE_CONN_MAX_AGE", default=0),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+#Replicas de lectura (core/db_routers.py), mismas credenciales que "default".
+#Sin replicas todas las consultas van a "default"
+for index, host in enumerate(env.list("DATABASE_REPLICA_HOSTS", default=[])):
+    DATABASES[f"replica_{index}"] = {**DATABASES["default"], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ["core.db_routers.ReplicaRouter"]
+#Segundos que las lecturas siguen en "default" despues de un cambio (retraso de replicacion)
+DATABASE_REPLICA_STICKY_SECONDS = env.int("DATABASE_REPLICA_STICKY_SECONDS", default=10)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -187,14 +205,54 @@ REST_FRAMEWORK = {
     ]
 }
 
-REDIS_HOST = env("REDIS_HOST")
+REDIS_URL = env("REDIS_URL")
+#Pools de conexiones a redis por proceso (core/redis_pools.py). Cada pool logico puede
+#apuntar a otro servidor, health_check_interval hace PING a una conexion que estuvo
+#inactiva mas de esos segundos antes de usarla
+REDIS_POOL_DEFAULTS = {
+    "max_connections": env.int("REDIS_MAX_CONNECTIONS", default=50),
+    "socket_timeout": env.float("REDIS_SOCKET_TIMEOUT", default=5),
+    "socket_connect_timeout": env.float("REDIS_SOCKET_CONNECT_TIMEOUT", default=2),
+    "socket_keepalive": env.bool("REDIS_SOCKET_KEEPALIVE", default=True),
+    "health_check_interval": env.int("REDIS_HEALTH_CHECK_INTERVAL", default=30),
+}
+REDIS_POOLS = {
+    #Cache de django (django_redis)
+    "cache": {**REDIS_POOL_DEFAULTS, "url": env("REDIS_CACHE_URL", default=REDIS_URL)},
+    #Contadores, rankings, streams y buffers de apps/blog
+    "counters": {**REDIS_POOL_DEFAULTS, "url": env("REDIS_COUNTERS_URL", default=REDIS_URL)},
+    #Broker de celery (el pool lo maneja kombu)
+    "broker": {**REDIS_POOL_DEFAULTS, "url": env("CELERY_BROKER_URL", default=REDIS_URL),
+               "max_connections": env.int("REDIS_BROKER_MAX_CONNECTIONS", default=10)},
+}
+
+#Motor de visitantes unicos de los posts: "exact" (una fila PostView por IP)
+#o "hll" (HyperLogLog en redis, aproximado y sin crecer la base de datos)
+BLOG_UNIQUE_VIEWS = env("BLOG_UNIQUE_VIEWS", default="exact")
+#Como llegan las vistas al motor: "stream" (stream de redis procesado por lotes)
+#o "task" (una tarea de celery por request)
+BLOG_VIEW_INGESTION = env("BLOG_VIEW_INGESTION", default="stream")
+#Vida media en segundos de las vistas y clicks en el ranking sorting=trending
+BLOG_TRENDING_HALF_LIFE = env.int("BLOG_TRENDING_HALF_LIFE", default=60 * 60 * 24)
+#Tiempo maximo en segundos que cuenta un beacon de tiempo en pagina
+BLOG_DWELL_MAX_SECONDS = env.int("BLOG_DWELL_MAX_SECONDS", default=60 * 30)
+#Segundos que cada proceso junta los beacons en memoria antes de enviarlos a redis
+#en un solo pipeline (0: un pipeline por beacon)
+BLOG_DWELL_BUFFER_SECONDS = env.float("BLOG_DWELL_BUFFER_SECONDS", default=0)
+#Usar las versiones async de los listados, el detalle y los headings (solo con ASGI,
+#bajo WSGI cada request async necesita su propio event loop)
+BLOG_ASYNC_VIEWS = env.bool("BLOG_ASYNC_VIEWS", default=False)
+#Retencion en dias de las filas PostView/CategoryView (ya sumadas en los rollups diarios)
+#y de los rollups por hora. Los rollups diarios no se borran
+BLOG_RAW_VIEWS_RETENTION_DAYS = env.int("BLOG_RAW_VIEWS_RETENTION_DAYS", default=90)
+BLOG_HOURLY_ROLLUP_RETENTION_DAYS = env.int("BLOG_HOURLY_ROLLUP_RETENTION_DAYS", default=14)
 
 #se usa uvicorn y channels para usar asgi, y nuestra aplicacion sea mas rapida
 CHANNELS_LAYERS = {
     "default":{
         "BACKEND":"channels_redis.core.RedisChannelLayer",
         "CONFIG":{
-            "hosts":[env("REDIS_URL")]
+            "hosts":[REDIS_URL]
         }
     }
 }
@@ -202,13 +260,46 @@ CHANNELS_LAYERS = {
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": env("REDIS_URL"),
+        "LOCATION": REDIS_POOLS["cache"]["url"],
         "OPTIONS":{
-            "CLIENT_CLASS":"django_redis.client.DefaultClient"
+            "CLIENT_CLASS":"django_redis.client.DefaultClient",
+            #Mide los comandos del cache en Server-Timing (core/timing.py)
+            "REDIS_CLIENT_CLASS": "core.timing.TimedRedis",
+            "SOCKET_TIMEOUT": REDIS_POOLS["cache"]["socket_timeout"],
+            "SOCKET_CONNECT_TIMEOUT": REDIS_POOLS["cache"]["socket_connect_timeout"],
+            "CONNECTION_POOL_KWARGS": {
+                "max_connections": REDIS_POOLS["cache"]["max_connections"],
+                "socket_keepalive": REDIS_POOLS["cache"]["socket_keepalive"],
+                "health_check_interval": REDIS_POOLS["cache"]["health_check_interval"],
+            },
         }
     }
 }
 
+#Tiempo de vida de post_list, post_detail y category_list. Las entradas se invalidan
+#con señales cuando cambia un Post, Heading, Category o Media (apps/blog/caching.py)
+BLOG_CACHE_TIMEOUT = env.int("BLOG_CACHE_TIMEOUT", default=60 * 60 * 2)
+#Despues de este tiempo la entrada se recalcula en segundo plano por un solo worker,
+#mientras tanto se sigue sirviendo el valor anterior
+BLOG_CACHE_SOFT_TIMEOUT = env.int("BLOG_CACHE_SOFT_TIMEOUT", default=60 * 10)
+#Guardar cada pagina de post_list/category_list como el JSON ya renderizado,
+#comprimido con "zlib", "zstd" (requiere zstandard) o sin comprimir (None)
+BLOG_CACHE_RENDERED_JSON = env.bool("BLOG_CACHE_RENDERED_JSON", default=True)
+BLOG_CACHE_COMPRESSION = env("BLOG_CACHE_COMPRESSION", default="zlib")
+
+#Fraccion de los requests que se miden (core/timing.py): tiempo en la base de datos,
+#redis, serializers, firma de URLs y aciertos del cache, en el header Server-Timing
+#y en un log JSON por request. 0 lo desactiva
+PERF_SAMPLE_RATE = env.float("PERF_SAMPLE_RATE", default=0.01)
+#Enviar las metricas al cliente en el header Server-Timing (ademas del log)
+PERF_SERVER_TIMING_HEADER = env.bool("PERF_SERVER_TIMING_HEADER", default=True)
+
+#Configuracion de texto de PostgreSQL para search_vector ("simple", "spanish", ...).
+#Con otras bases de datos se usa un indice invertido en memoria que retorna como
+#maximo BLOG_SEARCH_MAX_RESULTS resultados ordenados por relevancia
+BLOG_SEARCH_CONFIG = env("BLOG_SEARCH_CONFIG", default="simple")
+BLOG_SEARCH_MAX_RESULTS = env.int("BLOG_SEARCH_MAX_RESULTS", default=500)
+
 CHANNELS_ALLOWED_ORIGINS = "http://localhost:3000"
 
 CELERY_ACCEPT_CONTENT = ["json"]
@@ -216,10 +307,15 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "America/Mexico_City"
 
-CELERY_BROKER_URL = env("REDIS_URL")
+CELERY_BROKER_URL = REDIS_POOLS["broker"]["url"]
+CELERY_BROKER_POOL_LIMIT = REDIS_POOLS["broker"]["max_connections"]
 CELERY_BROKER_TRANSPORT_OPTIONS = {
     'visibility_timeout': 3600,
-    'socket_timeout': 5,
+    'socket_timeout': REDIS_POOLS["broker"]["socket_timeout"],
+    'socket_connect_timeout': REDIS_POOLS["broker"]["socket_connect_timeout"],
+    'socket_keepalive': REDIS_POOLS["broker"]["socket_keepalive"],
+    'health_check_interval': REDIS_POOLS["broker"]["health_check_interval"],
+    'max_connections': REDIS_POOLS["broker"]["max_connections"],
     'retry_on_timeout': True
 }
 
@@ -232,12 +328,53 @@ CELERY_IMPORTS = (
 # para migrar las base de datos de celery beat, usar en una line de comandos bash:
 # python manage.py migrate django_celery_beat
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
-CELERY_BEAT_SCHEDULE = {}
+CELERY_BEAT_SCHEDULE = {
+    #Guardar en la base de datos los clicks acumulados en redis
+    "sync-clicks-to-db": {
+        "task": "apps.blog.tasks.sync_clicks_to_db",
+        "schedule": 60.0,
+    },
+    #Procesar por lotes las vistas de los posts guardadas en el stream de redis
+    "consume-post-view-events": {
+        "task": "apps.blog.tasks.consume_post_view_events",
+        "schedule": 5.0,
+    },
+    #Guardar en PostAnalytics.views los visitantes unicos de los HyperLogLog
+    "materialize-unique-views": {
+        "task": "apps.blog.tasks.materialize_unique_views",
+        "schedule": 60.0,
+    },
+    #Agregar a avg_time_on_page los tiempos en pagina de los beacons
+    "fold-dwell-times": {
+        "task": "apps.blog.tasks.fold_dwell_times",
+        "schedule": 60.0,
+    },
+    #Reconstruir los rankings de redis (most_viewed, trending) desde PostAnalytics
+    "reconcile-rankings": {
+        "task": "apps.blog.tasks.reconcile_rankings",
+        "schedule": 60.0 * 15,
+    },
+    #Borrar las vistas crudas y los rollups por hora antiguos
+    "prune-analytics": {
+        "task": "apps.blog.tasks.prune_analytics",
+        "schedule": 60.0 * 60 * 24,
+    },
+}
 
 #Configuraciones de Cloudfront
 AWS_CLOUDFRONT_DOMAIN=env("AWS_CLOUDFRONT_DOMAIN")
 AWS_CLOUDFRONT_KEY_ID=env.str("AWS_CLOUDFRONT_KEY_ID").strip()
 AWS_CLOUDFRONT_KEY=env.str("AWS_CLOUDFRONT_KEY", multiline=True).encode('ascii').strip()
+#Las URLs firmadas expiran al final de intervalos de MEDIA_URL_BUCKET segundos y se
+#reutilizan (LRU + cache) mientras les queden al menos MEDIA_URL_EXPIRES segundos
+MEDIA_URL_EXPIRES = env.int("MEDIA_URL_EXPIRES", default=60)
+MEDIA_URL_BUCKET = env.int("MEDIA_URL_BUCKET", default=600)
+#Con DEFAULT_FILE_STORAGE = "core.storage_backends.SignedCookieMediaStorage" las URLs
+#van sin firmar y cada cliente recibe cookies con una politica para todos los media,
+#firmada una vez cada MEDIA_COOKIE_BUCKET segundos y valida al menos MEDIA_COOKIE_EXPIRES
+MEDIA_COOKIE_EXPIRES = env.int("MEDIA_COOKIE_EXPIRES", default=60 * 60)
+MEDIA_COOKIE_BUCKET = env.int("MEDIA_COOKIE_BUCKET", default=60 * 60 * 6)
+MEDIA_COOKIE_DOMAIN = env("MEDIA_COOKIE_DOMAIN", default=None)
 
 #Configuraciones de AWS
 AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID")
@@ -1,11 +1,25 @@
 from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
 
+#cloudfront_access: como se entregan las URLs de los archivos por CloudFront
+# - "signed_url": una URL firmada por cada archivo (apps/media/signing.py)
+# - "signed_cookie": URLs sin firmar, el acceso se da con cookies que contienen una
+#   politica comodin firmada una vez por intervalo (apps/media/middleware.py)
+# - "public": URLs sin firmar y sin cookies
+
 class StaticStorage(S3Boto3Storage):
     location = "static"
     custom_domain = settings.AWS_S3_CUSTOM_DOMAIN
+    cloudfront_access = "public"
 
 class PublicMediaStorage(S3Boto3Storage):
     location = 'media' #Define la carpeta principal para los archivos de medios
     default_acl = 'public-read' #Permitir acceso publico a los archivos
-    file_overwrite = False #Evitar sobreescribir archivos con el mismo nombre
\ No newline at end of file
+    file_overwrite = False #Evitar sobreescribir archivos con el mismo nombre
+    cloudfront_access = "signed_url"
+
+class SignedCookieMediaStorage(S3Boto3Storage):
+    location = 'media'
+    default_acl = 'private' #Solo se accede por CloudFront con las cookies firmadas
+    file_overwrite = False
+    cloudfront_access = "signed_cookie"
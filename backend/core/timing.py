@@ -0,0 +1,203 @@
+"""Metricas de rendimiento por request: consultas a la base de datos, comandos de redis,
+aciertos/fallos del cache por prefijo de clave y tiempos de serializacion, firma de
+URLs y renderizado. Se miden solo los requests de la muestra (PERF_SAMPLE_RATE) y se
+envian en el header Server-Timing y en un log JSON por request.
+
+Fuera de un request de la muestra las funciones de este modulo no hacen nada"""
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+
+import redis
+import redis.asyncio
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_metrics = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        #nombre -> [milisegundos, cantidad]
+        self.timings = {}
+        #prefijo -> {"hit": n, "miss": n}
+        self.cache = {}
+
+    def add(self, name, seconds, count=1):
+        timing = self.timings.setdefault(name, [0.0, 0])
+        timing[0] += seconds * 1000
+        timing[1] += count
+
+    def server_timing(self, total):
+        items = [f'{name};dur={ms:.1f};desc="{count}"' for name, (ms, count) in self.timings.items()]
+        items += [f'cache_{prefix};desc="{counts["hit"]} hit, {counts["miss"]} miss"'
+                  for prefix, counts in self.cache.items()]
+        items.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(items)
+
+    def as_log(self, request, response, total):
+        return {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 2),
+            **{f"{name}_ms": round(ms, 2) for name, (ms, _) in self.timings.items()},
+            **{f"{name}_count": count for name, (_, count) in self.timings.items()},
+            "cache": self.cache,
+        }
+
+
+def record(name, seconds, count=1):
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.add(name, seconds, count)
+
+
+@contextmanager
+def timed(name):
+    """Suma el tiempo del bloque a la metrica name"""
+    metrics = _metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
+
+
+def cache_lookup(key, hit):
+    """Cuenta un acierto o fallo del cache con el prefijo de la clave (post_list,
+    post_detail, category_list...)"""
+    metrics = _metrics.get()
+    if metrics is not None:
+        counts = metrics.cache.setdefault(key.split(":", 1)[0], {"hit": 0, "miss": 0})
+        counts["hit" if hit else "miss"] += 1
+
+
+def _time_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record("db", time.perf_counter() - start)
+
+
+def _query_timers():
+    """Mide las consultas de las conexiones del hilo actual hasta cerrar el ExitStack.
+    Las conexiones son por hilo: se debe abrir y cerrar en el hilo de las consultas"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(_time_query))
+    return stack
+
+
+class TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        count = len(self.command_stack)
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            record("redis", time.perf_counter() - start, count)
+
+
+class TimedRedis(redis.StrictRedis):
+    """Cliente de redis que mide cada comando y cada pipeline (REDIS_CLIENT_CLASS de
+    django_redis y clientes de core/redis_pools.py)"""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            record("redis", time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class AsyncTimedPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        count = len(self.command_stack)
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            record("redis", time.perf_counter() - start, count)
+
+
+class AsyncTimedRedis(redis.asyncio.StrictRedis):
+    """TimedRedis para redis.asyncio (apps/blog/aio.py)"""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record("redis", time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncTimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class ServerTimingMiddleware:
+    """Mide una fraccion PERF_SAMPLE_RATE de los requests. Debe ser el primer middleware
+    para que total incluya a los demas"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        try:
+            with _query_timers():
+                response = self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        return self.report(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        #Las consultas corren en el hilo de sync_to_async del request (thread_sensitive)
+        timers = await sync_to_async(_query_timers)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(timers.close)()
+            _metrics.reset(token)
+        return self.report(request, response, metrics)
+
+    @staticmethod
+    def sampled():
+        rate = getattr(settings, "PERF_SAMPLE_RATE", 0)
+        return rate > 0 and random.random() < rate
+
+    @staticmethod
+    def report(request, response, metrics):
+        total = time.perf_counter() - metrics.start
+        if getattr(settings, "PERF_SERVER_TIMING_HEADER", True):
+            response["Server-Timing"] = metrics.server_timing(total)
+        logger.info(json.dumps(metrics.as_log(request, response, total)))
+        return response
@@ -19,8 +19,11 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from .views import RedisPoolStatsView
+
 urlpatterns = [
     path('api/blog/', include('apps.blog.urls')),
     path('api/media/', include('apps.media.urls')),
+    path('api/redis/pools/', RedisPoolStatsView.as_view()),
     path('admin/', admin.site.urls)
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) + static(settings.MEDIA_URL,document_root=settings.MEDIA_ROOT)
@@ -2,7 +2,18 @@
 ##Forma mas basica de crear un API
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework_api.views import StandardAPIView
+
+from .permissions import HasValidAPIKey
+from .redis_pools import pool_stats
 
 class TestView(APIView):
     def get(self,request,*args, **kwargs):
-        return Response("Hola Mundo")
\ No newline at end of file
+        return Response("Hola Mundo")
+
+class RedisPoolStatsView(StandardAPIView):
+    """Uso de los pools de redis (core/redis_pools.py) del proceso que responde"""
+    permission_classes = [HasValidAPIKey]
+
+    def get(self, request, *args, **kwargs):
+        return self.response(pool_stats())
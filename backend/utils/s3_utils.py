@@ -1,4 +1,5 @@
 import logging
+from functools import lru_cache
 
 from django.conf import settings
 import boto3
@@ -22,12 +23,17 @@ def generate_presigned_url(s3_client, client_method, method_parameters, expires_
         raise
     return url
 
-def rsa_signer(message):
-    private_key=serialization.load_pem_private_key(
-        settings.AWS_CLOUDFRONT_KEY,
+@lru_cache(maxsize=4)
+def load_private_key(pem):
+    #La llave se lee una sola vez por proceso (por cada PEM distinto)
+    return serialization.load_pem_private_key(
+        pem,
         password=None,
         backend=default_backend()
     )
+
+def rsa_signer(message):
+    private_key = load_private_key(settings.AWS_CLOUDFRONT_KEY)
     signature = private_key.sign(
         message,
         padding.PKCS1v15(),